@@ -1,6 +1,15 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
+from .importer import (DEFAULT_BATCH_SIZE, FORMATS, ImportFormatError, detect_format,
+                       store_upload)
 from .models import Location, City, Place, PlaceRating, PlaceComment, UserPlaceVisit
+from .search import PlaceSearchAdminMixin
+from .tasks import import_places
+from roadrunner.images import variant_url
 
 
 @admin.register(Location)
@@ -46,8 +55,25 @@ class UserPlaceVisitInline(admin.TabularInline):
     raw_id_fields = ('user',)
 
 
+class PlaceImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV or GeoJSON file of places')
+    format = forms.ChoiceField(choices=[('', 'Guess from extension')] + [(f, f) for f in FORMATS],
+                               required=False)
+    batch_size = forms.IntegerField(min_value=1, max_value=10000, initial=DEFAULT_BATCH_SIZE)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('file') and not cleaned_data.get('format'):
+            try:
+                cleaned_data['format'] = detect_format(cleaned_data['file'].name)
+            except ImportFormatError as error:
+                self.add_error('format', str(error))
+        return cleaned_data
+
+
 @admin.register(Place)
-class PlaceAdmin(admin.ModelAdmin):
+class PlaceAdmin(PlaceSearchAdminMixin, admin.ModelAdmin):
+    change_list_template = 'admin/city/place/change_list.html'
     list_display = ('name', 'city', 'price', 'average_rating', 'total_ratings',
                     'display_photo', 'created_at')
     list_filter = ('city', 'created_at')
@@ -77,18 +103,47 @@ class PlaceAdmin(admin.ModelAdmin):
 
     def display_photo(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" height="50"/>', obj.photo.url)
+            return format_html('<img src="{}" height="50"/>',
+                               variant_url(obj.photo, obj.photo_variants))
         return "No photo"
 
     display_photo.short_description = 'Photo'
 
     def display_photo_large(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" height="200"/>', obj.photo.url)
+            return format_html('<img src="{}" height="200"/>',
+                               variant_url(obj.photo, obj.photo_variants, 'large'))
         return "No photo"
 
     display_photo_large.short_description = 'Photo Preview'
 
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='city_place_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:city_place_changelist')
+
+        form = PlaceImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            file_path = store_upload(form.cleaned_data['file'])
+            import_places.delay(file_path, form.cleaned_data['format'],
+                                form.cleaned_data['batch_size'])
+            messages.success(request, f'Import of {file_path} started, '
+                                      f'rejected rows will be saved next to it.')
+            return redirect('admin:city_place_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import places',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/city/place/import_places.html', context)
+
 
 @admin.register(PlaceRating)
 class PlaceRatingAdmin(admin.ModelAdmin):
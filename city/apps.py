@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CityConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "city"
+
+    def ready(self):
+        import city.signals  # noqa: F401
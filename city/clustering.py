@@ -0,0 +1,204 @@
+"""
+Zoom-level marker clustering of places.
+
+For every city and zoom level up to ``CLUSTER_MAX_ZOOM`` places are grouped
+by a prefix of their location cell code (see city.spatial), which is a square
+grid of ``2 ** CELLS_PER_TILE_LOG2`` clusters per map tile side.
+``PlaceCluster`` rows keep running sums per group so clusters are updated
+incrementally when a place is created, moved, re-rated or deleted, and a
+viewport at any zoom level is answered from a handful of rows, merged over
+the cities the user can see.
+"""
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import (
+    BigIntegerField,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Q,
+    Sum,
+)
+from django.db.models.functions import Cast
+
+from city import spatial
+from city.models import Place, PlaceCluster
+
+CLUSTER_MAX_ZOOM = 16
+
+# 8x8 clusters per 256px tile, i.e. markers roughly 32px apart.
+CELLS_PER_TILE_LOG2 = 3
+
+BULK_BATCH_SIZE = 1000
+
+
+def _shift(zoom):
+    depth = min(zoom + CELLS_PER_TILE_LOG2, spatial.CELL_BITS)
+    return 2 * (spatial.CELL_BITS - depth)
+
+
+def cluster_key(cell, zoom):
+    """
+    Return the cluster a location cell belongs to at a zoom level
+    """
+    return cell >> _shift(zoom)
+
+
+def clusters_in_bbox(south, west, north, east, zoom, city_ids):
+    """
+    Return the clusters of a zoom level overlapping the bounding box, merged
+    over the cities, as dictionaries with the ``cell``, the number of
+    ``places``, their mean ``lat`` and ``lng`` and their ``average_rating``
+    """
+    zoom = min(zoom, CLUSTER_MAX_ZOOM)
+    if west > east:
+        boxes = [
+            (south, west, north, spatial.MAX_LNG),
+            (south, spatial.MIN_LNG, north, east),
+        ]
+    else:
+        boxes = [(south, west, north, east)]
+
+    shift = _shift(zoom)
+    cells = Q()
+    for box in boxes:
+        for low, high in spatial.cover(*box, zoom=zoom):
+            cells |= Q(cell__range=(low >> shift, high >> shift))
+
+    places = Sum("count")
+    return (
+        PlaceCluster.objects.filter(cells, city_id__in=city_ids, zoom=zoom)
+        .values("cell")
+        .annotate(
+            places=places,
+            lat=Sum("lat_sum") / Cast(places, FloatField()),
+            lng=Sum("lng_sum") / Cast(places, FloatField()),
+            average_rating=Sum("rating_sum") / Cast(places, FloatField()),
+        )
+        .filter(places__gt=0)
+        .order_by("cell")
+    )
+
+
+def _deltas(points, sign):
+    deltas = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    for city_id, cell, lat, lng, rating in points:
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            delta = deltas[(city_id, zoom, cluster_key(cell, zoom))]
+            delta[0] += sign
+            delta[1] += sign * lat
+            delta[2] += sign * lng
+            delta[3] += sign * rating
+    return deltas
+
+
+def _upsert_sql():
+    quote = connection.ops.quote_name
+    table = quote(PlaceCluster._meta.db_table)
+    sums = ["count", "lat_sum", "lng_sum", "rating_sum"]
+    keys = ["city_id", "zoom", "cell"]
+    columns = ", ".join(quote(column) for column in [*keys, *sums])
+    increments = ", ".join(
+        f"{quote(column)} = {table}.{quote(column)} + excluded.{quote(column)}"
+        for column in sums
+    )
+    return (
+        f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT ({', '.join(quote(key) for key in keys)}) "
+        f"DO UPDATE SET {increments}"
+    )
+
+
+def _apply(deltas):
+    # A single upsert adds the deltas to existing clusters and creates the
+    # missing ones, concurrent writers are serialized by the unique key.
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            _upsert_sql(),
+            [(*key, *delta) for key, delta in deltas.items()],
+        )
+
+    shrunk = defaultdict(list)
+    for (city_id, zoom, cell), delta in deltas.items():
+        if delta[0] < 0:
+            shrunk[(city_id, zoom)].append(cell)
+    for (city_id, zoom), cells in shrunk.items():
+        for start in range(0, len(cells), BULK_BATCH_SIZE):
+            PlaceCluster.objects.filter(
+                city_id=city_id,
+                zoom=zoom,
+                cell__in=cells[start : start + BULK_BATCH_SIZE],
+                count__lte=0,
+            ).delete()
+
+
+def apply_points(points, sign=1):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) places from their clusters.
+
+    ``points`` is an iterable of ``(city_id, cell, lat, lng, average_rating)``
+    tuples.
+    """
+    deltas = _deltas(points, sign)
+    if deltas:
+        with transaction.atomic():
+            _apply(deltas)
+
+
+def adjust_rating(city_id, cell, delta):
+    """
+    Shift the rating sums of every cluster of a city containing a location cell
+    """
+    if not delta:
+        return
+
+    keys = Q()
+    for zoom in range(CLUSTER_MAX_ZOOM + 1):
+        keys |= Q(zoom=zoom, cell=cluster_key(cell, zoom))
+    PlaceCluster.objects.filter(keys, city_id=city_id).update(
+        rating_sum=F("rating_sum") + delta
+    )
+
+
+def rebuild():
+    """
+    Recompute every cluster from the places table
+    """
+    with transaction.atomic():
+        PlaceCluster.objects.all().delete()
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            key = ExpressionWrapper(
+                F("location__cell") / (2 ** _shift(zoom)),
+                output_field=BigIntegerField(),
+            )
+            groups = (
+                Place.objects.annotate(key=key)
+                .values("city_id", "key")
+                .annotate(
+                    count=Count("id"),
+                    lat_sum=Sum("location__lat"),
+                    lng_sum=Sum("location__lng"),
+                    rating_sum=Sum("average_rating"),
+                )
+                .order_by()
+            )
+            batch = []
+            for group in groups.iterator(chunk_size=BULK_BATCH_SIZE):
+                batch.append(
+                    PlaceCluster(
+                        city_id=group["city_id"],
+                        zoom=zoom,
+                        cell=group["key"],
+                        count=group["count"],
+                        lat_sum=group["lat_sum"],
+                        lng_sum=group["lng_sum"],
+                        rating_sum=group["rating_sum"],
+                    )
+                )
+                if len(batch) == BULK_BATCH_SIZE:
+                    PlaceCluster.objects.bulk_create(batch)
+                    batch = []
+            PlaceCluster.objects.bulk_create(batch)
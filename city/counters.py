@@ -0,0 +1,66 @@
+"""
+Denormalized activity counters of places.
+
+``Place.total_visits`` and ``Place.total_comments`` count the visit and
+comment rows of a place. The receivers in city.signals adjust them whenever
+a row is created or deleted, cascades included. ``reconcile`` recounts the
+rows and repairs any drift.
+"""
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from city.models import Place, PlaceComment, UserPlaceVisit
+from roadrunner import counters
+
+COUNTERS = {
+    "total_visits": UserPlaceVisit,
+    "total_comments": PlaceComment,
+}
+
+
+def adjust(place_id, counter, delta):
+    """
+    Add ``delta`` to one counter of a place, never going below 0 when it has
+    drifted
+    """
+    Place.objects.filter(id=place_id).update(
+        **{counter: Greatest(F(counter) + delta, 0)}
+    )
+
+
+def _actual_counts():
+    counts = {}
+    for counter, model in COUNTERS.items():
+        rows = (
+            model.objects.filter(place=OuterRef("pk"))
+            .order_by()
+            .values("place")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        counts[counter] = Coalesce(Subquery(rows), 0)
+    return counts
+
+
+def _places(place_ids):
+    places = Place.objects.all()
+    if place_ids is not None:
+        places = places.filter(id__in=place_ids)
+    return places
+
+
+def find_drift(place_ids=None):
+    """
+    Return the places whose visit or comment counts are off
+    """
+    return counters.find_drift(_places(place_ids), _actual_counts()).only("id")
+
+
+def reconcile(place_ids=None):
+    """
+    Recount the visits and comments of drifted places.
+
+    Returns the number of repaired places.
+    """
+    return counters.reconcile(_places(place_ids).only("id"), _actual_counts())
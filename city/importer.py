@@ -0,0 +1,312 @@
+"""
+Streaming bulk import of places from CSV or GeoJSON files.
+
+Rows are read lazily and processed in fixed size batches, so memory stays
+constant whatever the size of the file. Every batch resolves its cities and
+canonical locations with one query each, creates the missing ones with
+``bulk_create`` and inserts its places with ``bulk_create`` inside a single
+transaction. Because ``bulk_create`` skips signals the importer updates the
+marker clusters, the search index and the cached city choices of each batch
+itself. Rejected rows are written to an error CSV together with the reason.
+
+CSV files need the columns ``name``, ``city``, ``lat`` and ``lng`` (or
+``latitude`` and ``longitude``) and may have ``description`` and ``price``.
+GeoJSON features need a Point geometry and the same keys in ``properties``.
+"""
+
+import csv
+import json
+from dataclasses import dataclass
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from city import clustering, search, services, spatial
+from city.models import City, Location, Place
+
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+UPLOAD_TO = "imports/places/"
+
+FORMATS = ("csv", "geojson")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    """
+    Guess the file format from its extension
+    """
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension in ("geojson", "json"):
+        return "geojson"
+    if extension == "csv":
+        return "csv"
+    raise ImportFormatError(f"Unsupported file type: {filename}")
+
+
+def store_upload(upload):
+    """
+    Save an uploaded file for a background import, returns its storage path
+    """
+    return default_storage.save(UPLOAD_TO + upload.name, upload)
+
+
+def read_csv(file):
+    """
+    Yield the rows of a CSV file as dictionaries
+    """
+    yield from csv.DictReader(file)
+
+
+class GeoJSONFeatureReader:
+    """
+    Incremental reader of the ``features`` array of a FeatureCollection.
+
+    Only one feature is decoded at a time, so huge collections can be read
+    with a small buffer. Other top level members are decoded and skipped.
+    """
+
+    def __init__(self, file, chunk_size=READ_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        self.expect("{")
+        while not self.consume("}"):
+            key = self.decode()
+            self.expect(":")
+            if key == "features":
+                yield from self.read_array()
+            else:
+                self.decode()
+            self.consume(",")
+
+    def read_array(self):
+        self.expect("[")
+        while not self.consume("]"):
+            yield self.decode()
+            self.consume(",")
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("utf-8")
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ImportFormatError("Unexpected end of GeoJSON file")
+
+    def consume(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ImportFormatError(f"Invalid GeoJSON, expected '{char}'")
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise ImportFormatError("Invalid GeoJSON value")
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def read_geojson(file):
+    """
+    Yield the features of a GeoJSON FeatureCollection as flat rows
+    """
+    for feature in GeoJSONFeatureReader(file):
+        row = dict(feature.get("properties") or {})
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Point":
+            row["lng"], row["lat"] = geometry["coordinates"][:2]
+        yield row
+
+
+READERS = {"csv": read_csv, "geojson": read_geojson}
+
+
+@dataclass
+class ImportResult:
+    processed: int = 0
+    imported: int = 0
+    rejected: int = 0
+
+
+class PlaceImporter:
+    """
+    Import rows of places in batches.
+
+    ``errors`` is an optional text file receiving the rejected rows and
+    ``progress`` an optional callable receiving the ImportResult after every
+    batch.
+    """
+
+    error_columns = ["row", "error", "data"]
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, errors=None, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.error_writer = None
+        if errors is not None:
+            self.error_writer = csv.writer(errors)
+            self.error_writer.writerow(self.error_columns)
+        self.cities = {}
+        self.result = ImportResult()
+
+    def import_file(self, file, file_format):
+        return self.run(READERS[file_format](file))
+
+    def run(self, rows):
+        rows = enumerate(rows, start=1)
+        while batch := list(islice(rows, self.batch_size)):
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(self.result)
+        return self.result
+
+    def reject(self, number, row, error):
+        self.result.rejected += 1
+        if self.error_writer:
+            self.error_writer.writerow([number, error, json.dumps(row, default=str)])
+
+    def clean(self, row):
+        """
+        Validate a raw row, returns the Place field values and coordinates
+        """
+        values = {}
+        for field_name in ("name", "description", "price"):
+            field = Place._meta.get_field(field_name)
+            value = row.get(field_name)
+            if value in (None, "") and field_name == "price":
+                value = 0
+            values[field_name] = field.clean(value if value is not None else "", None)
+
+        city = str(row.get("city") or "").strip()
+        if not city:
+            raise ValidationError("City is required")
+
+        try:
+            lat = float(row.get("lat", row.get("latitude")))
+            lng = float(row.get("lng", row.get("longitude")))
+        except (TypeError, ValueError):
+            raise ValidationError("Invalid coordinates")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValidationError("Coordinates out of range")
+
+        return values, city, (lat, lng)
+
+    def resolve_cities(self, names):
+        missing = names - self.cities.keys()
+        if not missing:
+            return
+
+        for city in City.objects.filter(name__in=missing).order_by("-id"):
+            self.cities[city.name] = city
+        created = City.objects.bulk_create(
+            City(name=name) for name in missing - self.cities.keys()
+        )
+        for city in created:
+            self.cities[city.name] = city
+
+    def find_locations(self, keys):
+        candidates = Location.objects.filter(
+            lat_key__in={lat_key for lat_key, _ in keys},
+            lng_key__in={lng_key for _, lng_key in keys},
+        ).only("id", "lat", "lng", "cell", "lat_key", "lng_key")
+        return {
+            (location.lat_key, location.lng_key): location
+            for location in candidates
+            if (location.lat_key, location.lng_key) in keys
+        }
+
+    def resolve_locations(self, coordinates):
+        """
+        Map the coordinate keys of a batch to their canonical locations,
+        creating the missing ones
+        """
+        wanted = {spatial.coordinate_key(*point): point for point in coordinates}
+        locations = self.find_locations(wanted.keys())
+
+        missing = []
+        for key in wanted.keys() - locations.keys():
+            lat, lng = wanted[key]
+            location = Location(lat=lat, lng=lng)
+            location.sync_coordinates()
+            missing.append(location)
+        if missing:
+            # Keys created meanwhile by a concurrent import are reused
+            Location.objects.bulk_create(missing, ignore_conflicts=True)
+            locations.update(self.find_locations(wanted.keys() - locations.keys()))
+        return locations
+
+    def import_batch(self, batch):
+        cleaned = []
+        for number, row in batch:
+            try:
+                cleaned.append(self.clean(row))
+            except ValidationError as error:
+                self.reject(number, row, "; ".join(error.messages))
+        self.result.processed += len(batch)
+        if not cleaned:
+            return
+
+        with transaction.atomic():
+            self.resolve_cities({city for _, city, _ in cleaned})
+            locations = self.resolve_locations({point for _, _, point in cleaned})
+            places = Place.objects.bulk_create(
+                Place(
+                    city=self.cities[city],
+                    location=locations[spatial.coordinate_key(*point)],
+                    **values,
+                )
+                for values, city, point in cleaned
+            )
+            clustering.apply_points(
+                [
+                    (
+                        place.city_id,
+                        place.location.cell,
+                        place.location.lat,
+                        place.location.lng,
+                        0.0,
+                    )
+                    for place in places
+                ]
+            )
+            search.index_places(places)
+        services.invalidate_city_followers({place.city_id for place in places})
+        self.result.imported += len(places)
@@ -0,0 +1,128 @@
+"""
+Maintenance of canonical locations.
+
+Every ``Location`` is identified by its quantized coordinate key (see
+spatial.coordinate_key) which is unique, so creating locations through
+``Location.objects.resolve`` never duplicates them. Keys only go stale when
+coordinates are written without ``Location.save``, e.g. by a queryset
+``update()``; ``canonicalize`` finds those rows, re-keys them and merges them
+into the location already owning their key, moving their places between
+marker clusters.
+"""
+
+from django.db import transaction
+
+from city import clustering
+from city.models import Location, Place
+
+CHUNK_SIZE = 1000
+
+
+def merge(canonical, duplicate_ids):
+    """
+    Repoint the places of the duplicate locations to ``canonical``, move them
+    between clusters accordingly and delete the duplicates.
+
+    Returns the number of moved places.
+    """
+    places = list(
+        Place.objects.filter(location_id__in=duplicate_ids).select_related("location")
+    )
+
+    with transaction.atomic():
+        clustering.apply_points(
+            [
+                (
+                    place.city_id,
+                    place.location.cell,
+                    place.location.lat,
+                    place.location.lng,
+                    place.average_rating,
+                )
+                for place in places
+            ],
+            sign=-1,
+        )
+        clustering.apply_points(
+            [
+                (
+                    place.city_id,
+                    canonical.cell,
+                    canonical.lat,
+                    canonical.lng,
+                    place.average_rating,
+                )
+                for place in places
+            ]
+        )
+        Place.objects.filter(location_id__in=duplicate_ids).update(location=canonical)
+        Location.objects.filter(id__in=duplicate_ids).delete()
+    return len(places)
+
+
+def rekey(location, stored_cell):
+    """
+    Store the synced keys of a location and move its places from the clusters
+    of its stored cell to the ones of its new cell
+    """
+    places = list(
+        Place.objects.filter(location_id=location.id).values_list(
+            "city_id", "average_rating"
+        )
+    )
+
+    with transaction.atomic():
+        if location.cell != stored_cell:
+            for cell, sign in [(stored_cell, -1), (location.cell, 1)]:
+                clustering.apply_points(
+                    [
+                        (city_id, cell, location.lat, location.lng, rating)
+                        for city_id, rating in places
+                    ],
+                    sign=sign,
+                )
+        Location.objects.filter(id=location.id).update(
+            cell=location.cell,
+            lat_key=location.lat_key,
+            lng_key=location.lng_key,
+        )
+
+
+def canonicalize():
+    """
+    Re-key locations whose coordinates changed behind their back, merging
+    them into the location owning the new key.
+
+    Returns the numbers of re-keyed and merged locations.
+    """
+    rekeyed = merged = 0
+    last_id = 0
+    while True:
+        chunk = list(
+            Location.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "lat", "lng", "cell", "lat_key", "lng_key")[:CHUNK_SIZE]
+        )
+        if not chunk:
+            return rekeyed, merged
+        last_id = chunk[-1].id
+
+        for location in chunk:
+            stored = (location.cell, location.lat_key, location.lng_key)
+            location.sync_coordinates()
+            if stored == (location.cell, location.lat_key, location.lng_key):
+                continue
+
+            canonical = (
+                Location.objects.filter(
+                    lat_key=location.lat_key, lng_key=location.lng_key
+                )
+                .exclude(id=location.id)
+                .first()
+            )
+            if canonical is None:
+                rekey(location, stored[0])
+                rekeyed += 1
+            else:
+                merge(canonical, [location.id])
+                merged += 1
@@ -0,0 +1,120 @@
+import random
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand
+
+from city import spatial
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark viewport queries over synthetic locations using the spatial "
+        "cell index versus a plain lat/lng range scan. Runs on a scratch "
+        "in-memory SQLite database, the project database is not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1_000_000)
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument(
+            "--span",
+            type=float,
+            default=0.05,
+            help="Viewport height/width in degrees (0.05 is roughly zoom 14)",
+        )
+        parser.add_argument(
+            "--centers",
+            type=int,
+            default=1,
+            help="Number of cities the locations are clustered around",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        # Points are clustered around "cities" like real POIs, with the default
+        # of one center this is a single very large city.
+        centers = [
+            (rng.uniform(-60, 70), rng.uniform(-180, 180))
+            for _ in range(options["centers"])
+        ]
+        db = sqlite3.connect(":memory:")
+        db.execute(
+            "CREATE TABLE location "
+            "(id INTEGER PRIMARY KEY, lat REAL, lng REAL, cell INTEGER)"
+        )
+
+        self.stdout.write(f"Generating {options['count']:,} locations...")
+        started = time.perf_counter()
+        db.executemany(
+            "INSERT INTO location (lat, lng, cell) VALUES (?, ?, ?)",
+            self.generate_locations(rng, centers, options["count"]),
+        )
+        db.execute("CREATE INDEX location_cell ON location (cell)")
+        db.execute("CREATE INDEX location_lat ON location (lat)")
+        db.commit()
+        self.stdout.write(f"  loaded in {time.perf_counter() - started:.1f}s")
+
+        boxes = [
+            self.random_box(rng, centers, options["span"])
+            for _ in range(options["queries"])
+        ]
+
+        cell_ms, cell_rows = self.run_cell_queries(db, boxes)
+        lat_ms, lat_rows = self.run_range_scan(db, boxes, "INDEXED BY location_lat")
+        scan_ms, scan_rows = self.run_range_scan(db, boxes, "NOT INDEXED")
+
+        if not cell_rows == lat_rows == scan_rows:
+            self.stderr.write(
+                self.style.ERROR(
+                    f"Result mismatch: cell index {cell_rows}, "
+                    f"lat index {lat_rows}, full scan {scan_rows}"
+                )
+            )
+            return
+
+        queries = len(boxes)
+        self.stdout.write(f"{queries} viewports, {cell_rows / queries:.1f} hits each")
+        self.stdout.write(f"  cell index: {cell_ms / queries:.3f} ms/query")
+        self.stdout.write(f"  lat index : {lat_ms / queries:.3f} ms/query")
+        self.stdout.write(f"  full scan : {scan_ms / queries:.3f} ms/query")
+
+    def generate_locations(self, rng, centers, count):
+        for _ in range(count):
+            lat, lng = rng.choice(centers)
+            lat = max(-90.0, min(90.0, rng.gauss(lat, 0.3)))
+            lng = max(-180.0, min(180.0, rng.gauss(lng, 0.3)))
+            yield lat, lng, spatial.encode(lat, lng)
+
+    def random_box(self, rng, centers, span):
+        # Users look at the map where the places are, not at empty ocean.
+        lat, lng = rng.choice(centers)
+        south = max(-90.0, min(90.0 - span, rng.gauss(lat, 0.2) - span / 2))
+        west = max(-180.0, min(180.0 - span, rng.gauss(lng, 0.2) - span / 2))
+        return south, west, south + span, west + span
+
+    def run_cell_queries(self, db, boxes):
+        rows = 0
+        started = time.perf_counter()
+        for south, west, north, east in boxes:
+            ranges = spatial.cover(south, west, north, east)
+            where = " OR ".join("cell BETWEEN ? AND ?" for _ in ranges)
+            params = [bound for cell_range in ranges for bound in cell_range]
+            rows += db.execute(
+                "SELECT COUNT(*) FROM location INDEXED BY location_cell "
+                f"WHERE ({where}) AND lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?",
+                [*params, south, north, west, east],
+            ).fetchone()[0]
+        return (time.perf_counter() - started) * 1000, rows
+
+    def run_range_scan(self, db, boxes, index_hint):
+        rows = 0
+        started = time.perf_counter()
+        for south, west, north, east in boxes:
+            rows += db.execute(
+                f"SELECT COUNT(*) FROM location {index_hint} "
+                "WHERE lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?",
+                [south, north, west, east],
+            ).fetchone()[0]
+        return (time.perf_counter() - started) * 1000, rows
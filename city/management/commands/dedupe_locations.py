@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from city import locations
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-key locations whose coordinates were changed without saving them "
+        "and merge the resulting duplicates, repointing their places"
+    )
+
+    def handle(self, *args, **options):
+        rekeyed, merged = locations.canonicalize()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-keyed {rekeyed} locations, merged {merged} duplicates"
+            )
+        )
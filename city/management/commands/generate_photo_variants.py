@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+
+from city.models import Place
+from city.tasks import generate_place_photo_variants
+from roadrunner.images import refresh_variants
+from user.models import User
+from user.tasks import generate_profile_photo_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the thumbnail and WebP variants of existing place and profile "
+        "photos that do not have them yet"
+    )
+
+    targets = [
+        (Place, "photo", "photo_variants", generate_place_photo_variants),
+        (
+            User,
+            "profile_photo",
+            "profile_photo_variants",
+            generate_profile_photo_variants,
+        ),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate the variants of every photo",
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="Queue Celery tasks instead of generating the variants here",
+        )
+
+    def handle(self, *args, **options):
+        for model, image_field, variants_field, task in self.targets:
+            instances = model.objects.exclude(**{image_field: ""}).exclude(
+                **{f"{image_field}__isnull": True}
+            )
+            if not options["all"]:
+                instances = instances.filter(**{variants_field: {}})
+            instances = instances.only("pk", image_field, variants_field)
+
+            done = failed = 0
+            for instance in instances.iterator():
+                if options["queue"]:
+                    task.delay(instance.pk)
+                    done += 1
+                    continue
+                try:
+                    refresh_variants(instance, image_field, variants_field)
+                    done += 1
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {instance.pk}: {error}")
+
+            action = "Queued" if options["queue"] else "Generated"
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{action} variants of {done} {model._meta.verbose_name_plural}"
+                    + (f", {failed} failed" if failed else "")
+                )
+            )
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from city.importer import (
+    DEFAULT_BATCH_SIZE,
+    FORMATS,
+    ImportFormatError,
+    PlaceImporter,
+    detect_format,
+)
+
+
+class Command(BaseCommand):
+    help = "Import places in bulk from a CSV or GeoJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or GeoJSON file to import")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="File format, guessed from the extension by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Number of rows inserted per transaction",
+        )
+        parser.add_argument(
+            "--errors",
+            help="CSV file receiving the rejected rows, <path>.errors.csv by default",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        errors_path = options["errors"] or f"{path}.errors.csv"
+        try:
+            file_format = options["format"] or detect_format(path)
+            with (
+                open(path, encoding="utf-8-sig", newline="") as file,
+                open(errors_path, "w", encoding="utf-8", newline="") as errors,
+            ):
+                importer = PlaceImporter(
+                    batch_size=options["batch_size"],
+                    errors=errors,
+                    progress=self.report_progress,
+                )
+                result = importer.import_file(file, file_format)
+        except (ImportFormatError, OSError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.imported} places, rejected {result.rejected}"
+            )
+        )
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f"Rejected rows: {errors_path}"))
+
+    def report_progress(self, result):
+        self.stdout.write(
+            f"{result.processed} rows processed, {result.imported} imported, "
+            f"{result.rejected} rejected"
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from city import clustering
+from city.models import PlaceCluster
+
+
+class Command(BaseCommand):
+    help = "Recompute the zoom-level marker clusters of all places from scratch"
+
+    def handle(self, *args, **options):
+        clustering.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {PlaceCluster.objects.count()} clusters "
+                f"for zoom levels 0-{clustering.CLUSTER_MAX_ZOOM}"
+            )
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from city import search
+
+
+class Command(BaseCommand):
+    help = "Re-index the names and descriptions of all places for full-text search"
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Full-text search is only available on SQLite")
+
+        indexed = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} places"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from city import counters, ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify the running rating aggregates and activity counters of places "
+        "against their rows and repair any drift"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drifted places, do not repair them",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            self.report(ratings.find_drift().count(), "ratings")
+            self.report(counters.find_drift().count(), "visit or comment counters")
+            return
+
+        repaired = ratings.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Repaired ratings of {repaired} places"))
+        repaired = counters.reconcile()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Repaired visit and comment counters of {repaired} places"
+            )
+        )
+
+    def report(self, drifted, stats):
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(style(f"{drifted} places with drifted {stats}"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+from city import spatial
+
+
+def backfill_cells(apps, schema_editor):
+    Location = apps.get_model("city", "Location")
+    batch = []
+    for location in Location.objects.only("id", "lat", "lng").iterator(chunk_size=1000):
+        location.cell = spatial.encode(location.lat, location.lng)
+        batch.append(location)
+        if len(batch) == 1000:
+            Location.objects.bulk_update(batch, ["cell"])
+            batch = []
+    Location.objects.bulk_update(batch, ["cell"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0004_remove_place_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="cell",
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:37
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from city.clustering import CLUSTER_MAX_ZOOM, cluster_key
+
+
+def build_clusters(apps, schema_editor):
+    Place = apps.get_model("city", "Place")
+    PlaceCluster = apps.get_model("city", "PlaceCluster")
+
+    sums = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    places = Place.objects.values_list(
+        "location__cell", "location__lat", "location__lng", "average_rating"
+    )
+    for cell, lat, lng, rating in places.iterator():
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            cluster = sums[(zoom, cluster_key(cell, zoom))]
+            cluster[0] += 1
+            cluster[1] += lat
+            cluster[2] += lng
+            cluster[3] += rating
+
+    PlaceCluster.objects.bulk_create(
+        [
+            PlaceCluster(
+                zoom=zoom,
+                cell=cell,
+                count=count,
+                lat_sum=lat_sum,
+                lng_sum=lng_sum,
+                rating_sum=rating_sum,
+            )
+            for (zoom, cell), (count, lat_sum, lng_sum, rating_sum) in sums.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0005_location_cell"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaceCluster",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.PositiveSmallIntegerField()),
+                ("cell", models.BigIntegerField()),
+                ("count", models.IntegerField(default=0)),
+                ("lat_sum", models.FloatField(default=0.0)),
+                ("lng_sum", models.FloatField(default=0.0)),
+                ("rating_sum", models.FloatField(default=0.0)),
+            ],
+            options={
+                "unique_together": {("zoom", "cell")},
+            },
+        ),
+        migrations.RunPython(build_clusters, migrations.RunPython.noop),
+    ]
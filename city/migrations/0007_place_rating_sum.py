@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:39
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_sums(apps, schema_editor):
+    Place = apps.get_model("city", "Place")
+    PlaceRating = apps.get_model("city", "PlaceRating")
+
+    totals = (
+        PlaceRating.objects.values("place")
+        .annotate(rating_sum=Sum("rating"), total_ratings=Count("id"))
+        .order_by()
+    )
+    for total in totals.iterator():
+        Place.objects.filter(id=total["place"]).update(
+            rating_sum=total["rating_sum"],
+            total_ratings=total["total_ratings"],
+            average_rating=total["rating_sum"] / total["total_ratings"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0006_placecluster"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="place",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sums, migrations.RunPython.noop),
+    ]
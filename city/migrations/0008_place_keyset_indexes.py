@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0007_place_rating_sum"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["city", "name", "id"], name="place_city_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["city", "price", "id"], name="place_city_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["city", "average_rating", "id"], name="place_city_rating_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["city", "created_at", "id"], name="place_city_created_idx"
+            ),
+        ),
+    ]
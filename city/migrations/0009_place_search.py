@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:02
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE city_place_fts USING fts5("
+        "name, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', "
+        "prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO city_place_fts (rowid, name, description) "
+        "SELECT id, name, description FROM city_place"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute("DROP TABLE IF EXISTS city_place_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0008_place_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
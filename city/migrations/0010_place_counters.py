@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Place = apps.get_model("city", "Place")
+
+    for counter, model_name in [
+        ("total_comments", "PlaceComment"),
+        ("total_visits", "UserPlaceVisit"),
+    ]:
+        model = apps.get_model("city", model_name)
+        totals = model.objects.values("place").annotate(total=Count("id")).order_by()
+        for total in totals.iterator():
+            Place.objects.filter(id=total["place"]).update(**{counter: total["total"]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0009_place_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="place",
+            name="total_comments",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="place",
+            name="total_visits",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
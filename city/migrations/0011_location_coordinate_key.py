@@ -0,0 +1,76 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from city.spatial import coordinate_key
+
+BATCH_SIZE = 1000
+
+
+def merge_duplicate_locations(apps, schema_editor):
+    Location = apps.get_model("city", "Location")
+    Place = apps.get_model("city", "Place")
+
+    batch = []
+    for location in Location.objects.only("id", "lat", "lng").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        location.lat_key, location.lng_key = coordinate_key(location.lat, location.lng)
+        batch.append(location)
+        if len(batch) == BATCH_SIZE:
+            Location.objects.bulk_update(batch, ["lat_key", "lng_key"])
+            batch = []
+    Location.objects.bulk_update(batch, ["lat_key", "lng_key"])
+
+    duplicates = (
+        Location.objects.values("lat_key", "lng_key")
+        .annotate(canonical=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for duplicate in list(duplicates):
+        others = Location.objects.filter(
+            lat_key=duplicate["lat_key"], lng_key=duplicate["lng_key"]
+        ).exclude(id=duplicate["canonical"])
+        Place.objects.filter(location__in=others).update(
+            location_id=duplicate["canonical"]
+        )
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0010_place_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="lat_key",
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="lng_key",
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(merge_duplicate_locations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="location",
+            name="lat_key",
+            field=models.IntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name="location",
+            name="lng_key",
+            field=models.IntegerField(editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name="location",
+            constraint=models.UniqueConstraint(
+                fields=("lat_key", "lng_key"), name="location_coordinate_key"
+            ),
+        ),
+    ]
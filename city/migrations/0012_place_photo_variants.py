@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0011_location_coordinate_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="place",
+            name="photo_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:10
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# city.clustering as of this migration, copied so later changes to it don't
+# change what the migration builds
+CLUSTER_MAX_ZOOM = 16
+CELLS_PER_TILE_LOG2 = 3
+CELL_BITS = 26
+
+
+def cluster_key(cell, zoom):
+    depth = min(zoom + CELLS_PER_TILE_LOG2, CELL_BITS)
+    return cell >> 2 * (CELL_BITS - depth)
+
+
+def clear_clusters(apps, schema_editor):
+    apps.get_model("city", "PlaceCluster").objects.all().delete()
+
+
+def _build(apps, per_city):
+    Place = apps.get_model("city", "Place")
+    PlaceCluster = apps.get_model("city", "PlaceCluster")
+
+    sums = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    places = Place.objects.values_list(
+        "city_id", "location__cell", "location__lat", "location__lng", "average_rating"
+    )
+    for city_id, cell, lat, lng, rating in places.iterator():
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            key = (city_id if per_city else None, zoom, cluster_key(cell, zoom))
+            cluster = sums[key]
+            cluster[0] += 1
+            cluster[1] += lat
+            cluster[2] += lng
+            cluster[3] += rating
+
+    PlaceCluster.objects.bulk_create(
+        [
+            PlaceCluster(
+                zoom=zoom,
+                cell=cell,
+                count=count,
+                lat_sum=lat_sum,
+                lng_sum=lng_sum,
+                rating_sum=rating_sum,
+                **({"city_id": city_id} if per_city else {}),
+            )
+            for (city_id, zoom, cell), (
+                count,
+                lat_sum,
+                lng_sum,
+                rating_sum,
+            ) in sums.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def build_clusters(apps, schema_editor):
+    _build(apps, per_city=True)
+
+
+def build_global_clusters(apps, schema_editor):
+    _build(apps, per_city=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0012_place_photo_variants"),
+    ]
+
+    operations = [
+        # The global clusters are rebuilt per city below
+        migrations.RunPython(clear_clusters, build_global_clusters),
+        migrations.AlterUniqueTogether(
+            name="placecluster",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="placecluster",
+            name="city",
+            field=models.ForeignKey(
+                default=None,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="clusters",
+                to="city.city",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name="placecluster",
+            unique_together={("city", "zoom", "cell")},
+        ),
+        migrations.RunPython(build_clusters, clear_clusters),
+    ]
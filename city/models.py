@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.core.validators import (
     FileExtensionValidator,
     MaxValueValidator,
@@ -5,16 +6,81 @@ from django.core.validators import (
 )
 from django.db import models
 
+from city import spatial
 from roadrunner import settings
+from roadrunner.models import TrackedModel
 
 
-class Location(models.Model):
+class LocationManager(models.Manager):
+    def resolve(self, lat, lng):
+        """
+        Return the canonical location of a coordinate, creating it if needed.
+        Coordinates with the same quantized key share one location.
+        """
+        lat_key, lng_key = spatial.coordinate_key(lat, lng)
+        location, created = self.get_or_create(
+            lat_key=lat_key,
+            lng_key=lng_key,
+            defaults={"lat": float(lat), "lng": float(lng)},
+        )
+        return location
+
+
+class Location(TrackedModel):
     lat = models.FloatField()
     lng = models.FloatField()
+    # Z-order cell code of (lat, lng), see city.spatial
+    cell = models.BigIntegerField(default=0, db_index=True, editable=False)
+    # Quantized coordinates identifying the location, see spatial.coordinate_key
+    lat_key = models.IntegerField(editable=False)
+    lng_key = models.IntegerField(editable=False)
+
+    objects = LocationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["lat_key", "lng_key"], name="location_coordinate_key"
+            )
+        ]
 
     def __str__(self):
         return f"{self.lat}, {self.lng}"
 
+    def sync_coordinates(self):
+        """
+        Derive the spatial cell and the coordinate key from lat/lng
+        """
+        self.cell = spatial.encode(self.lat, self.lng)
+        self.lat_key, self.lng_key = spatial.coordinate_key(self.lat, self.lng)
+
+    def clean(self):
+        """
+        Reject coordinates whose key belongs to another location, which would
+        otherwise fail on the unique constraint when saving
+        """
+        self.sync_coordinates()
+        owner = (
+            Location.objects.filter(lat_key=self.lat_key, lng_key=self.lng_key)
+            .exclude(pk=self.pk)
+            .first()
+        )
+        if owner is not None:
+            raise ValidationError(
+                f"These coordinates are the same location as {owner} "
+                f"(#{owner.pk}), move its places there instead."
+            )
+
+    def save(self, *args, **kwargs):
+        """
+        Override save to keep the derived coordinate fields in sync
+        """
+        self.sync_coordinates()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"lat", "lng"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "cell", "lat_key", "lng_key"}
+        super().save(*args, **kwargs)
+
 
 class City(models.Model):
     name = models.CharField(max_length=100)
@@ -23,7 +89,7 @@ class City(models.Model):
         return self.name
 
 
-class Place(models.Model):
+class Place(TrackedModel):
     """
     Represents a place with detailed information and user interactions
     """
@@ -43,32 +109,87 @@ class Place(models.Model):
         blank=True,
         validators=[FileExtensionValidator(["jpg", "jpeg", "png", "gif"])],
     )
+    # Resized copies of the photo, see roadrunner.images
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
-    # Aggregated Rating Fields
+    # Aggregated Rating Fields, maintained by city.ratings
+    rating_sum = models.PositiveIntegerField(default=0)
     total_ratings = models.PositiveIntegerField(default=0)
     average_rating = models.FloatField(
         default=0.0, validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
 
+    # Activity Counters, maintained by city.counters
+    total_visits = models.PositiveIntegerField(default=0)
+    total_comments = models.PositiveIntegerField(default=0)
+
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    AGGREGATE_FIELDS = {
+        "rating_sum",
+        "total_ratings",
+        "average_rating",
+        "total_visits",
+        "total_comments",
+    }
+    # Written by background tasks only
+    GENERATED_FIELDS = {"photo_variants"}
+    # A stale instance never overwrites them
+    PROTECTED_FIELDS = AGGREGATE_FIELDS | GENERATED_FIELDS
+
+    class Meta:
+        # Keyset pagination of city listings, one per ordering of ListPlacesView
+        indexes = [
+            models.Index(fields=["city", "name", "id"], name="place_city_name_idx"),
+            models.Index(fields=["city", "price", "id"], name="place_city_price_idx"),
+            models.Index(
+                fields=["city", "average_rating", "id"], name="place_city_rating_idx"
+            ),
+            models.Index(
+                fields=["city", "created_at", "id"], name="place_city_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
-    def update_rating(self):
-        """
-        Recalculate average rating based on all place ratings
-        """
-        ratings = self.ratings.all()
-        if ratings:
-            self.total_ratings = ratings.count()
-            self.average_rating = ratings.aggregate(models.Avg("rating"))["rating__avg"]
-            self.save()
+
+class PlaceCluster(models.Model):
+    """
+    Precomputed marker cluster of places for one map zoom level
+    """
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="clusters")
+    zoom = models.PositiveSmallIntegerField()
+    # Location cell prefix at the cluster depth of this zoom, see city.clustering
+    cell = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0.0)
+    lng_sum = models.FloatField(default=0.0)
+    rating_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ["city", "zoom", "cell"]
+
+    def __str__(self):
+        return f"{self.count} places of {self.city_id} at zoom {self.zoom}"
+
+    @property
+    def lat(self):
+        return self.lat_sum / self.count
+
+    @property
+    def lng(self):
+        return self.lng_sum / self.count
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.count
 
 
-class PlaceRating(models.Model):
+class PlaceRating(TrackedModel):
     """
     Represents a user's rating for a specific place
     """
@@ -86,13 +207,6 @@ class PlaceRating(models.Model):
         unique_together = ["user", "place"]
         ordering = ["-created_at"]
 
-    def save(self, *args, **kwargs):
-        """
-        Override save to update place's average rating
-        """
-        super().save(*args, **kwargs)
-        self.place.update_rating()
-
 
 class PlaceComment(models.Model):
     """
@@ -0,0 +1,149 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row of the previous page on
+    ``(<ordering field>, id)`` instead of using OFFSET, so every page costs
+    the same as the first one when an index on those columns exists.
+
+    The ordering is taken from the ``ordering`` query parameter and must be
+    one of the view's ``ordering_fields``, optionally prefixed with ``-``.
+    Search results annotated with a ``search_rank`` default to rank order.
+
+    Responses are ``{"next": <url or None>, "results": [...]}``, paginated
+    views no longer return a bare list.
+    """
+
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    ordering_param = "ordering"
+    default_ordering = "-created_at"
+    rank_ordering = "search_rank"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field_name = self.ordering.lstrip("-")
+        self.descending = self.ordering.startswith("-")
+        self.field = self.get_field(queryset.model, self.field_name)
+        page_size = self.get_page_size(request)
+
+        tiebreaker = "-id" if self.descending else "id"
+        queryset = queryset.order_by(self.ordering, tiebreaker)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek(*cursor))
+
+        rows = list(queryset[: page_size + 1])
+        self.page = rows[:page_size]
+        self.has_next = len(rows) > page_size
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        allowed = getattr(view, "ordering_fields", None) or []
+        ordering = request.query_params.get(self.ordering_param, "").strip()
+        if ordering.lstrip("-") in allowed:
+            return ordering
+        if self.rank_ordering in queryset.query.annotations:
+            return self.rank_ordering
+        return getattr(view, "default_ordering", self.default_ordering)
+
+    def get_field(self, model, field_name):
+        try:
+            return model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            return None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def seek(self, value, pk):
+        """
+        Rows after ``(value, pk)`` in the current ordering. The leading
+        inclusive bound lets the database start an index range scan.
+        """
+        name = self.field_name
+        if self.descending:
+            return Q(**{f"{name}__lte": value}) & (
+                Q(**{f"{name}__lt": value}) | Q(id__lt=pk)
+            )
+        return Q(**{f"{name}__gte": value}) & (
+            Q(**{f"{name}__gt": value}) | Q(id__gt=pk)
+        )
+
+    def encode_value(self, obj):
+        if self.field is None:
+            return getattr(obj, self.field_name)
+        return self.field.value_to_string(obj)
+
+    def decode_value(self, value):
+        if self.field is None:
+            return value
+        return self.field.to_python(value)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            if cursor["ordering"] != self.ordering:
+                raise ValueError("Cursor belongs to another ordering")
+            return self.decode_value(cursor["value"]), int(cursor["id"])
+        except (
+            binascii.Error,
+            KeyError,
+            TypeError,
+            UnicodeError,
+            ValueError,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        cursor = {
+            "ordering": self.ordering,
+            "value": self.encode_value(obj),
+            "id": obj.pk,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
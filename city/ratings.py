@@ -0,0 +1,129 @@
+"""
+Incremental rating aggregation for places.
+
+``Place`` keeps a running ``rating_sum`` and ``total_ratings``, so writing a
+rating costs the same however many ratings the place has. ``average_rating``
+is derived from the new sum and count in the statement applying a change,
+and the change of the average is passed on to the place's marker clusters.
+``reconcile`` recomputes the aggregates from the ratings table and repairs
+any drift.
+"""
+
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from city import clustering
+from city.models import Place, PlaceRating
+from roadrunner import counters
+
+
+def _average(rating_sum, total_ratings):
+    return rating_sum / total_ratings if total_ratings > 0 else 0.0
+
+
+def apply_rating_change(place_id, sum_delta, count_delta):
+    """
+    Fold a rating change into the place aggregates.
+
+    Creating a rating is ``(rating, 1)``, changing it is ``(new - old, 0)`` and
+    deleting it is ``(-rating, -1)``.
+    """
+    # Drifted aggregates are kept from going below 0, reconcile repairs them
+    new_sum = Greatest(F("rating_sum") + sum_delta, 0)
+    new_count = Greatest(F("total_ratings") + count_delta, 0)
+
+    with transaction.atomic():
+        # The clamped aggregates don't tell the previous average, so it is
+        # read with the row locked
+        place = (
+            Place.objects.select_for_update(of=("self",))
+            .filter(id=place_id)
+            .values_list("average_rating", "city_id", "location__cell")
+            .first()
+        )
+        if place is None:
+            # The place is being deleted together with its ratings.
+            return
+        old_average, city_id, cell = place
+
+        Place.objects.filter(id=place_id).update(
+            rating_sum=new_sum,
+            total_ratings=new_count,
+            average_rating=Case(
+                When(total_ratings__lte=-count_delta, then=Value(0.0)),
+                default=Cast(new_sum, FloatField()) / new_count,
+                output_field=FloatField(),
+            ),
+        )
+        average_rating = (
+            Place.objects.filter(id=place_id)
+            .values_list("average_rating", flat=True)
+            .get()
+        )
+        clustering.adjust_rating(city_id, cell, average_rating - old_average)
+
+
+def _actual_aggregates():
+    ratings = (
+        PlaceRating.objects.filter(place=OuterRef("pk")).order_by().values("place")
+    )
+    return {
+        "rating_sum": Coalesce(
+            Subquery(ratings.annotate(total=Sum("rating")).values("total")), 0
+        ),
+        "total_ratings": Coalesce(
+            Subquery(ratings.annotate(total=Count("id")).values("total")), 0
+        ),
+    }
+
+
+def _places(place_ids):
+    places = Place.objects.all()
+    if place_ids is not None:
+        places = places.filter(id__in=place_ids)
+    return places
+
+
+def _repair_average(place, aggregates):
+    """
+    Derive the average of the repaired aggregates and move the place's
+    clusters by its change
+    """
+    average_rating = _average(aggregates["rating_sum"], aggregates["total_ratings"])
+    clustering.adjust_rating(
+        place.city_id, place.location.cell, average_rating - place.average_rating
+    )
+    return {"average_rating": average_rating}
+
+
+def find_drift(place_ids=None):
+    """
+    Return the places whose stored aggregates disagree with their ratings
+    """
+    return counters.find_drift(_places(place_ids), _actual_aggregates()).only(
+        "id", "rating_sum", "total_ratings", "average_rating"
+    )
+
+
+def reconcile(place_ids=None):
+    """
+    Recompute the aggregates of drifted places from their ratings.
+
+    Returns the number of repaired places.
+    """
+    return counters.reconcile(
+        _places(place_ids).select_related("location"),
+        _actual_aggregates(),
+        derive=_repair_average,
+    )
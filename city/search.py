@@ -0,0 +1,145 @@
+"""
+Full-text search over place names and descriptions.
+
+On SQLite places are mirrored into the ``city_place_fts`` FTS5 table (created
+by migration 0009) which is kept in sync by the signals in city.signals.
+Queries are tokenized into prefix terms and ranked with BM25, names weighing
+more than descriptions. Other database backends fall back to the regular
+``icontains`` search of DRF and the admin.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+FTS_TABLE = "city_place_fts"
+
+# BM25 column weights for (name, description)
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == "sqlite"
+
+
+def match_expression(search_term):
+    """
+    Turn free text into an FTS5 query where every word is a prefix term,
+    e.g. ``old tbil`` becomes ``"old"* "tbil"*``
+    """
+    tokens = TOKEN_RE.findall(search_term)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def matching_ids(expression):
+    """
+    Subquery of the ids of the places matching an FTS5 expression
+    """
+    return RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]
+    )
+
+
+def search(queryset, search_term):
+    """
+    Filter a place queryset to the search hits, annotated with their BM25
+    ``search_rank`` (lower is better).
+
+    The hits are filtered together with the rest of the queryset, e.g. by
+    city, and only the remaining rows are ranked.
+    """
+    expression = match_expression(search_term)
+    if not expression:
+        return queryset.none()
+
+    quote = connection.ops.quote_name
+    place_id = f"{quote(queryset.model._meta.db_table)}.{quote('id')}"
+    rank = RawSQL(
+        f"SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = {place_id}",
+        [NAME_WEIGHT, DESCRIPTION_WEIGHT, expression],
+        output_field=FloatField(),
+    )
+    return queryset.filter(id__in=matching_ids(expression)).annotate(search_rank=rank)
+
+
+def index_places(places):
+    """
+    Add or refresh places in the search index
+    """
+    if not is_available():
+        return
+
+    rows = [(place.id, place.name, place.description) for place in places]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows]
+        )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+            rows,
+        )
+
+
+def remove_places(place_ids):
+    """
+    Drop places from the search index
+    """
+    if not is_available():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [(place_id,) for place_id in place_ids],
+        )
+
+
+def rebuild():
+    """
+    Re-index every place, returns the number of indexed places
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            "SELECT id, name, description FROM city_place"
+        )
+        return cursor.rowcount
+
+
+class PlaceSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter answering ``?search=`` from the full-text index when the
+    database supports it
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_term = request.query_params.get(self.search_param, "").strip()
+        if not search_term or not is_available():
+            return super().filter_queryset(request, queryset, view)
+        return search(queryset, search_term)
+
+
+class PlaceSearchAdminMixin:
+    """
+    ModelAdmin mixin searching places through the full-text index, related
+    ``search_fields`` such as the city name are still matched as usual
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not is_available():
+            return super().get_search_results(request, queryset, search_term)
+
+        expression = match_expression(search_term)
+        hits = Q(id__in=matching_ids(expression) if expression else [])
+        for field in self.search_fields:
+            if "__" in field:
+                hits |= Q(**{f"{field}__icontains": search_term})
+        return queryset.filter(hits), False
@@ -1,8 +1,24 @@
 from django.core.validators import FileExtensionValidator
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
-from city.models import City, Location, Place, PlaceComment, PlaceRating, UserPlaceVisit
+from city.importer import (
+    DEFAULT_BATCH_SIZE,
+    FORMATS,
+    ImportFormatError,
+    detect_format,
+)
+from city.models import (
+    City,
+    Location,
+    Place,
+    PlaceComment,
+    PlaceRating,
+    UserPlaceVisit,
+)
+from roadrunner.images import ImageVariantsField
+from roadrunner.serializers import SparseFieldsetMixin
 
 
 class CreatePlaceSerializer(serializers.ModelSerializer):
@@ -13,6 +29,7 @@ class CreatePlaceSerializer(serializers.ModelSerializer):
         required=False,
         validators=[FileExtensionValidator(["jpg", "jpeg", "png", "gif"])],
     )
+    photo_variants = ImageVariantsField()
 
     class Meta:
         model = Place
@@ -25,6 +42,7 @@ class CreatePlaceSerializer(serializers.ModelSerializer):
             "location_details",
             "price",
             "photo",
+            "photo_variants",
             "created_at",
             "updated_at",
         ]
@@ -55,7 +73,7 @@ class CreatePlaceSerializer(serializers.ModelSerializer):
         }
 
 
-class PlaceSerializer(serializers.ModelSerializer):
+class PlaceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for Place model with comprehensive field handling
     """
@@ -70,9 +88,10 @@ class PlaceSerializer(serializers.ModelSerializer):
         required=False,
         validators=[FileExtensionValidator(["jpg", "jpeg", "png", "gif"])],
     )
+    photo_variants = ImageVariantsField()
 
     user_visited = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    comments_count = serializers.IntegerField(source="total_comments", read_only=True)
 
     class Meta:
         model = Place
@@ -85,6 +104,7 @@ class PlaceSerializer(serializers.ModelSerializer):
             "location_details",
             "price",
             "photo",
+            "photo_variants",
             "average_rating",
             "total_ratings",
             "user_visited",
@@ -100,10 +120,30 @@ class PlaceSerializer(serializers.ModelSerializer):
             "location",
         ]
 
+    @staticmethod
+    def annotate_queryset(queryset, user):
+        """
+        Compute per-row values of list responses in the base query instead of
+        running extra queries for every place. A correlated subquery is used
+        rather than a join so no GROUP BY stops the database from walking an
+        index in order and stopping at the page size.
+        """
+        queryset = queryset.select_related("city", "location")
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            user_visited=Exists(
+                UserPlaceVisit.objects.filter(user=user, place=OuterRef("pk"))
+            )
+        )
+
     def get_user_visited(self, obj):
         """
         Check if the current user has visited this place
         """
+        if hasattr(obj, "user_visited"):
+            return obj.user_visited
+
         user = self.context.get("request").user
         if not user.is_authenticated:
             return False
@@ -135,12 +175,6 @@ class PlaceSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-    def get_comments_count(self, obj):
-        """
-        Get the total number of comments for this place
-        """
-        return obj.comments.count()
-
     def get_location_details(self, obj):
         """
         Retrieve additional location information
@@ -151,7 +185,68 @@ class PlaceSerializer(serializers.ModelSerializer):
         }
 
 
-class CitySerializer(serializers.ModelSerializer):
+class BoundingBoxSerializer(serializers.Serializer):
+    """
+    Validates viewport query parameters sent by the map
+    """
+
+    south = serializers.FloatField(min_value=-90, max_value=90)
+    west = serializers.FloatField(min_value=-180, max_value=180)
+    north = serializers.FloatField(min_value=-90, max_value=90)
+    east = serializers.FloatField(min_value=-180, max_value=180)
+    zoom = serializers.IntegerField(min_value=0, max_value=22, required=False)
+    city = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        """
+        Check that south is below north.
+        """
+        if data["south"] > data["north"]:
+            raise serializers.ValidationError(
+                {"north": "North must be greater than south."}
+            )
+        return data
+
+
+class ClusterBoundingBoxSerializer(BoundingBoxSerializer):
+    zoom = serializers.IntegerField(min_value=0, max_value=22)
+
+
+class PlaceClusterSerializer(serializers.Serializer):
+    """
+    A cluster merged over cities, see clustering.clusters_in_bbox
+    """
+
+    lat = serializers.FloatField(read_only=True)
+    lng = serializers.FloatField(read_only=True)
+    count = serializers.IntegerField(source="places", read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+
+
+class PlaceImportSerializer(serializers.Serializer):
+    """
+    Validates a bulk upload of places
+    """
+
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=FORMATS, required=False)
+    batch_size = serializers.IntegerField(
+        min_value=1, max_value=10000, default=DEFAULT_BATCH_SIZE
+    )
+
+    def validate(self, data):
+        """
+        Guess the format from the file name when it is not given.
+        """
+        if "format" not in data:
+            try:
+                data["format"] = detect_format(data["file"].name)
+            except ImportFormatError as error:
+                raise serializers.ValidationError({"format": str(error)})
+        return data
+
+
+class CitySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     places_count = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -0,0 +1,98 @@
+"""
+City and place operations shared by the API views and the map frontend,
+which calls them in-process instead of going through the HTTP API.
+
+The city choices of every user are cached. They are invalidated by the
+receivers in map.signals when the user's cities change or places are added
+to or removed from them, and by the bulk importer.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from city.models import City, Location
+
+PLACE_REQUIRED_FIELDS = ["name", "price"]
+
+CITY_CHOICES_KEY = "city_choices_{user_id}"
+CITY_CHOICES_TIMEOUT = 60 * 60
+
+
+def user_cities(user_id):
+    """
+    Cities of a user annotated with their number of places
+    """
+    return City.objects.filter(user=user_id).annotate(places_count=Count("places"))
+
+
+def city_choices(user_id):
+    """
+    ``(id, label)`` choices of the cities of a user, cached
+    """
+    key = CITY_CHOICES_KEY.format(user_id=user_id)
+    choices = cache.get(key)
+    if choices is None:
+        choices = [
+            (city.id, f"{city.name} ({city.places_count} places)")
+            for city in user_cities(user_id).order_by("name")
+        ]
+        cache.set(key, choices, CITY_CHOICES_TIMEOUT)
+    return choices
+
+
+def invalidate_city_choices(user_ids):
+    cache.delete_many(
+        [CITY_CHOICES_KEY.format(user_id=user_id) for user_id in user_ids]
+    )
+
+
+def city_followers(city_ids):
+    """
+    Ids of the users having any of the cities
+    """
+    return set(
+        City.user_set.through.objects.filter(city_id__in=city_ids).values_list(
+            "user_id", flat=True
+        )
+    )
+
+
+def invalidate_city_followers(city_ids):
+    """
+    Invalidate the city choices of every user having one of the cities
+    """
+    invalidate_city_choices(city_followers(city_ids))
+
+
+def create_place(data, context=None):
+    """
+    Validate and create a place from request data with a ``city`` id and
+    ``latitude`` and ``longitude`` coordinates.
+
+    Returns a tuple of (place, errors), exactly one of them being None.
+    """
+    for field in PLACE_REQUIRED_FIELDS:
+        if data.get(field) in (None, ""):
+            return None, {"error": f"{field} is required"}
+
+    try:
+        city = City.objects.get(id=data.get("city"))
+    except (City.DoesNotExist, ValueError, TypeError):
+        return None, {"error": "City not found"}
+
+    try:
+        latitude = float(data.get("latitude"))
+        longitude = float(data.get("longitude"))
+    except (TypeError, ValueError):
+        return None, {"error": "Valid latitude and longitude are required"}
+
+    # Imported here as city.serializers depends on the importer, which uses
+    # this module
+    from city.serializers import CreatePlaceSerializer
+
+    serializer = CreatePlaceSerializer(data=data, context=context or {})
+    if not serializer.is_valid():
+        return None, serializer.errors
+
+    location = Location.objects.resolve(latitude, longitude)
+    return serializer.save(city=city, location=location), None
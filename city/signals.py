@@ -0,0 +1,193 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from city import clustering, counters, ratings, search
+from city.models import Location, Place, PlaceComment, PlaceRating, UserPlaceVisit
+from city.tasks import generate_place_photo_variants
+from roadrunner import images
+
+
+def _cluster_point(place, location=None, city_id=None):
+    location = location or place.location
+    return (
+        city_id or place.city_id,
+        location.cell,
+        location.lat,
+        location.lng,
+        place.average_rating,
+    )
+
+
+@receiver(post_save, sender=Place)
+def update_place_clusters(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep the zoom-level clusters in sync when a place is created, moved or
+    moved to another city, rating changes are applied by city.ratings
+    """
+    if raw:
+        return
+
+    loaded = getattr(instance, "_loaded_values", {})
+    old_location_id = loaded.get("location_id", instance.location_id)
+    old_city_id = loaded.get("city_id", instance.city_id)
+    if created:
+        clustering.apply_points([_cluster_point(instance)])
+    elif (old_location_id, old_city_id) != (instance.location_id, instance.city_id):
+        old_location = Location.objects.get(id=old_location_id)
+        instance.refresh_from_db(fields=["average_rating"])
+        clustering.apply_points(
+            [_cluster_point(instance, old_location, old_city_id)], sign=-1
+        )
+        clustering.apply_points([_cluster_point(instance)])
+
+    instance._loaded_values = {
+        **loaded,
+        "location_id": instance.location_id,
+        "city_id": instance.city_id,
+    }
+
+
+@receiver(post_save, sender=Place)
+def update_place_search(sender, instance, created, raw=False, **kwargs):
+    """
+    Re-index a place when it is created or its searchable text changes
+    """
+    if raw:
+        return
+
+    loaded = getattr(instance, "_loaded_values", {})
+    searchable = {"name": instance.name, "description": instance.description}
+    if created or any(
+        loaded.get(field, value) != value for field, value in searchable.items()
+    ):
+        search.index_places([instance])
+
+    instance._loaded_values = {**loaded, **searchable}
+
+
+@receiver(post_save, sender=Place)
+def refresh_place_photo_variants(sender, instance, raw=False, **kwargs):
+    """
+    Queue the variants of a new or replaced place photo
+    """
+    if not raw:
+        images.image_saved(
+            instance, "photo", "photo_variants", generate_place_photo_variants
+        )
+
+
+@receiver(post_save, sender=Location)
+def move_location_clusters(sender, instance, created, raw=False, **kwargs):
+    """
+    Move the places of a location between clusters when its coordinates change
+    """
+    loaded = getattr(instance, "_loaded_values", {})
+    if raw or created or not {"lat", "lng", "cell"} <= loaded.keys():
+        return
+
+    old_location = Location(lat=loaded["lat"], lng=loaded["lng"], cell=loaded["cell"])
+    if (old_location.lat, old_location.lng) != (instance.lat, instance.lng):
+        places = list(instance.places.only("id", "city_id", "average_rating"))
+        clustering.apply_points(
+            [_cluster_point(place, old_location) for place in places], sign=-1
+        )
+        clustering.apply_points([_cluster_point(place, instance) for place in places])
+
+    instance._loaded_values = {
+        **loaded,
+        "lat": instance.lat,
+        "lng": instance.lng,
+        "cell": instance.cell,
+    }
+
+
+@receiver(post_delete, sender=Place)
+def remove_place_from_clusters(sender, instance, **kwargs):
+    """
+    Remove a deleted place from its clusters.
+
+    Its ratings were deleted first by the cascade, and each one already took
+    its share out of the clusters' rating sums, so the place leaves them with
+    a rating of zero. The instance's own average may be stale.
+    """
+    location = instance.location
+    clustering.apply_points(
+        [(instance.city_id, location.cell, location.lat, location.lng, 0)], sign=-1
+    )
+
+
+@receiver(post_delete, sender=Place)
+def remove_place_from_search(sender, instance, **kwargs):
+    """
+    Drop a deleted place from the search index
+    """
+    search.remove_places([instance.id])
+
+
+@receiver(post_delete, sender=Place)
+def delete_place_photo_variants(sender, instance, **kwargs):
+    """
+    Remove the variants of a deleted place's photo
+    """
+    images.delete_variants(instance.photo_variants)
+
+
+@receiver(post_save, sender=PlaceRating)
+def add_rating_to_place(sender, instance, created, raw=False, **kwargs):
+    """
+    Fold a new or changed rating into the place's running aggregates
+    """
+    if raw:
+        return
+
+    loaded = getattr(instance, "_loaded_values", {})
+    if created:
+        ratings.apply_rating_change(instance.place_id, instance.rating, 1)
+    elif "rating" in loaded and loaded["rating"] != instance.rating:
+        ratings.apply_rating_change(
+            instance.place_id, instance.rating - loaded["rating"], 0
+        )
+
+    instance._loaded_values = {**loaded, "rating": instance.rating}
+
+
+@receiver(post_delete, sender=PlaceRating)
+def remove_rating_from_place(sender, instance, **kwargs):
+    """
+    Take a deleted rating out of the place's running aggregates
+    """
+    ratings.apply_rating_change(instance.place_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=PlaceComment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    """
+    Count a new comment on its place
+    """
+    if created and not raw:
+        counters.adjust(instance.place_id, "total_comments", 1)
+
+
+@receiver(post_delete, sender=PlaceComment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    """
+    Take a deleted comment off its place's counter
+    """
+    counters.adjust(instance.place_id, "total_comments", -1)
+
+
+@receiver(post_save, sender=UserPlaceVisit)
+def count_new_visit(sender, instance, created, raw=False, **kwargs):
+    """
+    Count a new visit of a place
+    """
+    if created and not raw:
+        counters.adjust(instance.place_id, "total_visits", 1)
+
+
+@receiver(post_delete, sender=UserPlaceVisit)
+def uncount_deleted_visit(sender, instance, **kwargs):
+    """
+    Take a deleted visit off its place's counter
+    """
+    counters.adjust(instance.place_id, "total_visits", -1)
@@ -0,0 +1,155 @@
+"""
+Spatial indexing helpers for locations.
+
+Every ``Location`` stores a Z-order (Morton) cell code: latitude and longitude
+are quantized to ``CELL_BITS`` bits each and their bits are interleaved, so
+points that are close on the map are usually close in the integer key space.
+A plain B-tree index over that column is then enough to answer viewport
+queries: a bounding box is decomposed into a small number of contiguous code
+ranges, each one a cheap index range scan, and only the few false positives
+on the edges of the box are removed with an exact ``lat``/``lng`` check.
+"""
+
+import math
+
+from django.db.models import Q
+
+CELL_BITS = 26
+CELL_SPAN = 1 << CELL_BITS
+
+# A Leaflet tile at zoom ``z`` spans 2 ** -z of the world width, covering a
+# viewport with cells a quarter of a tile wide keeps the over-scan small.
+CELLS_PER_TILE_LOG2 = 2
+
+# Upper bound on the number of code ranges a single query is split into.
+MAX_COVER_RANGES = 64
+
+# Canonical coordinate keys are micro-degrees, roughly 11cm at the equator.
+COORDINATE_KEY_SCALE = 10**6
+
+MIN_LAT, MAX_LAT = -90.0, 90.0
+MIN_LNG, MAX_LNG = -180.0, 180.0
+
+
+def _quantize(value, low, high):
+    scaled = int((value - low) / (high - low) * CELL_SPAN)
+    return min(max(scaled, 0), CELL_SPAN - 1)
+
+
+def _spread(value):
+    """
+    Spread the lower ``CELL_BITS`` bits of ``value`` so that a zero bit
+    separates each of them
+    """
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+
+def encode(lat, lng):
+    """
+    Return the Z-order cell code for a coordinate pair
+    """
+    x = _quantize(float(lng), MIN_LNG, MAX_LNG)
+    y = _quantize(float(lat), MIN_LAT, MAX_LAT)
+    return _spread(x) | (_spread(y) << 1)
+
+
+def coordinate_key(lat, lng):
+    """
+    Quantize coordinates to the integer key identifying a canonical location
+    """
+    return (
+        round(float(lat) * COORDINATE_KEY_SCALE),
+        round(float(lng) * COORDINATE_KEY_SCALE),
+    )
+
+
+def _depth_for_box(x0, y0, x1, y1):
+    span = max(x1 - x0, y1 - y0) + 1
+    return max(0, CELL_BITS - math.ceil(math.log2(span)) + CELLS_PER_TILE_LOG2)
+
+
+def _cover_box(x0, y0, x1, y1, depth):
+    ranges = []
+
+    def visit(level, cx, cy, prefix):
+        shift = CELL_BITS - level
+        nx0, ny0 = cx << shift, cy << shift
+        nx1, ny1 = nx0 + (1 << shift) - 1, ny0 + (1 << shift) - 1
+
+        if nx1 < x0 or nx0 > x1 or ny1 < y0 or ny0 > y1:
+            return
+
+        inside = x0 <= nx0 and nx1 <= x1 and y0 <= ny0 and ny1 <= y1
+        if inside or level == depth:
+            low = prefix << (2 * shift)
+            high = ((prefix + 1) << (2 * shift)) - 1
+            if ranges and ranges[-1][1] + 1 == low:
+                ranges[-1] = (ranges[-1][0], high)
+            else:
+                ranges.append((low, high))
+            return
+
+        # Children are visited in Z-order so the ranges come out sorted.
+        for quadrant in range(4):
+            dx, dy = quadrant & 1, quadrant >> 1
+            visit(level + 1, (cx << 1) | dx, (cy << 1) | dy, (prefix << 2) | quadrant)
+
+    visit(0, 0, 0, 0)
+    return ranges
+
+
+def cover(south, west, north, east, zoom=None):
+    """
+    Decompose a bounding box into sorted, inclusive ``(low, high)`` cell code
+    ranges that together contain every point inside the box.
+
+    The box must not cross the antimeridian, see ``bbox_filter`` for that.
+    """
+    x0 = _quantize(west, MIN_LNG, MAX_LNG)
+    x1 = _quantize(east, MIN_LNG, MAX_LNG)
+    y0 = _quantize(south, MIN_LAT, MAX_LAT)
+    y1 = _quantize(north, MIN_LAT, MAX_LAT)
+
+    # The zoom only ever makes the cells coarser, cells finer than the box
+    # needs would multiply the work by four with every zoom level
+    depth = _depth_for_box(x0, y0, x1, y1)
+    if zoom is not None:
+        depth = min(depth, zoom + CELLS_PER_TILE_LOG2)
+    depth = min(depth, CELL_BITS)
+
+    ranges = _cover_box(x0, y0, x1, y1, depth)
+    while len(ranges) > MAX_COVER_RANGES and depth > 0:
+        depth -= 1
+        ranges = _cover_box(x0, y0, x1, y1, depth)
+    return ranges
+
+
+def bbox_filter(south, west, north, east, zoom=None, prefix=""):
+    """
+    Build a ``Q`` object selecting locations inside the bounding box.
+
+    ``prefix`` points at the location relation of the queried model, e.g.
+    ``"location__"`` when filtering places.
+    """
+    if west > east:
+        # The viewport crosses the antimeridian, split it in two.
+        return bbox_filter(south, west, north, MAX_LNG, zoom, prefix) | bbox_filter(
+            south, MIN_LNG, north, east, zoom, prefix
+        )
+
+    cells = Q()
+    for low, high in cover(south, west, north, east, zoom):
+        cells |= Q(**{f"{prefix}cell__range": (low, high)})
+
+    return cells & Q(
+        **{
+            f"{prefix}lat__gte": south,
+            f"{prefix}lat__lte": north,
+            f"{prefix}lng__gte": west,
+            f"{prefix}lng__lte": east,
+        }
+    )
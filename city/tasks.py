@@ -1,9 +1,33 @@
+import io
+import math
+import tempfile
+from dataclasses import asdict
+from itertools import islice
+
 from celery import shared_task
-from django.conf import settings
-from django.core.mail import send_mail
-from twilio.rest import Client
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from city.importer import DEFAULT_BATCH_SIZE, PlaceImporter
+from city.models import Place, PlaceComment
+from roadrunner.images import refresh_variants
+from roadrunner.mail import BatchEmailSender
+from roadrunner.sms import SMSDispatcher
+from user import notifications
+from user.models import User
+
+NOTIFICATION_BATCH_SIZE = 1000
+
+# Followers notified by one task, larger audiences are split into subtasks
+FANOUT_CHUNK_SIZE = 5000
 
-from user.models import Notification, User
+EMAIL_BATCH_SIZE = 500
+EMAIL_MAX_RETRIES = 3
+# Seconds before the first retry of failed emails, doubled on every attempt
+EMAIL_RETRY_BACKOFF = 60
+
+SMS_MAX_RETRIES = 3
+SMS_RETRY_BACKOFF = 30
 
 
 @shared_task
@@ -13,42 +37,186 @@ def send_notification_email(
     """
     Send an email notification to the creator of the place when someone comments on it.
     """
-    subject = f"New comment on your place: {place_name}"
-    message = f"""
-    Hi,
-
-    {commenter_name} commented on your place "{place_name}":
-
-    "{comment_text}"
+    send_templated_email(
+        "city/email/new_comment",
+        [{"email": place_creator_email}],
+        {
+            "commenter_name": commenter_name,
+            "comment_text": comment_text,
+            "place_name": place_name,
+        },
+    )
 
-    Check it out on the platform!
 
-    Regards,
-    Your Platform Team
+@shared_task(name="city.tasks.send_templated_email")
+def send_templated_email(template_prefix, recipients, context=None, attempt=0):
     """
-    from_email = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [place_creator_email]
+    Send a templated email to many recipients in batches, see roadrunner.mail.
 
-    # Send the email
-    send_mail(subject, message, from_email, recipient_list)
+    ``recipients`` are dictionaries with an ``email`` and an optional
+    personal ``context``. Only the recipients whose message failed are
+    retried, after an exponential backoff. Returns the number of failures.
+    """
+    sender = BatchEmailSender(batch_size=EMAIL_BATCH_SIZE)
+    sender.add_templated(template_prefix, recipients, context)
+    failed = {message.to[0] for message in sender.send()}
+    if failed and attempt < EMAIL_MAX_RETRIES:
+        send_templated_email.apply_async(
+            (
+                template_prefix,
+                [recipient for recipient in recipients if recipient["email"] in failed],
+                context,
+                attempt + 1,
+            ),
+            countdown=EMAIL_RETRY_BACKOFF * 2**attempt,
+        )
+    return len(failed)
 
 
 @shared_task
 def send_sms_notification(phone_number, message):
-    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-    client.messages.create(
-        body=message, from_=settings.TWILIO_PHONE_NUMBER, to=phone_number
+    send_sms_batch([(phone_number, message)])
+
+
+@shared_task(name="city.tasks.send_sms_batch")
+def send_sms_batch(messages, attempt=0):
+    """
+    Send ``(phone number, text)`` pairs through the rate-limited dispatcher,
+    see roadrunner.sms.
+
+    Messages the rate limit has no room for are re-queued for when it has,
+    messages failing with a retryable error are retried after an
+    exponential backoff.
+    """
+    result = SMSDispatcher().dispatch([tuple(message) for message in messages])
+    if result.deferred:
+        send_sms_batch.apply_async(
+            (result.deferred, attempt), countdown=math.ceil(result.retry_after)
+        )
+    if result.failed and attempt < SMS_MAX_RETRIES:
+        send_sms_batch.apply_async(
+            (result.failed, attempt + 1), countdown=SMS_RETRY_BACKOFF * 2**attempt
+        )
+    return result.sent
+
+
+def _city_followers(city_id):
+    """
+    Ids of the users following a city, in id order
+    """
+    return (
+        User.cities.through.objects.filter(city_id=city_id)
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+    )
+
+
+def _notify(comment, user_ids):
+    place = comment.place
+    notifications.notify_place_event(
+        user_ids,
+        sender_id=comment.user_id,
+        place_id=place.id,
+        message=(
+            f"{comment.user_id} commented on your place '{place.name}': "
+            f"{comment.text}"
+        ),
+        digest_message=f"{{count}} new comments on your place '{place.name}'",
+        occurred_at=comment.created_at,
     )
 
 
+def _comment(comment_id):
+    return PlaceComment.objects.select_related("place").filter(id=comment_id).first()
+
+
 @shared_task(name="city.tasks.create_comment_notification")
-def create_comment_notification(recipients, sender_id, place_name, comment_text):
-    message = f"{sender_id} commented on your place '{place_name}': {comment_text}"
-    recipients = User.objects.filter(id__in=recipients)
-    sender = User.objects.get(id=sender_id)
-    notifications = [
-        Notification(recipient=recipient, sender=sender, message=message)
-        for recipient in recipients
-    ]
-
-    Notification.objects.bulk_create(notifications)
+def create_comment_notification(comment_id=None, **legacy):
+    """
+    Notify the followers of the city of a commented place, coalesced per
+    place with their recent notifications, see user.notifications.
+
+    Follower ids are streamed in id order. Every full chunk of
+    ``FANOUT_CHUNK_SIZE`` followers is handed to a parallel subtask as a user
+    id range, the remaining ones are notified here.
+
+    Tasks queued by the previous release pass ``recipients``, ``sender_id``,
+    ``place_name`` and ``comment_text`` instead of a comment id, they are
+    still delivered as they were. Remove them in the next release.
+    """
+    if comment_id is None:
+        return _notify_legacy(**legacy)
+
+    comment = _comment(comment_id)
+    if comment is None:
+        return 0
+
+    followers = _city_followers(comment.place.city_id).iterator(
+        chunk_size=NOTIFICATION_BATCH_SIZE
+    )
+    subtasks = 0
+    while chunk := list(islice(followers, FANOUT_CHUNK_SIZE)):
+        if len(chunk) < FANOUT_CHUNK_SIZE:
+            _notify(comment, chunk)
+            break
+        deliver_comment_notifications.delay(comment_id, chunk[0], chunk[-1])
+        subtasks += 1
+    return subtasks
+
+
+def _notify_legacy(recipients, sender_id, place_name, comment_text):
+    notifications.notify(
+        User.objects.filter(id__in=recipients).values_list("id", flat=True),
+        sender_id,
+        f"{sender_id} commented on your place '{place_name}': {comment_text}",
+    )
+    return 0
+
+
+@shared_task(name="city.tasks.deliver_comment_notifications")
+def deliver_comment_notifications(comment_id, first_user_id, last_user_id):
+    """
+    Notify the followers of a commented place's city within a user id range
+    """
+    comment = _comment(comment_id)
+    if comment is None:
+        return
+
+    followers = _city_followers(comment.place.city_id).filter(
+        user_id__gte=first_user_id, user_id__lte=last_user_id
+    )
+    _notify(comment, followers.iterator(chunk_size=NOTIFICATION_BATCH_SIZE))
+
+
+@shared_task(name="city.tasks.import_places")
+def import_places(path, file_format, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import an uploaded places file from the default storage, rejected rows
+    are stored next to it
+    """
+    with (
+        default_storage.open(path, "rb") as file,
+        tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as errors,
+    ):
+        reader = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        importer = PlaceImporter(batch_size=batch_size, errors=errors)
+        result = importer.import_file(reader, file_format)
+
+        errors_path = None
+        if result.rejected:
+            errors.seek(0)
+            errors_path = default_storage.save(f"{path}.errors.csv", File(errors))
+
+    return {**asdict(result), "errors": errors_path}
+
+
+@shared_task(name="city.tasks.generate_place_photo_variants")
+def generate_place_photo_variants(place_id):
+    """
+    Generate the thumbnail and WebP variants of a place photo
+    """
+    place = (
+        Place.objects.filter(id=place_id).only("id", "photo", "photo_variants").first()
+    )
+    if place is not None:
+        refresh_variants(place, "photo", "photo_variants")
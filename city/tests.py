@@ -1,3 +1,1155 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from city import (
+    clustering,
+    counters,
+    locations,
+    ratings,
+    search,
+    services,
+    spatial,
+    tasks,
+)
+from city.admin import LocationAdmin
+from city.importer import GeoJSONFeatureReader, PlaceImporter
+from city.models import (
+    City,
+    Location,
+    Place,
+    PlaceCluster,
+    PlaceComment,
+    PlaceRating,
+    UserPlaceVisit,
+)
+from city.views import ListPlacesView, PlaceClustersView, PlacesInBBoxView
+from roadrunner import images, metrics, sms
+from roadrunner.auth import RefreshToken
+from user.models import Notification, User
+
+
+class ListPlacesQueryCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.city = City.objects.create(name="Tbilisi")
+        self.factory = APIRequestFactory()
+
+    def create_places(self, count):
+        for index in range(count):
+            place = Place.objects.create(
+                name=f"Place {index}",
+                city=self.city,
+                location=Location.objects.resolve(lat=41.7 + index / 1000, lng=44.8),
+                price=10,
+            )
+            PlaceComment.objects.create(user=self.user, place=place, text="Nice")
+            if index % 2:
+                UserPlaceVisit.objects.create(user=self.user, place=place)
+
+    def list_places(self):
+        request = self.factory.get(f"/api/cities/{self.city.id}/places/")
+        force_authenticate(request, user=self.user)
+        response = ListPlacesView.as_view()(request, city_id=self.city.id)
+        response.render()
+        return response
+
+    def test_list_query_count_does_not_grow_with_places(self):
+        self.create_places(2)
+        with self.assertNumQueries(1):
+            self.list_places()
+
+        self.create_places(20)
+        with self.assertNumQueries(1):
+            response = self.list_places()
+
+        places = response.data["results"]
+        self.assertEqual(len(places), 22)
+        self.assertEqual(sum(place["user_visited"] for place in places), 11)
+        self.assertTrue(all(place["comments_count"] == 1 for place in places))
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.city = City.objects.create(name="Tbilisi")
+        location = Location.objects.resolve(lat=41.7, lng=44.8)
+        # Few distinct values so that pages split runs of equal values
+        self.places = [
+            Place.objects.create(
+                name=f"Place {number % 3}",
+                city=self.city,
+                location=location,
+                price=number % 4,
+            )
+            for number in range(10)
+        ]
+        for number, place in enumerate(self.places):
+            Place.objects.filter(id=place.id).update(
+                average_rating=number % 2,
+                created_at=self.places[number % 5].created_at,
+            )
+        Place.objects.create(
+            name="Elsewhere",
+            city=City.objects.create(name="Batumi"),
+            location=location,
+            price=0,
+        )
+
+    def get(self, **params):
+        request = APIRequestFactory().get(f"/api/cities/{self.city.id}/places/", params)
+        force_authenticate(request, user=self.user)
+        return ListPlacesView.as_view()(request, city_id=self.city.id)
+
+    def walk(self, ordering, page_size=3):
+        ids, params = [], {"ordering": ordering, "page_size": page_size}
+        while True:
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.data), {"next", "results"})
+            ids += [place["id"] for place in response.data["results"]]
+            if response.data["next"] is None:
+                return ids
+            params = dict(parse_qsl(urlsplit(response.data["next"]).query))
+
+    def expected(self, ordering):
+        return list(
+            Place.objects.filter(city=self.city)
+            .order_by(ordering, "-id" if ordering.startswith("-") else "id")
+            .values_list("id", flat=True)
+        )
+
+    def test_pages_follow_every_ordering_without_skips_or_repeats(self):
+        for field in ListPlacesView.ordering_fields:
+            for ordering in [field, f"-{field}"]:
+                with self.subTest(ordering=ordering):
+                    self.assertEqual(self.walk(ordering), self.expected(ordering))
+
+    def test_equal_values_are_ordered_by_id(self):
+        ids = self.walk("price", page_size=1)
+        prices = dict(Place.objects.values_list("id", "price"))
+        for previous, current in zip(ids, ids[1:]):
+            self.assertLessEqual(
+                (prices[previous], previous), (prices[current], current)
+            )
+
+    def test_default_ordering_is_newest_first(self):
+        self.assertEqual(self.walk(""), self.expected("-created_at"))
+
+    def test_cursor_round_trip(self):
+        response = self.get(ordering="-price", page_size=4)
+        last = response.data["results"][-1]
+        cursor = dict(parse_qsl(urlsplit(response.data["next"]).query))["cursor"]
+        self.assertEqual(
+            json.loads(base64.urlsafe_b64decode(cursor)),
+            {"ordering": "-price", "value": str(last["price"]), "id": last["id"]},
+        )
+
+    def test_invalid_cursors_are_rejected(self):
+        def encode(cursor):
+            return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+        for cursor in [
+            "not a cursor",
+            encode({"ordering": "price", "value": "1"}),
+            encode({"ordering": "price", "value": "cheap", "id": 1}),
+            # A cursor of one ordering cannot be replayed with another
+            encode({"ordering": "name", "value": "Place 1", "id": 1}),
+        ]:
+            with self.subTest(cursor=cursor):
+                response = self.get(ordering="price", cursor=cursor)
+                self.assertEqual(response.status_code, 404)
+
+
+class CreatePlaceTest(TestCase):
+    def setUp(self):
+        self.city = City.objects.create(name="Tbilisi")
+
+    def create(self, **data):
+        return services.create_place(
+            {
+                "name": "Botanical Garden",
+                "city": self.city.id,
+                "latitude": 41.69,
+                "longitude": 44.81,
+                **data,
+            }
+        )
+
+    def test_free_place_is_created(self):
+        place, errors = self.create(price=0)
+        self.assertIsNone(errors)
+        self.assertEqual(place.price, 0)
+
+    def test_missing_price_is_rejected(self):
+        for price in [None, ""]:
+            with self.subTest(price=price):
+                place, errors = self.create(price=price)
+                self.assertIsNone(place)
+                self.assertEqual(errors, {"error": "price is required"})
+
+
+class CountingEmailBackend(EmailBackend):
+    """
+    In-memory backend counting the connections opened to it
+    """
+
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        if any(message.to == ["bounce@example.com"] for message in messages):
+            raise ConnectionError("Connection reset")
+        return super().send_messages(messages)
+
+
+class ReconnectingEmailBackend(FailingEmailBackend):
+    """
+    In-memory backend connecting like the SMTP backend, sending without an
+    open connection opens one for that call only
+    """
+
+    opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        self.connected = True
+        ReconnectingEmailBackend.opened += 1
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        created = self.open()
+        try:
+            return super().send_messages(messages)
+        finally:
+            if created:
+                self.close()
+
+
+class BatchEmailTest(TestCase):
+    def recipients(self, count):
+        return [
+            {"email": f"user{index}@example.com", "context": {"commenter_name": index}}
+            for index in range(count)
+        ]
+
+    @override_settings(EMAIL_BACKEND="city.tests.CountingEmailBackend")
+    def test_burst_opens_one_connection_per_batch(self):
+        CountingEmailBackend.opened = 0
+        failed = tasks.send_templated_email(
+            "city/email/new_comment",
+            self.recipients(10_000),
+            {"place_name": "Narikala", "comment_text": "Great view"},
+        )
+
+        self.assertEqual(failed, 0)
+        self.assertEqual(len(mail.outbox), 10_000)
+        self.assertEqual(CountingEmailBackend.opened, 10_000 // tasks.EMAIL_BATCH_SIZE)
+
+        message = mail.outbox[42]
+        self.assertEqual(message.to, ["user42@example.com"])
+        self.assertEqual(message.subject, "New comment on your place: Narikala")
+        self.assertIn('42 commented on your place "Narikala"', message.body)
+        self.assertEqual(message.alternatives[0][1], "text/html")
+
+    @override_settings(EMAIL_BACKEND="city.tests.FailingEmailBackend")
+    def test_only_failed_messages_are_retried(self):
+        recipients = self.recipients(3) + [{"email": "bounce@example.com"}]
+        context = {"place_name": "Narikala", "comment_text": "Great view"}
+
+        with mock.patch.object(tasks.send_templated_email, "apply_async") as retry:
+            failed = tasks.send_templated_email(
+                "city/email/new_comment", recipients, context
+            )
+
+        self.assertEqual(failed, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        retry.assert_called_once_with(
+            (
+                "city/email/new_comment",
+                [{"email": "bounce@example.com"}],
+                context,
+                1,
+            ),
+            countdown=tasks.EMAIL_RETRY_BACKOFF,
+        )
+
+    @override_settings(EMAIL_BACKEND="city.tests.ReconnectingEmailBackend")
+    def test_batch_goes_on_over_one_new_connection_after_a_failure(self):
+        ReconnectingEmailBackend.opened = 0
+        recipients = (
+            self.recipients(5) + [{"email": "bounce@example.com"}] + self.recipients(5)
+        )
+
+        with mock.patch.object(tasks.send_templated_email, "apply_async"):
+            failed = tasks.send_templated_email(
+                "city/email/new_comment", recipients, {"place_name": "Narikala"}
+            )
+
+        self.assertEqual(failed, 1)
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertEqual(ReconnectingEmailBackend.opened, 2)
+
+
+class FakeClock:
+    """
+    Stands in for the time module of roadrunner.sms, sleeping advances it
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@override_settings(
+    SMS_PROVIDER={
+        "BACKEND": "roadrunner.sms.FakeSMSProvider",
+        "OPTIONS": {"failing": ["+995000"]},
+    },
+    SMS_RATE_LIMIT=0.1,
+    SMS_BURST=2,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class SMSDispatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        sms.get_provider.cache_clear()
+        self.addCleanup(sms.get_provider.cache_clear)
+        self.clock = FakeClock()
+        patcher = mock.patch.object(sms, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def messages(self, count, body="Hi"):
+        return [(f"+99559{number:04}", body) for number in range(count)]
+
+    def test_token_bucket_refills_up_to_its_capacity(self):
+        bucket = sms.TokenBucket("test", rate=1, capacity=3)
+        self.assertEqual(bucket.acquire(3), 0)
+        self.assertEqual(bucket.acquire(2), 2)
+
+        self.clock.sleep(1)
+        self.assertEqual(bucket.acquire(1), 0)
+        self.assertEqual(bucket.acquire(1), 1)
+
+        # Idle time never saves more than a full bucket
+        self.clock.sleep(100)
+        self.assertEqual(bucket.acquire(3), 0)
+        self.assertEqual(bucket.acquire(1), 1)
+
+    def test_batches_wait_for_tokens_then_defer_the_rest(self):
+        dispatcher = sms.SMSDispatcher(
+            bucket=sms.TokenBucket("test", rate=1, capacity=2)
+        )
+        result = dispatcher.dispatch(self.messages(6))
+        # The later batches waited for the bucket to refill
+        self.assertEqual(result.sent, 6)
+        self.assertEqual(self.clock.now, 1004.0)
+
+        dispatcher = sms.SMSDispatcher()
+        messages = self.messages(6, body="Hello")
+        result = dispatcher.dispatch(messages)
+        self.assertEqual(result.sent, 2)
+        self.assertEqual(result.deferred, messages[2:])
+        self.assertEqual(result.retry_after, 20)
+        self.assertEqual(len(sms.get_provider().outbox), 8)
+
+    def test_deferred_messages_are_requeued_with_their_attempt(self):
+        messages = self.messages(3)
+        with mock.patch.object(tasks.send_sms_batch, "apply_async") as requeue:
+            self.assertEqual(tasks.send_sms_batch(messages, attempt=1), 2)
+        requeue.assert_called_once_with(([messages[2]], 1), countdown=10)
+
+        # Deferred messages are not taken for duplicates when they come back
+        self.clock.sleep(10)
+        self.assertEqual(tasks.send_sms_batch([messages[2]], attempt=1), 1)
+
+    def test_failed_messages_are_retried_with_backoff(self):
+        messages = [("+995000", "Hi"), ("+995001", "Hi")]
+        with mock.patch.object(tasks.send_sms_batch, "apply_async") as retry:
+            tasks.send_sms_batch(messages, attempt=1)
+            self.clock.sleep(60)
+            tasks.send_sms_batch(messages[:1], attempt=tasks.SMS_MAX_RETRIES)
+
+        retry.assert_called_once_with(
+            ([messages[0]], 2), countdown=tasks.SMS_RETRY_BACKOFF * 2
+        )
+        self.assertEqual(sms.get_provider().outbox, [messages[1]])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CommentNotificationTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f"traveler{number}",
+                email=f"traveler{number}@example.com",
+                password="password",
+            )
+            for number in range(6)
+        ]
+        city = City.objects.create(name="Tbilisi")
+        for user in self.users[1:]:
+            user.cities.add(city)
+        self.place = Place.objects.create(
+            name="Narikala",
+            city=city,
+            location=Location.objects.resolve(lat=41.69, lng=44.81),
+            price=0,
+        )
+        self.comment = PlaceComment.objects.create(
+            user=self.users[0], place=self.place, text="Great view"
+        )
+
+    def notified(self):
+        return sorted(Notification.objects.values_list("recipient_id", flat=True))
+
+    @mock.patch.object(tasks, "FANOUT_CHUNK_SIZE", 2)
+    def test_full_chunks_are_delivered_by_subtasks(self):
+        followers = [user.id for user in self.users[1:]]
+        with mock.patch.object(tasks.deliver_comment_notifications, "delay") as delay:
+            self.assertEqual(tasks.create_comment_notification(self.comment.id), 2)
+
+        self.assertEqual(
+            delay.call_args_list,
+            [
+                mock.call(self.comment.id, followers[0], followers[1]),
+                mock.call(self.comment.id, followers[2], followers[3]),
+            ],
+        )
+        # The last, partial chunk is notified by the task itself
+        self.assertEqual(self.notified(), followers[4:])
+
+        for call in delay.call_args_list:
+            tasks.deliver_comment_notifications(*call.args)
+        self.assertEqual(self.notified(), followers)
+
+    @mock.patch.object(tasks, "FANOUT_CHUNK_SIZE", 5)
+    def test_exact_chunks_leave_nothing_to_the_task(self):
+        with mock.patch.object(tasks.deliver_comment_notifications, "delay") as delay:
+            self.assertEqual(tasks.create_comment_notification(self.comment.id), 1)
+        delay.assert_called_once_with(
+            self.comment.id, self.users[1].id, self.users[5].id
+        )
+        self.assertEqual(self.notified(), [])
+
+    def test_tasks_queued_with_the_previous_arguments_are_delivered(self):
+        tasks.create_comment_notification(
+            recipients=[self.users[1].id, self.users[2].id],
+            sender_id=self.users[0].id,
+            place_name="Narikala",
+            comment_text="Great view",
+        )
+        self.assertEqual(self.notified(), [self.users[1].id, self.users[2].id])
+        self.assertEqual(
+            Notification.objects.first().message,
+            f"{self.users[0].id} commented on your place 'Narikala': Great view",
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class PlaceImporterTest(TestCase):
+    CSV = (
+        "name,city,lat,lng,price,description\n"
+        "Narikala,Tbilisi,41.6875,44.8089,0,Old fortress\n"
+        "Fortress gate,Tbilisi,41.6875,44.8089,,\n"
+        ",Tbilisi,41.7,44.8,5,\n"
+        "Boulevard,Batumi,41.65,41.63,3,\n"
+        "Nowhere,Batumi,95,41.63,3,\n"
+    )
+
+    def test_csv_rows_are_imported_in_batches(self):
+        tbilisi = City.objects.create(name="Tbilisi")
+        errors = StringIO()
+        importer = PlaceImporter(batch_size=2, errors=errors)
+
+        result = importer.import_file(StringIO(self.CSV), "csv")
+        self.assertEqual(
+            (result.processed, result.imported, result.rejected), (5, 3, 2)
+        )
+
+        places = Place.objects.select_related("city", "location").order_by("id")
+        self.assertEqual(
+            [(place.name, place.city.name, place.price) for place in places],
+            [
+                ("Narikala", "Tbilisi", 0),
+                ("Fortress gate", "Tbilisi", 0),
+                ("Boulevard", "Batumi", 3),
+            ],
+        )
+        # Existing cities and locations are reused
+        self.assertEqual(places[0].city, tbilisi)
+        self.assertEqual(places[0].location, places[1].location)
+        self.assertEqual(Location.objects.count(), 2)
+
+        # The bypassed signals are made up for
+        self.assertEqual(PlaceCluster.objects.get(city=tbilisi, zoom=0).count, 2)
+        self.assertEqual(
+            [place.name for place in search.search(Place.objects.all(), "fortress")],
+            ["Narikala", "Fortress gate"],
+        )
+
+        errors.seek(0)
+        rejected = list(csv.DictReader(errors))
+        self.assertEqual([row["row"] for row in rejected], ["3", "5"])
+        self.assertEqual(rejected[1]["error"], "Coordinates out of range")
+
+    def test_geojson_features_are_read_incrementally(self):
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [44.8089, 41.6875]},
+                "properties": {"name": f"Place {number}", "city": "Tbilisi"},
+            }
+            for number in range(3)
+        ]
+        collection = json.dumps(
+            {"type": "FeatureCollection", "features": features, "name": "places"}
+        )
+        reader = GeoJSONFeatureReader(StringIO(collection), chunk_size=7)
+        self.assertEqual(list(reader), features)
+
+        result = PlaceImporter().import_file(StringIO(collection), "geojson")
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(
+            set(Place.objects.values_list("location__lat", "location__lng")),
+            {(41.6875, 44.8089)},
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    PERFORMANCE_LOG_SAMPLE_RATE=0,
+)
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        metrics.store.reset()
+        self.addCleanup(metrics.store.reset)
+        self.user = User.objects.create_user(
+            username="admin",
+            email="admin@example.com",
+            password="password",
+            is_staff=True,
+        )
+        self.city = City.objects.create(name="Tbilisi")
+        for number in range(3):
+            Place.objects.create(
+                name=f"Place {number}",
+                city=self.city,
+                location=Location.objects.resolve(lat=41.7, lng=44.8 + number),
+                price=0,
+            )
+        # Pages are authenticated with the access token kept in the session
+        session = self.client.session
+        session["access_token"] = str(RefreshToken.for_user(self.user).access_token)
+        session.save()
+
+    def test_responses_carry_server_timing(self):
+        response = self.client.get(f"/api/cities/{self.city.id}/places/")
+        self.assertEqual(response.status_code, 200)
+
+        entries = dict(
+            entry.split(";", 1) for entry in response["Server-Timing"].split(", ")
+        )
+        self.assertEqual(list(entries), ["db", "serializer", "cache", "view", "total"])
+        self.assertRegex(entries["db"], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertRegex(entries["total"], r"^dur=[\d.]+$")
+
+    def test_requests_are_aggregated_per_route(self):
+        for _ in range(2):
+            self.client.get(f"/api/cities/{self.city.id}/places/")
+        self.client.get("/api/cities/")
+
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        routes = response.json()
+        self.assertEqual(routes["cities:places-by-city"]["count"], 2)
+        self.assertGreater(routes["cities:places-by-city"]["avg_queries"], 0)
+        self.assertGreaterEqual(
+            routes["cities:places-by-city"]["max_total_ms"],
+            routes["cities:places-by-city"]["avg_total_ms"],
+        )
+        self.assertEqual(routes["cities:city-list-create"]["count"], 1)
+
+        self.assertEqual(self.client.delete("/api/metrics/").status_code, 204)
+        self.assertEqual(list(metrics.store.snapshot()), ["request-metrics"])
+
+    def test_slow_requests_are_logged(self):
+        with (
+            override_settings(PERFORMANCE_SLOW_REQUEST_MS=0),
+            self.assertLogs("roadrunner.metrics", "INFO") as logs,
+        ):
+            self.client.get("/api/cities/")
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry["method"], entry["status"]), ("GET", 200))
+        self.assertGreater(entry["queries"], 0)
+
+
+class PhotoVariantsTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        patcher = mock.patch.object(tasks.generate_place_photo_variants, "delay")
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.city = City.objects.create(name="Tbilisi")
+        self.location = Location.objects.resolve(lat=41.69, lng=44.81)
+
+    def photo(self, name, size=(1600, 800)):
+        content = io.BytesIO()
+        Image.new("RGB", size, "teal").save(content, "PNG")
+        return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+    def place(self, photo=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Place.objects.create(
+                name="Narikala",
+                city=self.city,
+                location=self.location,
+                price=0,
+                photo=photo,
+            )
+
+    def sizes(self, variants):
+        sizes = {}
+        for variant, path in variants.items():
+            with default_storage.open(path) as file, Image.open(file) as image:
+                sizes[variant] = (image.format, image.size)
+        return sizes
+
+    def test_variants_are_fitted_into_their_boxes(self):
+        place = self.place(self.photo("tower.png"))
+        self.delay.assert_called_once_with(place.id)
+
+        tasks.generate_place_photo_variants(place.id)
+        place.refresh_from_db()
+        self.assertEqual(
+            self.sizes(place.photo_variants),
+            {
+                "thumbnail": ("JPEG", (200, 100)),
+                "thumbnail_webp": ("WEBP", (200, 100)),
+                "large": ("JPEG", (1200, 600)),
+                "large_webp": ("WEBP", (1200, 600)),
+            },
+        )
+
+    def test_replaced_photo_keeps_the_newer_variants(self):
+        place = self.place(self.photo("tower.png"))
+        stale = Place.objects.get(id=place.id)
+
+        place.photo = self.photo("bridge.png", size=(300, 600))
+        with self.captureOnCommitCallbacks(execute=True):
+            place.save()
+        self.assertEqual(self.delay.call_count, 2)
+        tasks.generate_place_photo_variants(place.id)
+
+        # The refresh queued for the first photo runs late
+        stale_variants = images.refresh_variants(stale, "photo", "photo_variants")
+        self.assertFalse(default_storage.exists(stale_variants["thumbnail"]))
+
+        place.refresh_from_db()
+        self.assertEqual(
+            self.sizes(place.photo_variants)["thumbnail"], ("JPEG", (100, 200))
+        )
+        self.assertIn("bridge", place.photo_variants["thumbnail"])
+
+        # Replacing the photo again drops the variants of the previous one
+        old_variants = place.photo_variants
+        place.photo = self.photo("gate.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            place.save()
+        place.refresh_from_db()
+        self.assertEqual(place.photo_variants, {})
+        for path in old_variants.values():
+            self.assertFalse(default_storage.exists(path))
+
+    def test_command_backfills_missing_variants(self):
+        done = self.place(self.photo("tower.png"))
+        tasks.generate_place_photo_variants(done.id)
+        done.refresh_from_db()
+        missing = self.place(self.photo("bridge.png"))
+        self.place()
+
+        output = StringIO()
+        call_command("generate_photo_variants", stdout=output)
+        self.assertIn("Generated variants of 1 places", output.getvalue())
+
+        self.assertEqual(
+            Place.objects.get(id=done.id).photo_variants, done.photo_variants
+        )
+        self.assertEqual(
+            len(Place.objects.get(id=missing.id).photo_variants),
+            len(images.VARIANTS) * 2,
+        )
+        self.assertEqual(Place.objects.filter(photo_variants={}).count(), 1)
+
+
+class SpatialCoverTest(SimpleTestCase):
+    def test_high_zoom_cover_of_a_wide_box_is_bounded(self):
+        box = (-60.0, -150.0, 70.0, 160.0)
+        for zoom in (None, 0, 10, 16, 22):
+            ranges = spatial.cover(*box, zoom=zoom)
+            self.assertLessEqual(len(ranges), spatial.MAX_COVER_RANGES)
+            for lat, lng in [(-60.0, -150.0), (0.0, 0.0), (70.0, 160.0)]:
+                cell = spatial.encode(lat, lng)
+                self.assertTrue(any(low <= cell <= high for low, high in ranges))
+
+    def test_zoom_coarsens_the_cover_of_a_small_box(self):
+        box = (41.6, 44.7, 41.8, 44.9)
+        self.assertLessEqual(
+            len(spatial.cover(*box, zoom=2)), len(spatial.cover(*box, zoom=22))
+        )
+
+
+class PlacesInBBoxTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.tbilisi = City.objects.create(name="Tbilisi")
+        batumi = City.objects.create(name="Batumi")
+        for city in (self.tbilisi, batumi):
+            Place.objects.create(
+                name=f"{city.name} place",
+                city=city,
+                location=Location.objects.resolve(lat=41.7, lng=44.8),
+                price=0,
+            )
+
+    def places_in_bbox(self, **params):
+        params = {"south": 41, "west": 44, "north": 42, "east": 45, **params}
+        request = APIRequestFactory().get("/api/places/bbox/", params)
+        force_authenticate(request, user=self.user)
+        return PlacesInBBoxView.as_view()(request)
+
+    def test_city_filter(self):
+        response = self.places_in_bbox(city=self.tbilisi.id, zoom=22)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([place["name"] for place in response.data], ["Tbilisi place"])
+
+    def test_invalid_city_is_rejected(self):
+        response = self.places_in_bbox(city="abc")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("city", response.data)
+
+
+class LocationAdminTest(TestCase):
+    def setUp(self):
+        self.form = LocationAdmin(Location, admin.site).get_form(None)
+        self.tower = Location.objects.resolve(lat=41.6875, lng=44.8089)
+        self.garden = Location.objects.resolve(lat=41.6886, lng=44.8041)
+
+    def test_moving_onto_another_location_is_rejected(self):
+        form = self.form(
+            {"lat": self.tower.lat, "lng": self.tower.lng}, instance=self.garden
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn(f"#{self.tower.pk}", form.non_field_errors()[0])
+
+        form = self.form({"lat": self.tower.lat, "lng": self.tower.lng})
+        self.assertFalse(form.is_valid())
+
+    def test_moving_a_location_is_saved(self):
+        form = self.form({"lat": 41.7, "lng": 44.8}, instance=self.garden)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(
+            Location.objects.get(lat_key=self.garden.lat_key).pk, self.garden.pk
+        )
+
+        form = self.form({"lat": 41.7, "lng": 44.8}, instance=self.garden)
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class RatingAggregatesTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f"traveler{number}",
+                email=f"traveler{number}@example.com",
+                password="password",
+            )
+            for number in range(2)
+        ]
+        city = City.objects.create(name="Tbilisi")
+        self.places = [
+            Place.objects.create(
+                name=f"Place {number}",
+                city=city,
+                location=Location.objects.resolve(lat=41.7, lng=44.8 + number / 1000),
+                price=0,
+            )
+            for number in range(2)
+        ]
+
+    def rate(self, place, rating, user=0):
+        return PlaceRating.objects.create(
+            user=self.users[user], place=place, rating=rating
+        )
+
+    def aggregates(self, place):
+        place.refresh_from_db()
+        return place.rating_sum, place.total_ratings, place.average_rating
+
+    def cluster_sums(self):
+        return set(
+            PlaceCluster.objects.filter(zoom__lte=10).values_list("count", "rating_sum")
+        )
+
+    def test_rating_changes_update_the_aggregates(self):
+        place = self.places[0]
+        first = self.rate(place, 4)
+        self.rate(place, 1, user=1)
+        self.assertEqual(self.aggregates(place), (5, 2, 2.5))
+
+        first.rating = 2
+        first.save()
+        self.assertEqual(self.aggregates(place), (3, 2, 1.5))
+
+        first.delete()
+        self.assertEqual(self.aggregates(place), (1, 1, 1.0))
+
+    def test_clusters_follow_ratings_and_deleted_places(self):
+        self.rate(self.places[0], 4)
+        self.rate(self.places[1], 2)
+        # Both places share the clusters of the lower zoom levels
+        self.assertEqual(self.cluster_sums(), {(2, 6.0)})
+
+        Place.objects.get(id=self.places[0].id).delete()
+        self.assertEqual(self.cluster_sums(), {(1, 2.0)})
+
+    def test_incremental_clusters_match_a_rebuild(self):
+        self.rate(self.places[0], 5)
+        self.rate(self.places[0], 2, user=1)
+        self.rate(self.places[1], 3)
+        self.places[1].location = Location.objects.resolve(lat=48.85, lng=2.35)
+        self.places[1].save()
+
+        def clusters():
+            return sorted(
+                PlaceCluster.objects.values_list(
+                    "city",
+                    "zoom",
+                    "cell",
+                    "count",
+                    "lat_sum",
+                    "lng_sum",
+                    "rating_sum",
+                )
+            )
+
+        incremental = clusters()
+        clustering.rebuild()
+        self.assertEqual(len(incremental), len(clusters()))
+        for expected, actual in zip(clusters(), incremental):
+            self.assertEqual(expected[:4], actual[:4])
+            for expected_sum, actual_sum in zip(expected[4:], actual[4:]):
+                self.assertAlmostEqual(expected_sum, actual_sum)
+
+    def test_stale_instance_keeps_the_aggregates(self):
+        place = Place.objects.get(id=self.places[0].id)
+        self.rate(self.places[0], 4)
+        place.name = "Renamed"
+        place.save()
+        self.assertEqual(self.aggregates(place), (4, 1, 4.0))
+        self.assertEqual(place.name, "Renamed")
+
+    def test_deferred_fields_are_not_loaded_on_save(self):
+        place = Place.objects.only("id", "name", "city", "location").get(
+            id=self.places[0].id
+        )
+        place.name = "Renamed"
+        place.save()
+        self.assertIn("price", place.get_deferred_fields())
+        place.refresh_from_db()
+        self.assertEqual(place.name, "Renamed")
+
+    def test_drifted_aggregates_do_not_go_below_zero(self):
+        rating = self.rate(self.places[0], 4)
+        Place.objects.filter(id=self.places[0].id).update(
+            rating_sum=0, total_ratings=0, average_rating=0.0
+        )
+        PlaceCluster.objects.update(rating_sum=0.0)
+
+        rating.delete()
+        self.assertEqual(self.aggregates(self.places[0]), (0, 0, 0.0))
+        self.assertEqual(self.cluster_sums(), {(2, 0.0)})
+
+    def test_reconcile_repairs_drift(self):
+        self.rate(self.places[0], 4)
+        Place.objects.filter(id=self.places[0].id).update(rating_sum=0, total_ratings=0)
+        self.assertEqual(ratings.reconcile(), 1)
+        self.assertEqual(self.aggregates(self.places[0]), (4, 1, 4.0))
+        self.assertEqual(self.cluster_sums(), {(2, 4.0)})
+
+
+class ActivityCountersTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f"traveler{number}",
+                email=f"traveler{number}@example.com",
+                password="password",
+            )
+            for number in range(2)
+        ]
+        self.place = Place.objects.create(
+            name="Narikala",
+            city=City.objects.create(name="Tbilisi"),
+            location=Location.objects.resolve(lat=41.69, lng=44.81),
+            price=0,
+        )
+
+    def counts(self):
+        self.place.refresh_from_db()
+        return self.place.total_visits, self.place.total_comments
+
+    def test_counters_follow_rows_and_cascades(self):
+        for user in self.users:
+            UserPlaceVisit.objects.create(user=user, place=self.place)
+            PlaceComment.objects.create(user=user, place=self.place, text="Nice")
+        self.assertEqual(self.counts(), (2, 2))
+
+        PlaceComment.objects.filter(user=self.users[0]).delete()
+        self.assertEqual(self.counts(), (2, 1))
+
+        self.users[1].delete()
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_drifted_counters_do_not_go_below_zero(self):
+        comment = PlaceComment.objects.create(
+            user=self.users[0], place=self.place, text="Nice"
+        )
+        visit = UserPlaceVisit.objects.create(user=self.users[0], place=self.place)
+        Place.objects.filter(id=self.place.id).update(total_visits=0, total_comments=0)
+
+        comment.delete()
+        visit.delete()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        UserPlaceVisit.objects.create(user=self.users[0], place=self.place)
+        PlaceComment.objects.create(user=self.users[0], place=self.place, text="Hi")
+        self.assertFalse(counters.find_drift().exists())
+
+        Place.objects.filter(id=self.place.id).update(total_visits=5, total_comments=0)
+        self.assertEqual(list(counters.find_drift()), [self.place])
+        self.assertEqual(counters.reconcile(place_ids=[0]), 0)
+        self.assertEqual(counters.reconcile(), 1)
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(counters.reconcile(), 0)
+
+    def test_command_reports_and_repairs_drift(self):
+        UserPlaceVisit.objects.create(user=self.users[0], place=self.place)
+        Place.objects.filter(id=self.place.id).update(total_visits=0, rating_sum=3)
+
+        output = StringIO()
+        call_command("reconcile_place_stats", "--check", stdout=output)
+        self.assertIn("1 places with drifted ratings", output.getvalue())
+        self.assertIn("1 places with drifted visit or comment", output.getvalue())
+        self.assertEqual(self.counts(), (0, 0))
+
+        call_command("reconcile_place_stats", stdout=StringIO())
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertEqual(self.place.rating_sum, 0)
+
+
+class PlaceClustersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.tbilisi = City.objects.create(name="Tbilisi")
+        self.batumi = City.objects.create(name="Batumi")
+        self.other = City.objects.create(name="Private")
+        self.user.cities.add(self.tbilisi, self.batumi)
+        location = Location.objects.resolve(lat=41.7, lng=44.8)
+        self.places = {
+            city: Place.objects.create(
+                name=city.name, city=city, location=location, price=0
+            )
+            for city in [self.tbilisi, self.batumi, self.other]
+        }
+
+    def clusters(self, **params):
+        request = APIRequestFactory().get(
+            "/api/places/clusters/",
+            {"south": 41, "west": 44, "north": 42, "east": 45, "zoom": 10, **params},
+        )
+        force_authenticate(request, user=self.user)
+        response = PlaceClustersView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_clusters_are_merged_over_the_user_cities(self):
+        clusters = self.clusters()
+        self.assertEqual([cluster["count"] for cluster in clusters], [2])
+        self.assertAlmostEqual(clusters[0]["lat"], 41.7)
+        self.assertAlmostEqual(clusters[0]["lng"], 44.8)
+
+    def test_city_filter(self):
+        clusters = self.clusters(city=self.batumi.id)
+        self.assertEqual([cluster["count"] for cluster in clusters], [1])
+        self.assertEqual(self.clusters(city=self.other.id), [])
+
+    def test_places_moved_to_another_city_move_their_clusters(self):
+        place = Place.objects.get(id=self.places[self.other].id)
+        place.city = self.tbilisi
+        place.save()
+        self.assertEqual([cluster["count"] for cluster in self.clusters()], [3])
+        self.assertFalse(PlaceCluster.objects.filter(city=self.other).exists())
+
+    def test_rekeyed_locations_move_their_clusters(self):
+        location = self.places[self.tbilisi].location
+        Location.objects.filter(id=location.id).update(lat=48.85, lng=2.35)
+        self.assertEqual(locations.canonicalize(), (1, 0))
+        self.assertEqual(self.clusters(), [])
+
+        def clusters():
+            return sorted(
+                PlaceCluster.objects.values_list(
+                    "city", "zoom", "cell", "count", "lat_sum", "lng_sum"
+                )
+            )
+
+        incremental = clusters()
+        clustering.rebuild()
+        self.assertEqual(len(incremental), len(clusters()))
+        for expected, actual in zip(clusters(), incremental):
+            self.assertEqual(expected[:4], actual[:4])
+            self.assertAlmostEqual(expected[4], actual[4])
+            self.assertAlmostEqual(expected[5], actual[5])
+
+    def test_upserts_add_and_remove_points(self):
+        cell = self.places[self.other].location.cell
+        point = (self.other.id, cell, 1.0, 2.0, 3.0)
+        clustering.apply_points([point, point])
+        cluster = PlaceCluster.objects.get(city=self.other, zoom=0)
+        self.assertEqual(
+            (cluster.count, cluster.lat_sum, cluster.lng_sum, cluster.rating_sum),
+            (3, 41.7 + 2.0, 44.8 + 4.0, 6.0),
+        )
+
+        clustering.apply_points([point, point], sign=-1)
+        cluster.refresh_from_db()
+        self.assertEqual(cluster.count, 1)
+        self.assertAlmostEqual(cluster.lat_sum, 41.7)
+
+        self.places[self.other].delete()
+        self.assertFalse(PlaceCluster.objects.filter(city=self.other).exists())
+        self.assertEqual(
+            PlaceCluster.objects.filter(zoom=0).count(), 2, "other cities are kept"
+        )
+
+
+class PlaceSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.tbilisi = City.objects.create(name="Tbilisi")
+        self.batumi = City.objects.create(name="Batumi")
+        location = Location.objects.resolve(lat=41.7, lng=44.8)
+        for city, names in [
+            (self.tbilisi, ["Old Fortress", "Fortress Museum", "Botanical Garden"]),
+            (self.batumi, ["Fortress Ruins", "Fortress Walls", "Boulevard"]),
+        ]:
+            for name in names:
+                Place.objects.create(
+                    name=name,
+                    description="A fortress" if city == self.batumi else "",
+                    city=city,
+                    location=location,
+                    price=0,
+                )
+
+    def search(self, city, term):
+        request = APIRequestFactory().get(
+            f"/api/cities/{city.id}/places/", {"search": term}
+        )
+        force_authenticate(request, user=self.user)
+        response = ListPlacesView.as_view()(request, city_id=city.id)
+        self.assertEqual(response.status_code, 200)
+        return [place["name"] for place in response.data["results"]]
+
+    def test_search_is_scoped_to_the_city(self):
+        self.assertEqual(
+            sorted(self.search(self.tbilisi, "fort")),
+            ["Fortress Museum", "Old Fortress"],
+        )
+        self.assertEqual(
+            sorted(self.search(self.batumi, "fortress")),
+            ["Boulevard", "Fortress Ruins", "Fortress Walls"],
+        )
+        self.assertEqual(self.search(self.tbilisi, "boulevard"), [])
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search(self.batumi, "fortress")[-1], "Boulevard")
+
+    def test_ranked_results_are_paged_without_gaps(self):
+        request = APIRequestFactory().get(
+            f"/api/cities/{self.batumi.id}/places/",
+            {"search": "fortress", "page_size": 1},
+        )
+        force_authenticate(request, user=self.user)
+        names = []
+        while request is not None:
+            response = ListPlacesView.as_view()(request, city_id=self.batumi.id)
+            names += [place["name"] for place in response.data["results"]]
+            next_url = response.data["next"]
+            request = None
+            if next_url:
+                request = APIRequestFactory().get(next_url)
+                force_authenticate(request, user=self.user)
+        self.assertEqual(len(names), 3)
+        self.assertEqual(set(names), {"Boulevard", "Fortress Ruins", "Fortress Walls"})
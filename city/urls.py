@@ -1,7 +1,16 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from .views import CityView, CommentView, ListPlacesView, PlaceRatingView, PlaceView
+from .views import (
+    CityView,
+    CommentView,
+    ListPlacesView,
+    PlaceClustersView,
+    PlaceImportView,
+    PlaceRatingView,
+    PlacesInBBoxView,
+    PlaceView,
+)
 
 app_name = "cities"
 router = routers.DefaultRouter()
@@ -16,6 +25,9 @@ urlpatterns = [
         "cities/<int:city_id>/places/", ListPlacesView.as_view(), name="places-by-city"
     ),
     path("places/", PlaceView.as_view(), name="add-place"),
+    path("places/in-bbox/", PlacesInBBoxView.as_view(), name="places-in-bbox"),
+    path("places/clusters/", PlaceClustersView.as_view(), name="place-clusters"),
+    path("places/import/", PlaceImportView.as_view(), name="place-import"),
     path("places/<int:place_id>/", PlaceView.as_view(), name="place-detail"),
     path(
         "places/<int:place_id>/ratings/", PlaceRatingView.as_view(), name="place-rating"
@@ -1,23 +1,34 @@
-import jwt
+from django.db import transaction
 from django.db.models import Count, Prefetch
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status
+from rest_framework import status
 from rest_framework.generics import ListAPIView, get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from city.models import City, Location, Place, UserPlaceVisit
-from city.tasks import create_comment_notification, send_notification_email
-from roadrunner import settings
-from user.models import User
+from city import clustering, services, spatial
+from city.importer import store_upload
+from city.models import City, Place, UserPlaceVisit
+from city.search import PlaceSearchFilter
+from city.tasks import (
+    create_comment_notification,
+    import_places,
+    send_notification_email,
+)
 
+from .pagination import KeysetPagination
 from .serializers import (
+    BoundingBoxSerializer,
     CitySerializer,
+    ClusterBoundingBoxSerializer,
     CreatePlaceSerializer,
+    PlaceClusterSerializer,
     PlaceCommentSerializer,
+    PlaceImportSerializer,
     PlaceRatingSerializer,
     PlaceSerializer,
 )
@@ -50,17 +61,6 @@ class CityView(APIView):
         """
         Retrieve a specific city or list of cities for the current user
         """
-        auth_header = request.headers.get("Authorization")
-        print(request.headers)
-        if auth_header:
-            try:
-                token = auth_header.split()[1]
-                decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                print("Decoded Token:", decoded)
-            except jwt.ExpiredSignatureError:
-                print("Token has expired.")
-            except jwt.InvalidTokenError:
-                print("Invalid token.")
         if city_id:
             try:
                 city = (
@@ -79,8 +79,7 @@ class CityView(APIView):
                     {"detail": "City not found or not associated with user"},
                     status=status.HTTP_404_NOT_FOUND,
                 )
-        print("Request", request)
-        cities = request.user.cities.annotate(places_count=Count("places"))
+        cities = services.user_cities(request.user.id)
         serializer = self.serializer_class(cities, many=True)
         return Response(serializer.data)
 
@@ -99,18 +98,13 @@ class CommentView(APIView):
         user = request.user
         data["user"] = user.id
         data["place"] = place.id
-        recipients = User.objects.filter(cities__places__id=place_id)
-        recipient_ids = list(recipients.values_list("id", flat=True))
         serializer = self.serializer_class(data=data, context={"request": request})
         if serializer.is_valid():
             comment = serializer.save()
-            place = comment.place
 
-            self.notifications.delay(
-                recipients=recipient_ids,
-                sender_id=user.id,
-                place_name=place.name,
-                comment_text=comment.text,
+            # Recipients are resolved by the task, after the comment is committed
+            transaction.on_commit(
+                lambda: self.notifications.delay(comment_id=comment.id)
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -145,10 +139,10 @@ class PlaceRatingView(APIView):
 class ListPlacesView(ListAPIView):
     permissions = [IsAuthenticated]
     serializer_class = PlaceSerializer
+    pagination_class = KeysetPagination
     filter_backends = [
         DjangoFilterBackend,
-        filters.OrderingFilter,
-        filters.SearchFilter,
+        PlaceSearchFilter,
     ]
 
     filterset_fields = {
@@ -156,8 +150,11 @@ class ListPlacesView(ListAPIView):
         "average_rating": ["gte", "lte"],
     }
 
+    # Applied by KeysetPagination, each one is backed by a (city, field, id) index
     ordering_fields = ["name", "price", "average_rating", "created_at"]
+    default_ordering = "-created_at"
 
+    # Answered from the full-text index on SQLite, ranked best match first
     search_fields = ["name", "description"]
 
     def get_queryset(self):
@@ -165,7 +162,86 @@ class ListPlacesView(ListAPIView):
         Override get_queryset to filter places by city ID from URL parameter
         """
         city_id = self.kwargs.get("city_id")
-        return Place.objects.filter(city_id=city_id).select_related("location")
+        return self.serializer_class.annotate_queryset(
+            Place.objects.filter(city_id=city_id), self.request.user
+        )
+
+
+class PlacesInBBoxView(ListAPIView):
+    """
+    List places visible in the map viewport, optionally limited to one city
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = PlaceSerializer
+    bbox_serializer_class = BoundingBoxSerializer
+
+    def get_queryset(self):
+        """
+        Resolve the viewport through the spatial cell index of Location
+        """
+        bbox = self.bbox_serializer_class(data=self.request.query_params)
+        bbox.is_valid(raise_exception=True)
+        viewport = dict(bbox.validated_data)
+        city_id = viewport.pop("city", None)
+
+        queryset = self.serializer_class.annotate_queryset(
+            Place.objects.filter(spatial.bbox_filter(**viewport, prefix="location__")),
+            self.request.user,
+        )
+        if city_id is not None:
+            queryset = queryset.filter(city_id=city_id)
+        return queryset
+
+
+class PlaceClustersView(ListAPIView):
+    """
+    List precomputed marker clusters of the map viewport for a zoom level, of
+    the user's cities or of one of them
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = PlaceClusterSerializer
+    bbox_serializer_class = ClusterBoundingBoxSerializer
+
+    def get_queryset(self):
+        """
+        Read the clusters of the requested zoom level overlapping the viewport
+        """
+        bbox = self.bbox_serializer_class(data=self.request.query_params)
+        bbox.is_valid(raise_exception=True)
+        viewport = dict(bbox.validated_data)
+        city_id = viewport.pop("city", None)
+
+        cities = self.request.user.cities.all()
+        if city_id is not None:
+            cities = cities.filter(id=city_id)
+        return clustering.clusters_in_bbox(**viewport, city_ids=cities.values("id"))
+
+
+class PlaceImportView(APIView):
+    """
+    Upload a CSV or GeoJSON file of places to be imported in the background
+    """
+
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    serializer_class = PlaceImportSerializer
+
+    def post(self, request):
+        """
+        Store the upload and queue the import
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        path = store_upload(data["file"])
+        task = import_places.delay(path, data["format"], data["batch_size"])
+
+        return Response(
+            {"task_id": task.id, "file": path}, status=status.HTTP_202_ACCEPTED
+        )
 
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -179,37 +255,14 @@ class PlaceView(APIView):
         """
         Create a new place
         """
-        data = request.data.copy()
-        data["user"] = request.user.id
-        required_fields = ["name", "price"]
-        for field in required_fields:
-            if field not in data:
-                return Response(
-                    {"error": f"{field} is required"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-        try:
-            city = get_object_or_404(City, id=data["city"])
-            location, created = Location.objects.get_or_create(
-                lat=data["latitude"], lng=data["longitude"]
-            )
-            serializer = self.create_serializer_class(
-                data=data, context={"request": request}
-            )
-
-            if serializer.is_valid():
-                place = serializer.save(city=city, location=location)
-
-                return Response(
-                    self.create_serializer_class(place).data,
-                    status=status.HTTP_201_CREATED,
-                )
-
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        place, errors = services.create_place(
+            request.data, context={"request": request}
+        )
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            self.create_serializer_class(place).data, status=status.HTTP_201_CREATED
+        )
 
     def get(self, request, place_id):
         """
@@ -222,10 +275,7 @@ class PlaceView(APIView):
         """
         try:
             place = get_object_or_404(
-                Place.objects.select_related("city", "location").prefetch_related(
-                    "comments", "ratings", "visits"
-                ),
-                id=place_id,
+                Place.objects.select_related("city", "location"), id=place_id
             )
 
             serializer = self.serializer_class(place, context={"request": request})
@@ -238,11 +288,11 @@ class PlaceView(APIView):
                             "text": comment.text,
                             "created_at": comment.created_at,
                         }
-                        for comment in place.comments.all()[:5]
+                        for comment in place.comments.select_related("user")[:5]
                     ],
-                    "total_visits": place.visits.count(),
-                    "total_comments": place.comments.count(),
-                    "total_ratings": place.ratings.count(),
+                    "total_visits": place.total_visits,
+                    "total_comments": place.total_comments,
+                    "total_ratings": place.total_ratings,
                 }
             )
 
@@ -1,3 +1,4 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
@@ -6,27 +7,45 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from luggage import services
 from luggage.models import ChecklistItem, TravelDocument, Trip
 from luggage.serializers import (
+    ChecklistBulkSerializer,
     ChecklistItemSerializer,
     TravelDocumentSerializer,
     TripSerializer,
+    TripSummarySerializer,
 )
+from roadrunner.serializers import query_list, requested_fields
 
 
 class TripViewSet(viewsets.ModelViewSet):
     serializer_class = TripSerializer
     permission_classes = [IsAuthenticated]
+    expandable_relations = {"checklist_items", "documents"}
+
+    def get_serializer_class(self):
+        """
+        List trips as summaries, their relations are fetched on demand.
+        """
+        if self.action == "list":
+            return TripSummarySerializer
+        return TripSerializer
 
     def get_queryset(self):
         """
         Return trips for the currently authenticated user.
         """
-        return (
-            Trip.objects.filter(user=self.request.user)
-            .select_related("destination")
-            .prefetch_related("checklist_items", "documents")
+        trips = Trip.objects.filter(user=self.request.user).select_related(
+            "destination"
         )
+        if self.action != "list":
+            return trips.prefetch_related(*self.expandable_relations)
+
+        expand = query_list(self.request, "expand") or set()
+        return TripSummarySerializer.annotate_queryset(
+            trips, requested_fields(self.request)
+        ).prefetch_related(*sorted(expand & self.expandable_relations))
 
     def perform_create(self, serializer):
         """
@@ -75,33 +94,39 @@ class ChecklistViewSet(viewsets.ModelViewSet):
         """
         Toggle the packed status of an item.
         """
-        item = self.get_object()
-        item.is_packed = not item.is_packed
-        item.save()
+        try:
+            item = services.toggle_packed(request.user, int(pk))
+        except ValueError:
+            item = None
+        if item is None:
+            raise Http404
         serializer = self.get_serializer(item)
         return Response(serializer.data)
 
-    def bulk_update(self, request):
-        """
-        Update multiple checklist items at once.
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
         """
-        items = request.data.get("items", [])
-        if not items:
-            return Response(
-                {"error": "No items provided"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        Create, update and delete checklist items at once.
 
-        updated_items = []
-        for item_data in items:
-            item = get_object_or_404(
-                ChecklistItem, id=item_data.get("id"), trip__user=request.user
-            )
-            serializer = self.get_serializer(item, data=item_data, partial=True)
-            if serializer.is_valid():
-                serializer.save()
-                updated_items.append(serializer.data)
+        Nothing is changed when any entry is invalid, the errors of every
+        entry are returned instead.
+        """
+        serializer = ChecklistBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        return Response(updated_items)
+        result, errors = services.apply_checklist_changes(
+            request.user, **serializer.validated_data
+        )
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "created": self.get_serializer(result["created"], many=True).data,
+                "updated": self.get_serializer(result["updated"], many=True).data,
+                "deleted": result["deleted"],
+            }
+        )
 
 
 class TravelDocumentViewSet(viewsets.ModelViewSet):
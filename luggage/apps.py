@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LuggageConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "luggage"
+
+    def ready(self):
+        import luggage.signals  # noqa: F401
@@ -0,0 +1,112 @@
+"""
+Packing progress counters of trips.
+
+``Trip.items_count`` and ``Trip.packed_count`` are adjusted by the receivers
+in luggage.signals whenever a checklist item is created, deleted or packed,
+and by the bulk changes and toggles of luggage.services, which bypass them.
+Inside ``batched`` the adjustments of many items, e.g. the signals of a
+queryset delete, are summed and applied with one update per trip.
+``reconcile`` recounts the items and repairs any drift, run it with the
+reconcile_trip_counters command.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from luggage.models import ChecklistItem, Trip
+from roadrunner import counters
+
+_batch = ContextVar("trip_counter_deltas", default=None)
+
+
+def adjust(trip_id, items=0, packed=0):
+    """
+    Add deltas to the counters of a trip, or to the current batch. Drifted
+    counters never go below 0.
+    """
+    batch = _batch.get()
+    if batch is not None:
+        batch.trips[trip_id][0] += items
+        batch.trips[trip_id][1] += packed
+        return
+
+    changes = {}
+    if items:
+        changes["items_count"] = Greatest(F("items_count") + items, 0)
+    if packed:
+        changes["packed_count"] = Greatest(F("packed_count") + packed, 0)
+    if changes:
+        Trip.objects.filter(id=trip_id).update(**changes)
+
+
+class Deltas:
+    """
+    Counter deltas of many items, applied with one update per trip
+    """
+
+    def __init__(self):
+        self.trips = defaultdict(lambda: [0, 0])
+
+    def add(self, item, sign=1):
+        self.trips[item.trip_id][0] += sign
+        self.trips[item.trip_id][1] += sign * item.is_packed
+
+    def pack(self, item, is_packed):
+        self.trips[item.trip_id][1] += 1 if is_packed else -1
+
+    def apply(self):
+        for trip_id, (items, packed) in self.trips.items():
+            adjust(trip_id, items, packed)
+
+
+@contextmanager
+def batched(deltas=None):
+    """
+    Collect the adjustments made inside the block into ``deltas`` and apply
+    them when it completes
+    """
+    deltas = deltas or Deltas()
+    token = _batch.set(deltas)
+    try:
+        yield deltas
+    finally:
+        _batch.reset(token)
+    deltas.apply()
+
+
+def _actual_counts():
+    items = ChecklistItem.objects.filter(trip=OuterRef("pk")).order_by().values("trip")
+    return {
+        counter: Coalesce(Subquery(rows.annotate(total=Count("id")).values("total")), 0)
+        for counter, rows in [
+            ("items_count", items),
+            ("packed_count", items.filter(is_packed=True)),
+        ]
+    }
+
+
+def _trips(trip_ids):
+    trips = Trip.objects.all()
+    if trip_ids is not None:
+        trips = trips.filter(id__in=trip_ids)
+    return trips
+
+
+def find_drift(trip_ids=None):
+    """
+    Return the trips whose item or packed counts are off
+    """
+    return counters.find_drift(_trips(trip_ids), _actual_counts()).only("id")
+
+
+def reconcile(trip_ids=None):
+    """
+    Recount the items of drifted trips.
+
+    Returns the number of repaired trips.
+    """
+    return counters.reconcile(_trips(trip_ids).only("id"), _actual_counts())
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from luggage import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify the item and packed counters of trips against their checklist "
+        "items and repair any drift"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drifted trips, do not repair them",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drifted = counters.find_drift().count()
+            style = self.style.WARNING if drifted else self.style.SUCCESS
+            self.stdout.write(style(f"{drifted} trips with drifted counters"))
+            return
+
+        repaired = counters.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Repaired counters of {repaired} trips"))
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    Trip = apps.get_model("luggage", "Trip")
+    ChecklistItem = apps.get_model("luggage", "ChecklistItem")
+
+    totals = (
+        ChecklistItem.objects.values("trip")
+        .annotate(items=Count("id"), packed=Count("id", filter=Q(is_packed=True)))
+        .order_by()
+    )
+    for total in totals.iterator():
+        Trip.objects.filter(id=total["trip"]).update(
+            items_count=total["items"], packed_count=total["packed"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("luggage", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="items_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="packed_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
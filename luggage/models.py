@@ -1,10 +1,11 @@
 from django.db import models
 
 from city.models import City
+from roadrunner.models import TrackedModel
 from user.models import User
 
 
-class Trip(models.Model):
+class Trip(TrackedModel):
     """
     Represents a trip for which the user creates a packing checklist and uploads documents.
     """
@@ -18,11 +19,19 @@ class Trip(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Packing progress, maintained by luggage.counters
+    items_count = models.PositiveIntegerField(default=0)
+    packed_count = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = {"items_count", "packed_count"}
+    # Only written with database-side expressions
+    PROTECTED_FIELDS = COUNTER_FIELDS
+
     def __str__(self):
         return f"{self.name} - {self.destination}"
 
 
-class ChecklistItem(models.Model):
+class ChecklistItem(TrackedModel):
     """
     Represents an item in the packing checklist.
     """
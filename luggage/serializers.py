@@ -1,11 +1,15 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 
 from city.models import City
 from city.serializers import CitySerializer
 from luggage.models import ChecklistItem, TravelDocument, Trip
+from luggage.services import BULK_MAX_ITEMS
+from roadrunner.serializers import SparseFieldsetMixin
 
 
-class ChecklistItemSerializer(serializers.ModelSerializer):
+class ChecklistItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     trip_id = serializers.PrimaryKeyRelatedField(
         queryset=Trip.objects.all(), source="trip", write_only=True
     )
@@ -26,7 +30,29 @@ class ChecklistItemSerializer(serializers.ModelSerializer):
         return value
 
 
-class TravelDocumentSerializer(serializers.ModelSerializer):
+class ChecklistBulkSerializer(serializers.Serializer):
+    """
+    Shape of a bulk change of checklist items, the entries themselves are
+    validated by luggage.services.apply_checklist_changes
+    """
+
+    create = serializers.ListField(
+        child=serializers.JSONField(), required=False, max_length=BULK_MAX_ITEMS
+    )
+    update = serializers.ListField(
+        child=serializers.JSONField(), required=False, max_length=BULK_MAX_ITEMS
+    )
+    delete = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=BULK_MAX_ITEMS
+    )
+
+    def validate(self, data):
+        if not any(data.values()):
+            raise serializers.ValidationError("No changes provided.")
+        return data
+
+
+class TravelDocumentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     trip_id = serializers.PrimaryKeyRelatedField(
         queryset=Trip.objects.all(), source="trip", write_only=True
@@ -54,7 +80,7 @@ class TravelDocumentSerializer(serializers.ModelSerializer):
         return value
 
 
-class TripSerializer(serializers.ModelSerializer):
+class TripSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     checklist_items = ChecklistItemSerializer(many=True, read_only=True)
     documents = TravelDocumentSerializer(many=True, read_only=True)
     destination = CitySerializer(read_only=True)
@@ -72,10 +98,12 @@ class TripSerializer(serializers.ModelSerializer):
             "destination",
             "destination_id",
             "created_at",
+            "items_count",
+            "packed_count",
             "checklist_items",
             "documents",
         ]
-        read_only_fields = ["created_at"]
+        read_only_fields = ["created_at", "items_count", "packed_count"]
 
     def validate(self, data):
         """
@@ -86,3 +114,51 @@ class TripSerializer(serializers.ModelSerializer):
                 {"end_date": "End date must be after start date."}
             )
         return data
+
+
+class TripSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Trip with counts of its items and documents, which are only included with
+    ``?expand=checklist_items,documents``
+    """
+
+    destination = CitySerializer(read_only=True)
+    documents_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Trip
+        fields = [
+            "id",
+            "name",
+            "start_date",
+            "end_date",
+            "destination",
+            "created_at",
+            "items_count",
+            "packed_count",
+            "documents_count",
+        ]
+        read_only_fields = ["created_at", "items_count", "packed_count"]
+        expandable_fields = {
+            "checklist_items": lambda: ChecklistItemSerializer(
+                many=True, read_only=True
+            ),
+            "documents": lambda: TravelDocumentSerializer(many=True, read_only=True),
+        }
+
+    @staticmethod
+    def annotate_queryset(queryset, fields=None):
+        """
+        Count the documents of every trip, unless left out of ``fields``, with
+        a correlated subquery. The item counts are stored on the trip.
+        """
+        if fields is not None and "documents_count" not in fields:
+            return queryset
+        documents = (
+            TravelDocument.objects.filter(trip=OuterRef("pk"))
+            .order_by()
+            .values("trip")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        return queryset.annotate(documents_count=Coalesce(Subquery(documents), 0))
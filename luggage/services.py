@@ -0,0 +1,180 @@
+"""
+Bulk changes of checklist items.
+
+``apply_checklist_changes`` creates, updates and deletes the checklist
+items of a user in one request. Every referenced item and trip is fetched
+with one ownership-checked query. The changes are validated in memory and
+written with ``bulk_create``, ``bulk_update`` and a queryset delete in one
+transaction, only when none of them has errors.
+
+``toggle_packed`` flips the packed state of an item with one conditional
+``UPDATE ... RETURNING``, so concurrent toggles never lose one another.
+
+Both adjust the trip counters of luggage.counters with one update per trip,
+the bulk writes and the toggle bypass the signals keeping them.
+"""
+
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from luggage import counters
+from luggage.models import ChecklistItem, Trip
+
+BULK_MAX_ITEMS = 500
+BULK_FIELDS = ["name", "is_packed"]
+
+
+class ChecklistItemFieldsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChecklistItem
+        fields = BULK_FIELDS
+
+
+def _reference(data, field):
+    """
+    The id a change refers to, None when it is missing or not an integer
+    """
+    if not isinstance(data, dict):
+        return None
+    try:
+        return int(data.get(field))
+    except (TypeError, ValueError):
+        return None
+
+
+def _duplicates(ids):
+    seen, duplicates = set(), set()
+    for id in ids:
+        if id is not None and id in seen:
+            duplicates.add(id)
+        seen.add(id)
+    return duplicates
+
+
+def apply_checklist_changes(user, create=(), update=(), delete=()):
+    """
+    Create items from ``{"trip_id", "name", "is_packed"}`` dictionaries,
+    update items from ``{"id", ...}`` dictionaries and delete items by id.
+
+    Returns a tuple of (result, errors), exactly one of them being None. The
+    errors of every section are a list with the errors of each entry, empty
+    for valid entries, like DRF reports the errors of ``many=True``.
+    """
+    errors = {"create": [], "update": [], "delete": []}
+    for section, changes in (("create", create), ("update", update)):
+        for data in changes:
+            if not isinstance(data, dict):
+                errors[section].append({"non_field_errors": ["Expected an object."]})
+            else:
+                errors[section].append({})
+
+    trip_ids = [_reference(data, "trip_id") for data in create]
+    update_ids = [_reference(data, "id") for data in update]
+    delete_ids = list(delete)
+
+    owned_trips = set(
+        Trip.objects.filter(user=user, id__in=set(trip_ids) - {None}).values_list(
+            "id", flat=True
+        )
+    )
+    items = ChecklistItem.objects.filter(
+        trip__user=user, id__in=set(update_ids + delete_ids) - {None}
+    ).in_bulk()
+
+    new_items = []
+    for index, (data, trip_id) in enumerate(zip(create, trip_ids)):
+        if errors["create"][index]:
+            continue
+        if trip_id not in owned_trips:
+            errors["create"][index]["trip_id"] = ["Trip not found."]
+        serializer = ChecklistItemFieldsSerializer(data=data)
+        if not serializer.is_valid():
+            errors["create"][index].update(serializer.errors)
+        elif not errors["create"][index]:
+            new_items.append(
+                ChecklistItem(trip_id=trip_id, **serializer.validated_data)
+            )
+
+    deltas = counters.Deltas()
+    for item in new_items:
+        deltas.add(item)
+
+    duplicates = _duplicates(update_ids + delete_ids)
+    updated_items = []
+    for index, (data, id) in enumerate(zip(update, update_ids)):
+        if errors["update"][index]:
+            continue
+        if id not in items:
+            errors["update"][index]["id"] = ["Item not found."]
+            continue
+        if id in duplicates:
+            errors["update"][index]["id"] = ["Item is changed more than once."]
+            continue
+        serializer = ChecklistItemFieldsSerializer(items[id], data=data, partial=True)
+        if not serializer.is_valid():
+            errors["update"][index].update(serializer.errors)
+            continue
+        is_packed = serializer.validated_data.get("is_packed", items[id].is_packed)
+        if is_packed != items[id].is_packed:
+            deltas.pack(items[id], is_packed)
+        for field, value in serializer.validated_data.items():
+            setattr(items[id], field, value)
+        updated_items.append(items[id])
+
+    for id in delete_ids:
+        if id not in items:
+            errors["delete"].append(["Item not found."])
+        elif id in duplicates:
+            errors["delete"].append(["Item is changed more than once."])
+        else:
+            errors["delete"].append([])
+
+    if any(any(entries) for entries in errors.values()):
+        return None, {
+            section: entries for section, entries in errors.items() if any(entries)
+        }
+
+    # The post_delete signals of the deleted items add to the deltas
+    with transaction.atomic(), counters.batched(deltas):
+        ChecklistItem.objects.bulk_create(new_items)
+        ChecklistItem.objects.bulk_update(updated_items, BULK_FIELDS)
+        ChecklistItem.objects.filter(id__in=delete_ids).delete()
+
+    return {
+        "created": new_items,
+        "updated": updated_items,
+        "deleted": delete_ids,
+    }, None
+
+
+def _toggle_sql():
+    quote = connection.ops.quote_name
+    items = quote(ChecklistItem._meta.db_table)
+    trips = quote(Trip._meta.db_table)
+    return (
+        f"UPDATE {items} SET {quote('is_packed')} = NOT {quote('is_packed')} "
+        f"WHERE {quote('id')} = %s AND {quote('trip_id')} IN "
+        f"(SELECT {quote('id')} FROM {trips} WHERE {quote('user_id')} = %s) "
+        f"RETURNING {quote('trip_id')}, {quote('name')}, {quote('is_packed')}"
+    )
+
+
+def toggle_packed(user, item_id):
+    """
+    Flip the packed state of an item of the user in the database.
+
+    Returns the item with its new state, None when the user has no such item.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_toggle_sql(), [item_id, user.id])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+
+        trip_id, name, is_packed = row
+        item = ChecklistItem(
+            id=item_id, trip_id=trip_id, name=name, is_packed=bool(is_packed)
+        )
+        counters.adjust(trip_id, packed=1 if item.is_packed else -1)
+    return item
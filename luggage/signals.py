@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from luggage import counters
+from luggage.models import ChecklistItem
+
+
+@receiver(post_save, sender=ChecklistItem)
+def count_saved_item(sender, instance, created, raw=False, **kwargs):
+    """
+    Count a new item on its trip, or move a changed one's packed state or
+    trip between the counters
+    """
+    if raw:
+        return
+
+    loaded = getattr(instance, "_loaded_values", {})
+    if created:
+        counters.adjust(instance.trip_id, 1, int(instance.is_packed))
+    elif "trip_id" not in loaded or "is_packed" not in loaded:
+        return
+    elif loaded["trip_id"] != instance.trip_id:
+        counters.adjust(loaded["trip_id"], -1, -int(loaded["is_packed"]))
+        counters.adjust(instance.trip_id, 1, int(instance.is_packed))
+    elif loaded["is_packed"] != instance.is_packed:
+        counters.adjust(instance.trip_id, packed=1 if instance.is_packed else -1)
+
+    # Saving the instance again only counts the changes made since
+    instance._loaded_values = {
+        **loaded,
+        "trip_id": instance.trip_id,
+        "is_packed": instance.is_packed,
+    }
+
+
+@receiver(post_delete, sender=ChecklistItem)
+def uncount_deleted_item(sender, instance, **kwargs):
+    """
+    Take a deleted item off its trip's counters
+    """
+    counters.adjust(instance.trip_id, -1, -int(instance.is_packed))
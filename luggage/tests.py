@@ -1,3 +1,281 @@
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from city.models import City
+from luggage import counters
+from luggage.api_views import ChecklistViewSet, TripViewSet
+from luggage.models import ChecklistItem, TravelDocument, Trip
+from user.models import User
+
+
+class TripListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        city = City.objects.create(name="Tbilisi")
+        for number in range(3):
+            trip = Trip.objects.create(
+                name=f"Trip {number}",
+                user=cls.user,
+                start_date=date(2025, 5, 1),
+                end_date=date(2025, 5, 10),
+                destination=city,
+            )
+            ChecklistItem.objects.bulk_create(
+                ChecklistItem(trip=trip, name=f"Item {item}", is_packed=item < number)
+                for item in range(4)
+            )
+            TravelDocument.objects.create(
+                trip=trip,
+                user=cls.user,
+                name="Passport",
+                file="travel_documents/passport.pdf",
+            )
+        # bulk_create skips the signals keeping the item counters
+        counters.reconcile()
+
+    def list_trips(self, **params):
+        request = APIRequestFactory().get("/api/trip/", params)
+        force_authenticate(request, user=self.user)
+        response = TripViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        return sorted(response.data, key=lambda trip: trip["name"])
+
+    def test_list_returns_counts_instead_of_relations(self):
+        with self.assertNumQueries(1):
+            trips = self.list_trips()
+
+        self.assertEqual(
+            [
+                (trip["items_count"], trip["packed_count"], trip["documents_count"])
+                for trip in trips
+            ],
+            [(4, 0, 1), (4, 1, 1), (4, 2, 1)],
+        )
+        self.assertNotIn("checklist_items", trips[0])
+        self.assertNotIn("documents", trips[0])
+
+    def test_sparse_fieldsets(self):
+        trips = self.list_trips(fields="name,packed_count")
+        self.assertEqual(trips[1], {"name": "Trip 1", "packed_count": 1})
+
+        with self.assertNumQueries(2):
+            trips = self.list_trips(fields="name", expand="checklist_items")
+        self.assertEqual(set(trips[0]), {"name", "checklist_items"})
+        self.assertEqual(len(trips[0]["checklist_items"]), 4)
+
+
+class ChecklistBulkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="password"
+        )
+        city = City.objects.create(name="Tbilisi")
+        cls.trip, cls.other_trip = (
+            Trip.objects.create(
+                name="Trip",
+                user=user,
+                start_date=date(2025, 5, 1),
+                end_date=date(2025, 5, 10),
+                destination=city,
+            )
+            for user in (cls.user, other)
+        )
+        cls.items = ChecklistItem.objects.bulk_create(
+            ChecklistItem(trip=cls.trip, name=f"Item {number}") for number in range(5)
+        )
+        cls.other_item = ChecklistItem.objects.create(trip=cls.other_trip, name="Other")
+
+    def bulk(self, data):
+        request = APIRequestFactory().post("/api/checklist/bulk/", data, format="json")
+        force_authenticate(request, user=self.user)
+        return ChecklistViewSet.as_view({"post": "bulk"})(request)
+
+    def test_changes_are_applied_with_bulk_queries(self):
+        data = {
+            "create": [{"trip_id": self.trip.id, "name": "Passport"}],
+            "update": [{"id": item.id, "is_packed": True} for item in self.items[:3]],
+            "delete": [self.items[4].id],
+        }
+        # Items, trips, then create, update, the items to delete, delete and the
+        # trip counters in a transaction
+        with self.assertNumQueries(9):
+            response = self.bulk(data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"][0]["name"], "Passport")
+        self.assertEqual(len(response.data["updated"]), 3)
+        self.assertEqual(response.data["deleted"], [self.items[4].id])
+        self.assertEqual(
+            dict(self.trip.checklist_items.values_list("name", "is_packed")),
+            {
+                "Item 0": True,
+                "Item 1": True,
+                "Item 2": True,
+                "Item 3": False,
+                "Passport": False,
+            },
+        )
+
+    def test_invalid_entries_are_reported_and_nothing_is_changed(self):
+        response = self.bulk(
+            {
+                "create": [
+                    {"trip_id": self.other_trip.id, "name": "Passport"},
+                    {"trip_id": self.trip.id, "name": "Tickets"},
+                ],
+                "update": [
+                    {"id": self.items[0].id, "name": "x" * 101},
+                    {"id": self.other_item.id, "is_packed": True},
+                ],
+                "delete": [self.items[1].id],
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"create", "update"})
+        self.assertEqual(response.data["create"][0], {"trip_id": ["Trip not found."]})
+        self.assertEqual(response.data["create"][1], {})
+        self.assertIn("name", response.data["update"][0])
+        self.assertEqual(response.data["update"][1], {"id": ["Item not found."]})
+        self.assertEqual(self.trip.checklist_items.count(), 5)
+        self.assertFalse(ChecklistItem.objects.filter(is_packed=True).exists())
+
+
+class PackingProgressTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        cls.trip = Trip.objects.create(
+            name="Trip",
+            user=cls.user,
+            start_date=date(2025, 5, 1),
+            end_date=date(2025, 5, 10),
+            destination=City.objects.create(name="Tbilisi"),
+        )
+
+    def counts(self):
+        self.trip.refresh_from_db()
+        return self.trip.items_count, self.trip.packed_count
+
+    def toggle(self, item, user=None):
+        request = APIRequestFactory().patch(f"/api/checklist/{item.id}/toggle_packed/")
+        force_authenticate(request, user=user or self.user)
+        return ChecklistViewSet.as_view({"patch": "toggle_packed"})(
+            request, pk=str(item.id)
+        )
+
+    def test_toggle_is_one_conditional_update(self):
+        item = ChecklistItem.objects.create(trip=self.trip, name="Passport")
+
+        # The toggle and the counter update in a transaction
+        with self.assertNumQueries(4):
+            response = self.toggle(item)
+        self.assertEqual(
+            response.data, {"id": item.id, "name": "Passport", "is_packed": True}
+        )
+        self.assertEqual(self.counts(), (1, 1))
+
+        self.assertFalse(self.toggle(item).data["is_packed"])
+        self.assertEqual(self.counts(), (1, 0))
+
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="password"
+        )
+        self.assertEqual(self.toggle(item, other).status_code, 404)
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_counters_follow_item_changes(self):
+        item = ChecklistItem.objects.create(trip=self.trip, name="Passport")
+        ChecklistItem.objects.create(trip=self.trip, name="Tickets", is_packed=True)
+        self.assertEqual(self.counts(), (2, 1))
+
+        item.is_packed = True
+        item.save()
+        self.assertEqual(self.counts(), (2, 2))
+
+        # A stale trip doesn't overwrite the counters
+        stale = Trip.objects.get(id=self.trip.id)
+        item.delete()
+        stale.name = "Renamed"
+        stale.save()
+        self.assertEqual(self.counts(), (1, 1))
+
+        request = APIRequestFactory().post(
+            "/api/checklist/bulk/",
+            {
+                "create": [{"trip_id": self.trip.id, "name": "Adapter"}],
+                "update": [{"id": ChecklistItem.objects.get().id, "is_packed": False}],
+            },
+            format="json",
+        )
+        force_authenticate(request, user=self.user)
+        ChecklistViewSet.as_view({"post": "bulk"})(request)
+        self.assertEqual(self.counts(), (2, 0))
+
+        Trip.objects.update(items_count=10)
+        self.assertEqual(counters.reconcile(), 1)
+        self.assertEqual(self.counts(), (2, 0))
+
+    def test_command_reports_and_repairs_drift(self):
+        ChecklistItem.objects.create(trip=self.trip, name="Passport", is_packed=True)
+        Trip.objects.update(packed_count=0)
+
+        output = StringIO()
+        call_command("reconcile_trip_counters", "--check", stdout=output)
+        self.assertIn("1 trips with drifted counters", output.getvalue())
+        self.assertEqual(self.counts(), (1, 0))
+
+        call_command("reconcile_trip_counters", stdout=StringIO())
+        self.assertEqual(self.counts(), (1, 1))
+
+    def test_bulk_deletes_are_counted_once(self):
+        items = [
+            ChecklistItem.objects.create(trip=self.trip, name=name, is_packed=packed)
+            for name, packed in [("Passport", True), ("Tickets", False), ("Map", True)]
+        ]
+        request = APIRequestFactory().post(
+            "/api/checklist/bulk/",
+            {
+                "create": [{"trip_id": self.trip.id, "name": "Adapter"}],
+                "delete": [items[0].id, items[1].id],
+            },
+            format="json",
+        )
+        force_authenticate(request, user=self.user)
+        # One update of the counters, for the created and the deleted items
+        with CaptureQueriesContext(connection) as queries:
+            ChecklistViewSet.as_view({"post": "bulk"})(request)
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(f'UPDATE "{Trip._meta.db_table}"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.counts(), (2, 1))
+
+    def test_drifted_counters_do_not_go_below_zero(self):
+        item = ChecklistItem.objects.create(
+            trip=self.trip, name="Passport", is_packed=True
+        )
+        Trip.objects.update(items_count=0, packed_count=0)
+
+        self.assertEqual(self.toggle(item).status_code, 200)
+        self.assertEqual(self.counts(), (0, 0))
 
-# Create your tests here.
+        item.delete()
+        self.assertEqual(self.counts(), (0, 0))
@@ -1,18 +1,59 @@
-from django.core.cache import cache
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from city import services
 from city.models import City, Place
-from map.forms import CitySearchForm
+from user.models import User
 
 
-@receiver([post_save, post_delete], sender=City)
-@receiver([post_save, post_delete], sender=Place)
-def invalidate_city_choices_cache(sender, instance, **kwargs):
-    if isinstance(instance, Place):
-        user_id = instance.city.user_id
-    else:  # City
-        user_id = instance.user_id
+@receiver(m2m_changed, sender=User.cities.through)
+def invalidate_user_city_choices(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drop the cached city choices of users whose cities were added, removed
+    or cleared, from either side of the relation
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            services.invalidate_city_choices([instance.pk])
+    elif action == "pre_clear":
+        # The users of a cleared city are gone after the clear
+        instance._cleared_user_ids = services.city_followers([instance.pk])
+    elif action == "post_clear":
+        services.invalidate_city_choices(getattr(instance, "_cleared_user_ids", ()))
+    elif action in ("post_add", "post_remove"):
+        services.invalidate_city_choices(pk_set)
 
-    cache_key = CitySearchForm.CACHE_KEY.format(user_id=user_id)
-    cache.delete(cache_key)
+
+@receiver(post_save, sender=Place)
+def invalidate_place_city_choices(sender, instance, created, raw=False, **kwargs):
+    """
+    Place counts are part of the choices, refresh them for the users of the
+    city a place was added to or moved between
+    """
+    if raw:
+        return
+
+    loaded = getattr(instance, "_loaded_values", {})
+    old_city_id = loaded.get("city_id", instance.city_id)
+    if created:
+        services.invalidate_city_followers([instance.city_id])
+    elif old_city_id != instance.city_id:
+        services.invalidate_city_followers([old_city_id, instance.city_id])
+    instance._loaded_values = {**loaded, "city_id": instance.city_id}
+
+
+@receiver(post_delete, sender=Place)
+def invalidate_deleted_place_city_choices(sender, instance, **kwargs):
+    services.invalidate_city_followers([instance.city_id])
+
+
+@receiver(post_save, sender=City)
+def invalidate_renamed_city_choices(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        services.invalidate_city_followers([instance.pk])
+
+
+@receiver(pre_delete, sender=City)
+def invalidate_deleted_city_choices(sender, instance, **kwargs):
+    # The user relations are deleted before post_delete is sent
+    services.invalidate_city_followers([instance.pk])
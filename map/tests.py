@@ -1,3 +1,112 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from city.models import City, Location, Place
+from map.middleware import SESSION_REFRESHED_KEY
+from user.models import User
+from user.tasks import purge_expired_sessions
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CityChoicesCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.city = City.objects.create(name="Tbilisi")
+        self.user.cities.add(self.city)
+        self.client.post("/login/", {"username": "traveler", "password": "password"})
+
+    def city_choices(self):
+        response = self.client.get("/map/")
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["form"].fields["city"].choices)
+
+    def city_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            choices = self.city_choices()
+        queries = [query["sql"] for query in context if "city_city" in query["sql"]]
+        return choices, queries
+
+    def add_place(self, city):
+        return Place.objects.create(
+            name="Narikala",
+            city=city,
+            location=Location.objects.resolve(lat=41.69, lng=44.81),
+            price=0,
+        )
+
+    def test_warm_map_page_runs_no_city_queries(self):
+        choices, queries = self.city_queries()
+        self.assertEqual(choices, [(self.city.id, "Tbilisi (0 places)")])
+        self.assertEqual(len(queries), 1)
+
+        choices, queries = self.city_queries()
+        self.assertEqual(choices, [(self.city.id, "Tbilisi (0 places)")])
+        self.assertEqual(queries, [])
+
+    def test_user_cities_changes_invalidate_choices(self):
+        self.city_choices()
+        batumi = City.objects.create(name="Batumi")
+
+        self.user.cities.add(batumi)
+        self.assertEqual(
+            self.city_choices(),
+            [(batumi.id, "Batumi (0 places)"), (self.city.id, "Tbilisi (0 places)")],
+        )
+
+        batumi.user_set.remove(self.user)
+        self.assertEqual(self.city_choices(), [(self.city.id, "Tbilisi (0 places)")])
+
+        self.city.user_set.clear()
+        self.assertEqual(self.city_choices(), [])
+
+    def test_places_invalidate_choices_of_every_city_user(self):
+        self.city_choices()
+
+        place = self.add_place(self.city)
+        self.assertEqual(self.city_choices(), [(self.city.id, "Tbilisi (1 places)")])
+
+        place.delete()
+        self.assertEqual(self.city_choices(), [(self.city.id, "Tbilisi (0 places)")])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class SessionWritesTest(TestCase):
+    def setUp(self):
+        User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.client.post("/login/", {"username": "traveler", "password": "password"})
+
+    def session_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get("/map/").status_code, 200)
+        return [query["sql"] for query in context if "django_session" in query["sql"]]
+
+    def test_warm_requests_do_not_touch_the_session_table(self):
+        self.session_queries()
+        self.assertEqual(self.session_queries(), [])
+
+    def test_session_is_saved_once_past_the_refresh_threshold(self):
+        refreshed_at = self.client.session[SESSION_REFRESHED_KEY]
+        with mock.patch("map.middleware.time.time", return_value=refreshed_at + 3000):
+            self.assertNotEqual(self.session_queries(), [])
+        self.assertEqual(
+            self.client.session[SESSION_REFRESHED_KEY], refreshed_at + 3000
+        )
+
+    def test_purge_expired_sessions(self):
+        Session.objects.update(expire_date=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired_sessions(batch_size=1), 1)
+        self.assertFalse(Session.objects.exists())
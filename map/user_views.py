@@ -1,15 +1,16 @@
 from django.shortcuts import render, redirect
 from django.views import View
 from django.views.generic import TemplateView
-import requests
 from django.contrib import messages
 from map.forms import LoginForm
-from user.models import User
+from map.middleware import refresh_session
+from user.service import UserLoginService
 
 
 class LoginView(View):
     template_name = 'login.html'
     home_page = 'city.html'
+    login_service = UserLoginService()
 
     def get(self, request):
         form = LoginForm()
@@ -21,24 +22,13 @@ class LoginView(View):
             username = form.cleaned_data['username']
             password = form.cleaned_data['password']
 
-            response = requests.post(
-                'http://127.0.0.1:8000/api/login/',
-                data={
-                    'identifier': username,
-                    'password': password
-                }
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                print("Login response:", data)
-                token = data["tokens"]["access"]
-                if token:
-                    request.session['access_token'] = token
-                    return redirect('traveler:map')
-            else:
-                print("Login failed:", response.text)  # Debug login failure
-                messages.error(request, 'Invalid credentials')
+            user = self.login_service.authenticate(username, password)
+            if user is not None:
+                tokens = self.login_service.get_tokens(user)
+                request.session['access_token'] = tokens['access']
+                refresh_session(request.session)
+                return redirect('traveler:map')
+            messages.error(request, 'Invalid credentials')
 
         return render(request, self.template_name, {'form': form})
 
@@ -1,10 +1,11 @@
-import requests
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Count
 from django.http import HttpResponse
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
+from city import services
+
 from .Mixin import JWTLoginRequiredMixin
 from .forms import CitySearchForm, LocationForm
 
@@ -13,32 +14,17 @@ class PlaceView(TemplateView):
     template_name = "place.html"
 
     def post(self, request):
-        data = {
-            "name": request.POST.get("name"),
-            "city": request.POST.get("city"),
-            "price": request.POST.get("price"),
-            "description": request.POST.get("description"),
-            "latitude": request.POST.get("latitude"),
-            "longitude": request.POST.get("longitude"),
-            "user": request.user.id,
-        }
-        files = {"photo": request.FILES.get("photo")}
-        api_url = "http://127.0.0.1:8000/api/places/"
-        try:
-            response = requests.post(api_url, data=data, files=files)
-            if response.status_code == 201:
-
-                return render(
-                    request,
-                    self.template_name,
-                    {"success": "Place added successfully!"},
-                )
-            else:
-                print(response.json())
-                return render(request, self.template_name, {"error": response.json()})
-        except Exception as e:
-            print(str(e))
-            return render(request, self.template_name, {"error": str(e)})
+        fields = ["name", "city", "price", "description", "latitude", "longitude"]
+        data = {field: request.POST[field] for field in fields if field in request.POST}
+        if request.FILES.get("photo"):
+            data["photo"] = request.FILES["photo"]
+
+        _, errors = services.create_place(data, context={"request": request})
+        if errors:
+            return render(request, self.template_name, {"error": errors})
+        return render(
+            request, self.template_name, {"success": "Place added successfully!"}
+        )
 
 
 class MapView(JWTLoginRequiredMixin, TemplateView):
@@ -0,0 +1,181 @@
+"""
+Cached JWT authentication.
+
+Verified access token claims are kept in a bounded in-process LRU keyed by
+a hash of the token until the token's ``exp``, so a token's signature is
+checked once per process instead of on every request. Both the map
+frontend's middleware and ``CachedJWTAuthentication`` share it.
+
+``CachedJWTAuthentication`` can also keep a snapshot of the authenticated
+user in the cache for ``AUTH_USER_CACHE_TIMEOUT`` seconds, so warm requests
+don't load the user from the database either. The snapshot is dropped when
+the user is saved or deleted, when new profile photo variants are stored and
+when the user logs out.
+
+Refresh tokens are checked against the blacklist through the cache as well.
+Whether a token is revoked is cached until the token expires, and set when
+a token is blacklisted, so a refresh or logout only queries the blacklist
+for tokens it hasn't seen yet.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import serializers, tokens
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+USER_CACHE_KEY = "auth:user:{}"
+REVOKED_CACHE_KEY = "auth:revoked:{}"
+
+
+def token_key(token):
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).hexdigest()
+
+
+class TokenClaimsCache:
+    """
+    Thread-safe LRU of verified token claims, entries expire with the token
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        key = token_key(token)
+        with self.lock:
+            claims = self.entries.get(key)
+            if claims is None:
+                return None
+            if claims.get("exp", 0) <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return claims
+
+    def set(self, token, claims):
+        key = token_key(token)
+        with self.lock:
+            self.entries[key] = claims
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, token):
+        with self.lock:
+            self.entries.pop(token_key(token), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+claims_cache = TokenClaimsCache(getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 1024))
+
+
+def decode_token(token):
+    """
+    Claims of a signed access token, verified once and then cached.
+
+    Raises the exceptions of ``jwt.decode`` for invalid or expired tokens.
+    """
+    claims = claims_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(
+            token, api_settings.SIGNING_KEY, algorithms=[api_settings.ALGORITHM]
+        )
+        claims_cache.set(token, claims)
+    return claims
+
+
+def invalidate_user(user_id):
+    cache.delete(USER_CACHE_KEY.format(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication verifying every token once per process and serving
+    users from a cached snapshot
+    """
+
+    def get_validated_token(self, raw_token):
+        raw_token = raw_token.decode() if isinstance(raw_token, bytes) else raw_token
+        claims = claims_cache.get(raw_token)
+        if claims is not None and claims.get(api_settings.TOKEN_TYPE_CLAIM) == "access":
+            # Verified before, only parsed again
+            return AccessToken(raw_token, verify=False)
+
+        validated_token = super().get_validated_token(raw_token)
+        if validated_token.get(api_settings.TOKEN_TYPE_CLAIM) == "access":
+            claims_cache.set(raw_token, dict(validated_token.payload))
+        return validated_token
+
+    def get_user(self, validated_token):
+        timeout = getattr(settings, "AUTH_USER_CACHE_TIMEOUT", None)
+        if not timeout:
+            return super().get_user(validated_token)
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        key = USER_CACHE_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, timeout)
+        elif not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+def seconds_until(exp):
+    """
+    Seconds until a token's ``exp``, a timestamp or an aware datetime
+    """
+    if isinstance(exp, datetime):
+        exp = exp.timestamp()
+    return max(int(exp - datetime.now(timezone.utc).timestamp()), 1)
+
+
+def is_revoked(jti, exp):
+    """
+    Whether the token with the ``jti`` is blacklisted, cached until ``exp``
+    """
+    key = REVOKED_CACHE_KEY.format(jti)
+    revoked = cache.get(key)
+    if revoked is None:
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        # add, not set, so that a token blacklisted meanwhile stays revoked
+        cache.add(key, revoked, seconds_until(exp))
+    return revoked
+
+
+def mark_revoked(jti, exp):
+    cache.set(REVOKED_CACHE_KEY.format(jti), True, seconds_until(exp))
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    RefreshToken checking the blacklist through the cache
+    """
+
+    def check_blacklist(self):
+        payload = self.payload
+        if is_revoked(payload[api_settings.JTI_CLAIM], payload["exp"]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
@@ -0,0 +1,158 @@
+"""
+Publish/subscribe channel layers for pushing events to connected clients.
+
+Messages are JSON serializable dictionaries published to named groups, e.g.
+``notifications.<user id>``. Publishing is synchronous so it can be done from
+views, signal receivers and Celery tasks, subscribing is asynchronous and
+meant for long-lived ASGI responses.
+
+The layer is configured with ``NOTIFICATION_CHANNEL_LAYER``:
+
+    NOTIFICATION_CHANNEL_LAYER = {
+        "BACKEND": "roadrunner.channel_layers.RedisChannelLayer",
+        "OPTIONS": {"url": "redis://127.0.0.1:6379/2"},
+    }
+
+``InMemoryChannelLayer`` only reaches subscribers of the publishing process,
+it suits single process deployments and tests. ``RedisChannelLayer`` uses
+Redis pub/sub and reaches every web process, also from Celery workers.
+"""
+
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+DEFAULT_LAYER = {"BACKEND": "roadrunner.channel_layers.InMemoryChannelLayer"}
+
+
+class BaseChannelLayer:
+    def publish(self, group, message):
+        raise NotImplementedError
+
+    async def subscribe(self, group):
+        """
+        Start receiving the messages of a group, returns a subscription
+        """
+        raise NotImplementedError
+
+
+class InMemorySubscription:
+    def __init__(self, layer, group, capacity):
+        self.layer = layer
+        self.group = group
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=capacity)
+
+    def put(self, message):
+        # A subscriber too slow to keep up loses messages rather than
+        # growing without bound
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+    async def receive(self, timeout=None):
+        """
+        Next message, None if none arrived within ``timeout`` seconds
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.layer.unsubscribe(self)
+
+
+class InMemoryChannelLayer(BaseChannelLayer):
+    """
+    Channel layer of the current process. Publishing may happen from any
+    thread, messages are handed to the event loops of the subscribers.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def publish(self, group, message):
+        with self.lock:
+            subscriptions = list(self.groups.get(group, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.put, message)
+
+    async def subscribe(self, group):
+        subscription = InMemorySubscription(self, group, self.capacity)
+        with self.lock:
+            self.groups.setdefault(group, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.groups.get(subscription.group, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.groups.pop(subscription.group, None)
+
+
+class RedisSubscription:
+    def __init__(self, client, pubsub):
+        self.client = client
+        self.pubsub = pubsub
+
+    async def receive(self, timeout=None):
+        message = await self.pubsub.get_message(
+            ignore_subscribe_messages=True, timeout=timeout
+        )
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisChannelLayer(BaseChannelLayer):
+    """
+    Channel layer on Redis pub/sub, needs the ``redis`` package
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", prefix="roadrunner"):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured("RedisChannelLayer requires the redis package")
+        self.redis = redis
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    def channel(self, group):
+        return f"{self.prefix}:{group}"
+
+    @property
+    def client(self):
+        # One connection pool per process, shared by all publishers
+        if self._client is None:
+            self._client = self.redis.Redis.from_url(self.url)
+        return self._client
+
+    def publish(self, group, message):
+        self.client.publish(self.channel(group), json.dumps(message))
+
+    async def subscribe(self, group):
+        client = self.redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.channel(group))
+        return RedisSubscription(client, pubsub)
+
+
+@lru_cache(maxsize=None)
+def get_channel_layer():
+    config = getattr(settings, "NOTIFICATION_CHANNEL_LAYER", DEFAULT_LAYER)
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
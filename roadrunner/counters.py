@@ -0,0 +1,49 @@
+"""
+Verification of denormalized counters.
+
+A model keeping counters of its related rows describes them as a mapping of
+counter field names to expressions computing their actual value, e.g.
+``{"items_count": Coalesce(Subquery(...), 0)}``. ``find_drift`` compares
+them in one query and ``reconcile`` rewrites the drifted rows.
+"""
+
+from django.db import transaction
+from django.db.models import F, Q
+
+
+def _actual(counters):
+    return {f"actual_{name}": expression for name, expression in counters.items()}
+
+
+def find_drift(queryset, counters):
+    """
+    Return the rows of the queryset whose stored counters disagree with their
+    actual values
+    """
+    drifted = Q()
+    for name in counters:
+        drifted |= ~Q(**{name: F(f"actual_{name}")})
+    return queryset.annotate(**_actual(counters)).filter(drifted)
+
+
+def reconcile(queryset, counters, derive=None):
+    """
+    Rewrite the counters of the drifted rows with their actual values, each
+    row locked while it is recomputed. ``derive(row, values)`` may return
+    more fields to update, computed from the locked row and its new counters.
+
+    Returns the number of repaired rows.
+    """
+    repaired = 0
+    drifted = find_drift(queryset, counters).values_list("pk", flat=True)
+    for pk in drifted.iterator():
+        with transaction.atomic():
+            row = (
+                queryset.select_for_update().annotate(**_actual(counters)).get(pk=pk)
+            )
+            values = {name: getattr(row, f"actual_{name}") for name in counters}
+            if derive is not None:
+                values.update(derive(row, values))
+            queryset.model.objects.filter(pk=pk).update(**values)
+        repaired += 1
+    return repaired
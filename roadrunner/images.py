@@ -0,0 +1,153 @@
+"""
+Resized variants of uploaded photos.
+
+Originals are kept untouched, every variant in ``VARIANTS`` is a copy fitted
+into a fixed square box and encoded as JPEG and WebP. Variants are generated
+in the background after an upload and their storage paths are stored in a
+JSON field next to the image field, e.g. ``Place.photo_variants``:
+
+    {"thumbnail": "variants/places_photo/tower_thumbnail.jpg",
+     "thumbnail_webp": "variants/places_photo/tower_thumbnail.webp", ...}
+
+The paths are written with queryset updates, which send no ``post_save``,
+``variants_stored`` is sent instead for caches of the instances.
+"""
+
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+VARIANTS = {
+    "thumbnail": 200,
+    "large": 1200,
+}
+
+FORMATS = {
+    "": ("JPEG", "jpg", {"quality": 85, "optimize": True, "progressive": True}),
+    "_webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+}
+
+VARIANTS_DIR = "variants"
+
+# Sent with the instance and its new variants once they are stored
+variants_stored = Signal()
+
+
+def variant_path(name, variant, extension):
+    stem, _ = os.path.splitext(name)
+    return f"{VARIANTS_DIR}/{stem}_{variant}.{extension}"
+
+
+def render(image, size, image_format, options):
+    """
+    Fit an image into a ``size`` square and encode it
+    """
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if image_format == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    output = io.BytesIO()
+    variant.save(output, image_format, **options)
+    return output.getvalue()
+
+
+def generate_variants(field_file, storage=default_storage):
+    """
+    Write every variant of an image file, returns their storage paths
+    """
+    with field_file.open("rb") as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    variants = {}
+    for variant, size in VARIANTS.items():
+        for suffix, (image_format, extension, options) in FORMATS.items():
+            path = variant_path(field_file.name, variant, extension)
+            if storage.exists(path):
+                storage.delete(path)
+            content = render(image, size, image_format, options)
+            variants[variant + suffix] = storage.save(path, ContentFile(content))
+    return variants
+
+
+def delete_variants(variants, storage=default_storage):
+    for path in (variants or {}).values():
+        storage.delete(path)
+
+
+def image_saved(instance, image_field, variants_field, task):
+    """
+    Handle a saved instance whose image may have changed: the variants of the
+    previous image are dropped and ``task`` is queued with the instance pk to
+    generate the new ones once the transaction commits
+    """
+    if image_field in instance.get_deferred_fields():
+        return
+
+    loaded = getattr(instance, "_loaded_values", {})
+    name = getattr(instance, image_field).name or ""
+    if (loaded.get(image_field) or "") == name:
+        return
+
+    old_variants = loaded.get(variants_field) or {}
+    if old_variants:
+        transaction.on_commit(lambda: delete_variants(old_variants))
+        type(instance).objects.filter(pk=instance.pk).update(**{variants_field: {}})
+        setattr(instance, variants_field, {})
+    if name:
+        transaction.on_commit(lambda: task.delay(instance.pk))
+
+    instance._loaded_values = {**loaded, image_field: name, variants_field: {}}
+
+
+def refresh_variants(instance, image_field, variants_field):
+    """
+    Regenerate the variants of an instance's image and store their paths.
+
+    The paths are only written if the image did not change meanwhile, a newer
+    upload queues its own refresh.
+    """
+    field_file = getattr(instance, image_field)
+    model = type(instance)
+    current = model.objects.filter(pk=instance.pk, **{image_field: field_file.name})
+
+    delete_variants(getattr(instance, variants_field))
+    variants = generate_variants(field_file) if field_file else {}
+    if not current.update(**{variants_field: variants}):
+        delete_variants(variants)
+    else:
+        variants_stored.send(sender=model, instance=instance, variants=variants)
+    return variants
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Serializes stored variant paths as URLs, absolute when the request is
+    available like DRF's ImageField
+    """
+
+    def to_representation(self, value):
+        request = self.context.get("request")
+        urls = {}
+        for variant, path in (value or {}).items():
+            url = default_storage.url(path)
+            urls[variant] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+def variant_url(field_file, variants, variant="thumbnail"):
+    """
+    URL of a variant of an image, falling back to the original until the
+    variants are generated
+    """
+    if variants and variant in variants:
+        return default_storage.url(variants[variant])
+    return field_file.url
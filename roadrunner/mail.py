@@ -0,0 +1,114 @@
+"""
+Batched email delivery.
+
+``BatchEmailSender`` queues messages and sends them in batches, each over a
+single connection of the configured email backend, instead of opening a
+connection per message like ``send_mail``. A message that fails does not
+abort its batch, the batch goes on over a new connection and the message is
+reported back so that only failed messages are retried.
+
+Templated emails are rendered per recipient from ``<prefix>_subject.txt``,
+``<prefix>.txt`` and, when it exists, ``<prefix>.html``, with a shared context
+merged with the recipient's own context.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class BatchEmailSender:
+    """
+    Queue of messages sent ``batch_size`` at a time over one connection
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, backend=None):
+        self.batch_size = batch_size
+        self.backend = backend
+        self.queue = []
+
+    def add(self, message):
+        self.queue.append(message)
+
+    def add_templated(self, template_prefix, recipients, context=None):
+        """
+        Queue one rendered message per recipient. ``recipients`` are
+        dictionaries with an ``email`` and an optional ``context``.
+        """
+        templates = load_templates(template_prefix)
+        for recipient in recipients:
+            self.add(
+                render_message(
+                    templates, recipient["email"], recipient.get("context"), context
+                )
+            )
+
+    def send(self):
+        """
+        Send and empty the queue, returns the messages that failed
+        """
+        failed = []
+        queue, self.queue = self.queue, []
+        for start in range(0, len(queue), self.batch_size):
+            failed += self.send_batch(queue[start : start + self.batch_size])
+        return failed
+
+    def send_batch(self, messages):
+        connection = get_connection(backend=self.backend, fail_silently=False)
+        failed = []
+        try:
+            connection.open()
+            for index, message in enumerate(messages):
+                message.connection = connection
+                try:
+                    connection.send_messages([message])
+                except Exception:
+                    logger.warning(
+                        "Sending email to %s failed", message.to, exc_info=True
+                    )
+                    failed.append(message)
+                    # The connection may be unusable, the rest of the batch
+                    # goes over a new one
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        logger.warning("Reconnecting failed", exc_info=True)
+                        failed += messages[index + 1 :]
+                        break
+        finally:
+            connection.close()
+        return failed
+
+
+def load_templates(template_prefix):
+    try:
+        html = get_template(f"{template_prefix}.html")
+    except TemplateDoesNotExist:
+        html = None
+    return (
+        get_template(f"{template_prefix}_subject.txt"),
+        get_template(f"{template_prefix}.txt"),
+        html,
+    )
+
+
+def render_message(templates, email, recipient_context=None, context=None):
+    subject, text, html = templates
+    context = {**(context or {}), **(recipient_context or {}), "email": email}
+    message = EmailMultiAlternatives(
+        subject=" ".join(subject.render(context).split()),
+        body=text.render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email],
+    )
+    if html is not None:
+        message.attach_alternative(html.render(context), "text/html")
+    return message
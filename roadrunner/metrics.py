@@ -0,0 +1,334 @@
+"""
+Per-request performance instrumentation.
+
+``RequestMetricsMiddleware`` measures for every request the number of SQL
+queries and the time spent in the database, in serializers, in the cache and
+in the remaining view code. Timings are exclusive, a query run while a
+serializer is rendering counts as database time only, and what is left of the
+total was spent in middleware and URL routing. Every request then
+
+- gets a ``Server-Timing`` response header, visible in the browser devtools,
+- may be logged as one JSON line on the ``roadrunner.metrics`` logger,
+  sampled with ``PERFORMANCE_LOG_SAMPLE_RATE`` and always when slower than
+  ``PERFORMANCE_SLOW_REQUEST_MS``,
+- is added to an in-process store aggregated per URL route name, readable
+  by staff at ``/api/metrics/``.
+
+Serializers and cache backends are instrumented by wrapping their methods
+once when the middleware is loaded.
+"""
+
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from rest_framework import serializers
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger("roadrunner.metrics")
+
+CATEGORIES = ("db", "serializer", "cache", "view")
+
+CACHE_METHODS = (
+    "get",
+    "get_many",
+    "set",
+    "set_many",
+    "add",
+    "delete",
+    "delete_many",
+    "incr",
+    "decr",
+    "touch",
+    "has_key",
+    "clear",
+)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Timings of one request, in seconds
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.durations = dict.fromkeys(CATEGORIES, 0.0)
+        self.total = 0.0
+        self._children = [0.0]
+        self._view_start = None
+
+    def start_view(self):
+        self._view_start = time.perf_counter()
+        self._before_view = sum(self.durations.values())
+
+    def end_view(self):
+        """
+        Account the view phase, minus what was already timed inside it
+        """
+        if self._view_start is None:
+            return
+        elapsed = time.perf_counter() - self._view_start
+        nested = sum(self.durations.values()) - self._before_view
+        self.durations["view"] += max(elapsed - nested, 0.0)
+        self._view_start = None
+
+    @contextmanager
+    def timed(self, category):
+        """
+        Add the time spent in the block, minus the time of nested timed
+        blocks, to a category
+        """
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._children.pop()
+            self.durations[category] += elapsed - nested
+            self._children[-1] += elapsed
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "total_ms": round(self.total * 1000, 2),
+            **{
+                f"{category}_ms": round(duration * 1000, 2)
+                for category, duration in self.durations.items()
+            },
+        }
+
+    def server_timing(self):
+        entries = [
+            f'db;dur={self.durations["db"] * 1000:.1f};desc="{self.queries} queries"'
+        ]
+        entries += [
+            f"{category};dur={self.durations[category] * 1000:.1f}"
+            for category in CATEGORIES[1:]
+        ]
+        entries.append(f"total;dur={self.total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def timed(category):
+    """
+    Time a block for the current request, a no-op outside of requests
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.timed(category):
+        yield
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    metrics.queries += 1
+    with metrics.timed("db"):
+        return execute(sql, params, many, context)
+
+
+def _timed_method(method, category):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with timed(category):
+            return method(*args, **kwargs)
+
+    wrapper._metrics_category = category
+    return wrapper
+
+
+def _timed_property(prop, category):
+    return property(_timed_method(prop.fget, category), prop.fset, prop.fdel)
+
+
+def _instrument(cls, name, category):
+    attr = cls.__dict__.get(name)
+    if attr is None:
+        return
+    if isinstance(attr, property):
+        if not getattr(attr.fget, "_metrics_category", None):
+            setattr(cls, name, _timed_property(attr, category))
+    elif not getattr(attr, "_metrics_category", None):
+        setattr(cls, name, _timed_method(attr, category))
+
+
+def install():
+    """
+    Wrap serializer rendering and the configured cache backends
+    """
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        _instrument(cls, "data", "serializer")
+
+    for alias in settings.CACHES:
+        for cls in type(caches[alias]).__mro__:
+            for name in CACHE_METHODS:
+                _instrument(cls, name, "cache")
+
+
+class RouteStats:
+    """
+    Aggregated metrics of every request of one route
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.queries = 0
+        self.durations = dict.fromkeys(("total", *CATEGORIES), 0.0)
+        self.max_total = 0.0
+
+    def add(self, metrics):
+        self.count += 1
+        self.queries += metrics.queries
+        self.durations["total"] += metrics.total
+        for category in CATEGORIES:
+            self.durations[category] += metrics.durations[category]
+        self.max_total = max(self.max_total, metrics.total)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg_queries": round(self.queries / self.count, 2),
+            **{
+                f"avg_{name}_ms": round(duration / self.count * 1000, 2)
+                for name, duration in self.durations.items()
+            },
+            "max_total_ms": round(self.max_total * 1000, 2),
+        }
+
+
+class MetricsStore:
+    """
+    Thread-safe per-route aggregates of the current process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def add(self, route, metrics):
+        with self.lock:
+            self.routes.setdefault(route, RouteStats()).add(metrics)
+
+    def snapshot(self):
+        with self.lock:
+            return {route: stats.as_dict() for route, stats in self.routes.items()}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+store = MetricsStore()
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match.route
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request, see the module docstring. Runs in both sync and
+    async middleware chains, so async views such as event streams are served
+    without being adapted to a worker thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "PERFORMANCE_SERVER_TIMING", True)
+        self.sample_rate = getattr(settings, "PERFORMANCE_LOG_SAMPLE_RATE", 0.01)
+        self.slow_request = getattr(settings, "PERFORMANCE_SLOW_REQUEST_MS", 500) / 1000
+        install()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure() as metrics:
+            response = self.get_response(request)
+        self.record(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        with self.measure() as metrics:
+            response = await self.get_response(request)
+        self.record(request, response, metrics)
+        return response
+
+    @contextmanager
+    def measure(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_query_wrapper))
+                yield metrics
+                metrics.end_view()
+        finally:
+            _current.reset(token)
+        metrics.total = time.perf_counter() - start
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.start_view()
+
+    def record(self, request, response, metrics):
+        route = route_name(request)
+        store.add(route, metrics)
+
+        if self.server_timing:
+            response["Server-Timing"] = metrics.server_timing()
+
+        if metrics.total >= self.slow_request or random.random() < self.sample_rate:
+            logger.info(
+                json.dumps(
+                    {
+                        "route": route,
+                        "method": request.method,
+                        "status": response.status_code,
+                        **metrics.as_dict(),
+                    }
+                )
+            )
+
+
+class MetricsView(APIView):
+    """
+    Aggregated request metrics of this process per route
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(store.snapshot())
+
+    def delete(self, request):
+        store.reset()
+        return Response(status=204)
@@ -0,0 +1,64 @@
+"""
+Model base shared by the apps.
+
+``TrackedModel`` remembers the values an instance was loaded with in
+``_loaded_values``, so the signal receivers can tell what changed on save,
+and keeps saves of loaded instances from writing ``PROTECTED_FIELDS``.
+"""
+
+from django.db import models
+
+
+class TrackedModel(models.Model):
+    # Fields a full save of a loaded instance leaves alone, e.g. counters only
+    # written with database-side expressions, which the instance may hold
+    # stale values of
+    PROTECTED_FIELDS = frozenset()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the loaded values so changes can be detected on save
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """
+        Remember the reloaded values as well
+        """
+        super().refresh_from_db(using, fields, from_queryset)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            **getattr(self, "_loaded_values", {}),
+            **{
+                field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if field.attname not in deferred
+                and (fields is None or field.attname in fields or field.name in fields)
+            },
+        }
+
+    def save(self, *args, **kwargs):
+        """
+        Save every loaded field but the protected ones, unless the caller
+        chose the fields with ``update_fields``
+        """
+        if (
+            self.PROTECTED_FIELDS
+            and not self._state.adding
+            and kwargs.get("update_fields") is None
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.PROTECTED_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,61 @@
+"""
+Sparse fieldsets for API responses.
+
+``?fields=id,name`` limits a response to the named fields, and
+``?expand=documents`` adds the relations a serializer only renders on
+demand, declared in ``Meta.expandable_fields`` as a mapping of field names to
+callables returning the field. Only the serializer of the response itself
+is affected, nested serializers keep all their fields, and write-only fields
+are always kept so that input is still validated.
+"""
+
+from rest_framework import serializers
+
+
+def query_list(request, param):
+    """
+    Names in a comma separated query parameter, None when it is missing
+    """
+    if request is None:
+        return None
+    value = getattr(request, "query_params", request.GET).get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def requested_fields(request):
+    """
+    Names of the fields and expanded relations a response should render, None
+    for all of them
+    """
+    fields = query_list(request, "fields")
+    if fields is None:
+        return None
+    return fields | (query_list(request, "expand") or set())
+
+
+class SparseFieldsetMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_root():
+            return fields
+
+        request = self.context.get("request")
+        expand = query_list(request, "expand") or set()
+        for name, field in getattr(self.Meta, "expandable_fields", {}).items():
+            if name in expand:
+                fields[name] = field()
+
+        requested = requested_fields(request)
+        if requested is not None:
+            for name in list(fields):
+                if name not in requested and not fields[name].write_only:
+                    del fields[name]
+        return fields
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
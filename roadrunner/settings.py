@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "roadrunner.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,9 +61,6 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'map.middleware.AuthenticationMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
 ]
 
 INSTALLED_APPS += ['corsheaders']
@@ -126,15 +124,19 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
-# Ensure sessions use the database and persist correctly
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Sessions are read from the cache and written through to the database, only
+# when they change or have less than SESSION_REFRESH_THRESHOLD seconds left,
+# see map.middleware. 'django.contrib.sessions.backends.signed_cookies' works
+# as well and needs no storage at all
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 SESSION_COOKIE_AGE = 3600  # Sessions expire in 1 hour
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_THRESHOLD = 15 * 60
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'roadrunner.auth.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -160,8 +162,14 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    'TOKEN_REFRESH_SERIALIZER': 'roadrunner.auth.TokenRefreshSerializer',
 }
 
+# Verified token claims kept per process, and seconds an authenticated user
+# is cached, see roadrunner.auth
+AUTH_TOKEN_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -187,6 +195,16 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 CELERY_BROKER_URL = "redis://127.0.0.1:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "purge-expired-sessions": {
+        "task": "user.tasks.purge_expired_sessions",
+        "schedule": 60 * 60,
+    },
+    "prune-expired-tokens": {
+        "task": "user.tasks.prune_expired_tokens",
+        "schedule": 24 * 60 * 60,
+    },
+}
 
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
@@ -196,6 +214,17 @@ EMAIL_HOST_USER = "EMAIL"  # Replace with your email address
 EMAIL_HOST_PASSWORD = "APP_PASSWORD"  # Replace with your email password
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+TWILIO_ACCOUNT_SID = "ACCOUNT_SID"  # Replace with your Twilio account
+TWILIO_AUTH_TOKEN = "AUTH_TOKEN"
+TWILIO_PHONE_NUMBER = "PHONE_NUMBER"
+
+# SMS dispatch, see roadrunner.sms. The rate limit in messages per second is
+# shared by all workers, keep it under the provider's limit
+SMS_PROVIDER = {"BACKEND": "roadrunner.sms.TwilioProvider"}
+SMS_RATE_LIMIT = 10
+SMS_BURST = 20
+SMS_DEDUPE_TIMEOUT = 5 * 60
+
 SWAGGER_SETTINGS = {
     "SECURITY_DEFINITIONS": {
         "Bearer": {"type": "apiKey", "name": "Authorization", "in": "header"}
@@ -217,3 +246,39 @@ CACHES = {
         "LOCATION": "redis://127.0.0.1:6379/1",
     }
 }
+
+# Notifications about one place are merged while younger than the window, in
+# seconds. A digest period aligns the windows instead, e.g. 86400 for one
+# notification per place and day. See user.notifications
+NOTIFICATION_COALESCE_WINDOW = 15 * 60
+NOTIFICATION_DIGEST_PERIOD = None
+
+# Pushes notifications to /api/notifications/stream/, see
+# roadrunner.channel_layers. Notifications are published by Celery workers,
+# so they need Redis to reach the web processes. InMemoryChannelLayer does for
+# a single process running its tasks eagerly
+NOTIFICATION_CHANNEL_LAYER = {
+    "BACKEND": "roadrunner.channel_layers.RedisChannelLayer",
+    "OPTIONS": {"url": "redis://127.0.0.1:6379/2"},
+}
+NOTIFICATION_STREAM_KEEPALIVE = 15
+
+# Request instrumentation, see roadrunner.metrics
+PERFORMANCE_SERVER_TIMING = True
+PERFORMANCE_LOG_SAMPLE_RATE = 0.01
+PERFORMANCE_SLOW_REQUEST_MS = 500
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "roadrunner.metrics": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
@@ -0,0 +1,218 @@
+"""
+Rate-limited SMS dispatch.
+
+Messages go through an ``SMSProvider`` configured with ``SMS_PROVIDER``,
+instantiated once per process so that e.g. the Twilio client and its HTTP
+connections are reused by every task of a worker. ``FakeSMSProvider`` keeps
+messages in memory for tests and benchmarks.
+
+``SMSDispatcher`` sends messages in batches:
+
+- identical messages (same number and text) sent within
+  ``SMS_DEDUPE_TIMEOUT`` seconds are dropped, using ``cache.add`` as a
+  cross-worker lock,
+- every batch takes its tokens from a ``TokenBucket`` kept in the cache and
+  shared by all workers, refilled at ``SMS_RATE_LIMIT`` messages per second
+  up to ``SMS_BURST``. Messages without tokens are deferred instead of being
+  sent into the provider's throttling.
+"""
+
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = {"BACKEND": "roadrunner.sms.TwilioProvider"}
+DEFAULT_BATCH_SIZE = 50
+# Longest a batch waits for tokens before its messages are deferred to a
+# later task
+MAX_WAIT = 5.0
+
+
+class SMSError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SMSProvider:
+    def send(self, to, body):
+        """
+        Send one message, returns the provider's message id
+        """
+        raise NotImplementedError
+
+
+class TwilioProvider(SMSProvider):
+    def __init__(self, account_sid=None, auth_token=None, from_number=None):
+        self.account_sid = account_sid or settings.TWILIO_ACCOUNT_SID
+        self.auth_token = auth_token or settings.TWILIO_AUTH_TOKEN
+        self.from_number = from_number or settings.TWILIO_PHONE_NUMBER
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from twilio.rest import Client
+
+            self._client = Client(self.account_sid, self.auth_token)
+        return self._client
+
+    def send(self, to, body):
+        from twilio.base.exceptions import TwilioException, TwilioRestException
+
+        try:
+            message = self.client.messages.create(
+                body=body, from_=self.from_number, to=to
+            )
+        except TwilioRestException as error:
+            # Throttling and server errors are worth retrying, invalid
+            # numbers and the like are not
+            raise SMSError(
+                str(error), retryable=error.status == 429 or error.status >= 500
+            )
+        except TwilioException as error:
+            raise SMSError(str(error))
+        return message.sid
+
+
+class FakeSMSProvider(SMSProvider):
+    """
+    Keeps sent messages in ``outbox``, numbers in ``failing`` fail
+    """
+
+    def __init__(self, failing=()):
+        self.outbox = []
+        self.failing = set(failing)
+
+    def send(self, to, body):
+        if to in self.failing:
+            raise SMSError(f"Delivery to {to} failed")
+        self.outbox.append((to, body))
+        return f"fake-{len(self.outbox)}"
+
+
+@lru_cache(maxsize=None)
+def get_provider():
+    config = getattr(settings, "SMS_PROVIDER", DEFAULT_PROVIDER)
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every process using the same cache.
+
+    The bucket is stored as its creation time and the number of tokens
+    consumed since, so taking tokens is one atomic ``incr``. Tokens that
+    would overflow the capacity while the bucket is idle are consumed
+    without being used.
+    """
+
+    def __init__(self, name, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.start_key = f"token-bucket:{name}:start"
+        self.consumed_key = f"token-bucket:{name}:consumed"
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, returns 0 or the seconds to wait until they are available
+        """
+        now = time.time()
+        cache.add(self.start_key, now, None)
+        cache.add(self.consumed_key, 0, None)
+        start = cache.get(self.start_key, now)
+        available = self.capacity + int((now - start) * self.rate)
+
+        consumed = cache.incr(self.consumed_key, tokens)
+        overflow = available - (consumed - tokens) - self.capacity
+        if overflow > 0:
+            consumed = cache.incr(self.consumed_key, overflow)
+        if consumed <= available:
+            return 0
+        cache.decr(self.consumed_key, tokens)
+        return (consumed - available) / self.rate
+
+
+def dedupe_key(to, body):
+    digest = hashlib.sha256(f"{to}\n{body}".encode()).hexdigest()
+    return f"sms:sent:{digest}"
+
+
+@dataclass
+class DispatchResult:
+    sent: int = 0
+    duplicates: int = 0
+    # Messages to send again later, with the delay before doing so
+    deferred: list = field(default_factory=list)
+    retry_after: float = 0
+    # Messages that failed with a retryable error
+    failed: list = field(default_factory=list)
+
+
+class SMSDispatcher:
+    def __init__(self, provider=None, bucket=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.provider = provider or get_provider()
+        self.bucket = bucket or TokenBucket(
+            "sms",
+            rate=getattr(settings, "SMS_RATE_LIMIT", 10),
+            capacity=getattr(settings, "SMS_BURST", 20),
+        )
+        # A batch never needs more tokens than the bucket holds
+        self.batch_size = min(batch_size, self.bucket.capacity)
+        self.dedupe_timeout = getattr(settings, "SMS_DEDUPE_TIMEOUT", 300)
+
+    def dispatch(self, messages):
+        """
+        Send ``(to, body)`` pairs, returns a DispatchResult
+        """
+        result = DispatchResult()
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start : start + self.batch_size]
+            if result.deferred:
+                result.deferred += batch
+                continue
+            self.send_batch(batch, result)
+        return result
+
+    def send_batch(self, batch, result):
+        unique = []
+        for to, body in batch:
+            if cache.add(dedupe_key(to, body), True, self.dedupe_timeout):
+                unique.append((to, body))
+            else:
+                result.duplicates += 1
+        if not unique:
+            return
+
+        deadline = time.monotonic() + MAX_WAIT
+        wait = self.bucket.acquire(len(unique))
+        while wait and time.monotonic() + wait <= deadline:
+            time.sleep(wait)
+            wait = self.bucket.acquire(len(unique))
+        if wait:
+            self.release(unique)
+            result.deferred += unique
+            result.retry_after = wait
+            return
+
+        for to, body in unique:
+            try:
+                self.provider.send(to, body)
+            except SMSError as error:
+                logger.warning("Sending SMS to %s failed: %s", to, error)
+                cache.delete(dedupe_key(to, body))
+                if error.retryable:
+                    result.failed.append((to, body))
+            else:
+                result.sent += 1
+
+    def release(self, messages):
+        cache.delete_many([dedupe_key(to, body) for to, body in messages])
@@ -20,6 +20,7 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from roadrunner.metrics import MetricsView
 from roadrunner.swagger import schema_view
 
 urlpatterns = [
@@ -28,6 +29,7 @@ urlpatterns = [
     path("api/", include("user.urls")),
     path("api/", include("luggage.urls")),
     path("api/", include("city.urls")),
+    path("api/metrics/", MetricsView.as_view(), name="request-metrics"),
     path("", include("map.urls")),
     path(
         "swagger/",
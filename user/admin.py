@@ -3,6 +3,8 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from .models import User, Notification
+from .notifications import invalidate
+from roadrunner.images import variant_url
 
 
 @admin.register(User)
@@ -45,26 +47,30 @@ class UserAdmin(BaseUserAdmin):
 
     def display_photo(self, obj):
         if obj.profile_photo:
-            return format_html('<img src="{}" height="50"/>', obj.profile_photo.url)
+            return format_html('<img src="{}" height="50"/>',
+                               variant_url(obj.profile_photo, obj.profile_photo_variants))
         return "No photo"
 
     display_photo.short_description = 'Profile Photo'
 
     def display_photo_large(self, obj):
         if obj.profile_photo:
-            return format_html('<img src="{}" height="200"/>', obj.profile_photo.url)
+            return format_html('<img src="{}" height="200"/>',
+                               variant_url(obj.profile_photo, obj.profile_photo_variants,
+                                           'large'))
         return "No photo"
 
     display_photo_large.short_description = 'Profile Photo Preview'
 
 
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('recipient', 'sender', 'message_preview', 'is_read', 'created_at')
+    list_display = ('recipient', 'sender', 'message_preview', 'event_count', 'is_read',
+                    'created_at')
     list_filter = ('is_read', 'created_at')
     search_fields = ('recipient__username', 'recipient__email',
                      'sender__username', 'sender__email', 'message')
-    raw_id_fields = ('recipient', 'sender')
-    readonly_fields = ('created_at',)
+    raw_id_fields = ('recipient', 'sender', 'place')
+    readonly_fields = ('created_at', 'event_count')
     actions = ['mark_as_read', 'mark_as_unread']
 
     def message_preview(self, obj):
@@ -73,18 +79,22 @@ class NotificationAdmin(admin.ModelAdmin):
     message_preview.short_description = 'Message Preview'
 
     def mark_as_read(self, request, queryset):
+        recipients = set(queryset.values_list('recipient_id', flat=True))
         queryset.update(is_read=True)
+        invalidate(recipients)
 
     mark_as_read.short_description = "Mark selected notifications as read"
 
     def mark_as_unread(self, request, queryset):
+        recipients = set(queryset.values_list('recipient_id', flat=True))
         queryset.update(is_read=False)
+        invalidate(recipients)
 
     mark_as_unread.short_description = "Mark selected notifications as unread"
 
     fieldsets = (
         ('Notification Details', {
-            'fields': ('recipient', 'sender', 'message', 'is_read')
+            'fields': ('recipient', 'sender', 'place', 'message', 'event_count', 'is_read')
         }),
         ('Metadata', {
             'fields': ('created_at',),
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0004_remove_notification_recipients_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="profile_photo_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0005_user_profile_photo_variants"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["recipient", "is_read", "created_at"], name="notification_inbox"
+            ),
+        ),
+    ]
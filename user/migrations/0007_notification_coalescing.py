@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("city", "0012_place_photo_variants"),
+        ("user", "0006_notification_notification_inbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="event_count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="place",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notifications",
+                to="city.place",
+            ),
+        ),
+    ]
@@ -3,9 +3,10 @@ from django.core.validators import FileExtensionValidator
 from django.db import models
 
 from city.models import City
+from roadrunner.models import TrackedModel
 
 
-class User(AbstractUser):
+class User(AbstractUser, TrackedModel):
     email = models.EmailField(unique=True)
     username = models.CharField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -16,8 +17,13 @@ class User(AbstractUser):
         blank=True,
         validators=[FileExtensionValidator(["jpg", "jpeg", "png", "gif"])],
     )
+    # Resized copies of the profile photo, see roadrunner.images
+    profile_photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     cities = models.ManyToManyField(City, blank=True)
 
+    # Written by the background task, a stale instance never overwrites them
+    PROTECTED_FIELDS = {"profile_photo_variants"}
+
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
@@ -30,6 +36,24 @@ class Notification(models.Model):
         User, on_delete=models.CASCADE, related_name="notifications"
     )
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Place the notification is about, events of one place are coalesced
+    place = models.ForeignKey(
+        "city.Place",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="notifications",
+    )
     message = models.TextField()
+    event_count = models.PositiveIntegerField(default=1)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Serves the inbox pages and the unread counts of a recipient
+            models.Index(
+                fields=["recipient", "is_read", "created_at"],
+                name="notification_inbox",
+            ),
+        ]
@@ -0,0 +1,204 @@
+"""
+Coalescing of notifications and cached unread notification counts.
+
+Events about the same place are merged per recipient: while an unread
+notification about a place is open, i.e. its latest event is younger than
+``NOTIFICATION_COALESCE_WINDOW`` seconds, further events update its
+``event_count``, message and ``created_at`` instead of adding rows, so it
+moves back to the top of the inbox. With
+``NOTIFICATION_DIGEST_PERIOD`` set, windows are instead aligned to fixed
+periods (e.g. 86400 for daily digests), so every recipient gets at most one
+notification per place and period.
+
+The count of every user is kept in the cache under ``UNREAD_COUNT_KEY`` so
+clients can poll their badge without touching the notification table. A
+missing count is computed once from the ``(recipient, is_read, created_at)``
+index. Single notifications and mark-read calls adjust a cached count in
+place, bulk writes drop the counts of their recipients, both once the
+change is committed so a rolled back write leaves the counts alone.
+
+New and updated notifications and mark-read calls are also published to the
+``notifications.<user id>`` group of the channel layer once committed, from
+where NotificationStreamView pushes them to connected clients.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat, Greatest
+
+from roadrunner.channel_layers import get_channel_layer
+from user.models import Notification
+from user.serializers import NotificationSerializer
+
+UNREAD_COUNT_KEY = "notifications:unread:{}"
+UNREAD_COUNT_TIMEOUT = 24 * 60 * 60
+
+STREAM_GROUP = "notifications.{}"
+
+COALESCE_BATCH_SIZE = 1000
+
+
+def _key(user_id):
+    return UNREAD_COUNT_KEY.format(user_id)
+
+
+def unread_count(user_id):
+    count = cache.get(_key(user_id))
+    if count is None or count < 0:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.set(_key(user_id), count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def adjust(user_id, delta):
+    """
+    Change a cached count, a missing one is left to be computed on demand
+    """
+    try:
+        cache.incr(_key(user_id), delta)
+    except ValueError:
+        pass
+
+
+def invalidate(user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def stream_group(user_id):
+    return STREAM_GROUP.format(user_id)
+
+
+def publish_notifications(ids):
+    """
+    Push notifications to their recipients' streams
+    """
+    layer = get_channel_layer()
+    rows = Notification.objects.filter(id__in=ids).select_related("sender")
+    for notification in rows:
+        layer.publish(
+            stream_group(notification.recipient_id),
+            {
+                "type": "notification",
+                "notification": NotificationSerializer(notification).data,
+            },
+        )
+
+
+def publish_read(user_id, ids):
+    get_channel_layer().publish(stream_group(user_id), {"type": "read", "ids": ids})
+
+
+def mark_read(user_id, ids=None):
+    """
+    Mark the unread notifications of a user as read with one UPDATE, all of
+    them or only those in ``ids``. Returns the number of marked ones.
+    """
+    unread = Notification.objects.filter(recipient_id=user_id, is_read=False)
+    if ids is not None:
+        unread = unread.filter(id__in=ids)
+    marked = unread.update(is_read=True)
+    if marked:
+        transaction.on_commit(partial(adjust, user_id, -marked))
+        transaction.on_commit(partial(publish_read, user_id, ids))
+    return marked
+
+
+def notify(recipient_ids, sender_id, message):
+    """
+    Send the same notification to many recipients with one INSERT
+    """
+    with transaction.atomic():
+        new = Notification.objects.bulk_create(
+            Notification(recipient_id=user_id, sender_id=sender_id, message=message)
+            for user_id in recipient_ids
+        )
+        transaction.on_commit(
+            partial(publish_notifications, [notification.id for notification in new])
+        )
+        transaction.on_commit(
+            partial(invalidate, [notification.recipient_id for notification in new])
+        )
+    return len(new)
+
+
+def window_start(occurred_at):
+    """
+    Oldest creation time of a notification an event at ``occurred_at`` is
+    merged into
+    """
+    period = getattr(settings, "NOTIFICATION_DIGEST_PERIOD", None)
+    if period:
+        start = occurred_at.timestamp() // period * period
+        return datetime.fromtimestamp(start, tz=timezone.utc)
+    window = getattr(settings, "NOTIFICATION_COALESCE_WINDOW", 15 * 60)
+    return occurred_at - timedelta(seconds=window)
+
+
+def _digest_message(template):
+    """
+    Expression formatting ``template`` with the incremented event count
+    """
+    before, _, after = template.partition("{count}")
+    count = Cast(F("event_count") + 1, output_field=CharField())
+    return Concat(Value(before), count, Value(after), output_field=CharField())
+
+
+def notify_place_event(
+    recipient_ids, sender_id, place_id, message, digest_message, occurred_at
+):
+    """
+    Notify recipients about an event of a place, merging it into their open
+    notifications about that place.
+
+    New notifications get ``message``, merged ones ``digest_message`` where
+    ``{count}`` is replaced by their event count. Recipients are handled in
+    batches of ``COALESCE_BATCH_SIZE``, each costing one SELECT, at most one
+    UPDATE and one INSERT. Returns the numbers of created and merged
+    notifications.
+    """
+    since = window_start(occurred_at)
+    created = merged = 0
+    recipient_ids = iter(recipient_ids)
+    while batch := list(islice(recipient_ids, COALESCE_BATCH_SIZE)):
+        open_ids = dict(
+            Notification.objects.filter(
+                recipient_id__in=batch,
+                place_id=place_id,
+                is_read=False,
+                created_at__gte=since,
+            )
+            .order_by("id")
+            .values_list("recipient_id", "id")
+        )
+        new_ids = [user_id for user_id in batch if user_id not in open_ids]
+
+        with transaction.atomic():
+            if open_ids:
+                merged += Notification.objects.filter(id__in=open_ids.values()).update(
+                    message=_digest_message(digest_message),
+                    event_count=F("event_count") + 1,
+                    sender_id=sender_id,
+                    created_at=Greatest("created_at", Value(occurred_at)),
+                )
+            new = Notification.objects.bulk_create(
+                Notification(
+                    recipient_id=user_id,
+                    sender_id=sender_id,
+                    place_id=place_id,
+                    message=message,
+                )
+                for user_id in new_ids
+            )
+            changed = [*open_ids.values(), *(notification.id for notification in new)]
+            transaction.on_commit(partial(publish_notifications, changed))
+            # bulk_create sends no signals, the unread counts are recomputed on
+            # demand
+            transaction.on_commit(partial(invalidate, new_ids))
+        created += len(new_ids)
+    return created, merged
@@ -2,6 +2,9 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 
+from roadrunner.images import ImageVariantsField
+from user.models import Notification
+
 User = get_user_model()
 
 
@@ -46,6 +49,44 @@ class UserLoginSerializer(serializers.Serializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    profile_photo_variants = ImageVariantsField()
+
     class Meta:
         model = User
-        fields = ["id", "username", "email", "created_at", "status", "profile_photo"]
+        fields = [
+            "id",
+            "username",
+            "email",
+            "created_at",
+            "status",
+            "profile_photo",
+            "profile_photo_variants",
+        ]
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    sender_username = serializers.CharField(source="sender.username", read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = [
+            "id",
+            "sender",
+            "sender_username",
+            "place",
+            "message",
+            "event_count",
+            "is_read",
+            "created_at",
+        ]
+        read_only_fields = fields
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    """
+    Ids of the notifications to mark as read, all unread ones when omitted
+    """
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=1000
+    )
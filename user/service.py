@@ -1,4 +1,7 @@
 from django.core.exceptions import ValidationError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
 
 
 class UserUpdateService:
@@ -37,3 +40,27 @@ class UserUpdateService:
             return True, None
         except ValidationError as e:
             return False, {"detail": e.message_dict}
+
+
+class UserLoginService:
+    """Service class to authenticate users and issue their JWT tokens"""
+
+    def authenticate(self, identifier, password):
+        """
+        Find a user by email or username and check the password
+
+        Returns:
+            The user, or None for invalid credentials
+        """
+        lookup = (
+            {"email": identifier} if "@" in identifier else {"username": identifier}
+        )
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            return None
+        return user if user.check_password(password) else None
+
+    def get_tokens(self, user):
+        refresh = RefreshToken.for_user(user)
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
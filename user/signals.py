@@ -0,0 +1,85 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from roadrunner import auth, images
+from user import notifications
+from user.models import Notification, User
+from user.tasks import generate_profile_photo_variants
+
+
+@receiver(post_save, sender=User)
+def refresh_profile_photo_variants(sender, instance, raw=False, **kwargs):
+    """
+    Queue the variants of a new or replaced profile photo
+    """
+    if not raw:
+        images.image_saved(
+            instance,
+            "profile_photo",
+            "profile_photo_variants",
+            generate_profile_photo_variants,
+        )
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the user snapshot of CachedJWTAuthentication
+    """
+    auth.invalidate_user(instance.pk)
+
+
+@receiver(images.variants_stored, sender=User)
+def invalidate_user_with_new_variants(sender, instance, **kwargs):
+    """
+    Drop the user snapshot once the profile photo variants are stored, they
+    are written without saving the user
+    """
+    auth.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklisted_user(sender, instance, created, **kwargs):
+    """
+    Drop the user snapshot when a refresh token is blacklisted, on logout or
+    rotation
+    """
+    if created:
+        auth.invalidate_user(instance.token.user_id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def cache_revoked_token(sender, instance, created, **kwargs):
+    if created:
+        auth.mark_revoked(instance.token.jti, instance.token.expires_at)
+
+
+@receiver(post_delete, sender=User)
+def delete_profile_photo_variants(sender, instance, **kwargs):
+    """
+    Remove the variants of a deleted user's photo
+    """
+    images.delete_variants(instance.profile_photo_variants)
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, raw=False, **kwargs):
+    """
+    Count a new unread notification in the recipient's cached unread count
+    and push it to their stream
+    """
+    if created and not raw and not instance.is_read:
+        transaction.on_commit(partial(notifications.adjust, instance.recipient_id, 1))
+        transaction.on_commit(
+            lambda: notifications.publish_notifications([instance.id])
+        )
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        transaction.on_commit(partial(notifications.adjust, instance.recipient_id, -1))
@@ -0,0 +1,54 @@
+from celery import shared_task
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from roadrunner.images import refresh_variants
+from user.models import User
+
+SESSION_PURGE_BATCH_SIZE = 1000
+TOKEN_PRUNE_BATCH_SIZE = 1000
+
+
+@shared_task(name="user.tasks.generate_profile_photo_variants")
+def generate_profile_photo_variants(user_id):
+    """
+    Generate the thumbnail and WebP variants of a profile photo
+    """
+    user = (
+        User.objects.filter(id=user_id)
+        .only("id", "profile_photo", "profile_photo_variants")
+        .first()
+    )
+    if user is not None:
+        refresh_variants(user, "profile_photo", "profile_photo_variants")
+
+
+@shared_task(name="user.tasks.purge_expired_sessions")
+def purge_expired_sessions(batch_size=SESSION_PURGE_BATCH_SIZE):
+    """
+    Delete expired sessions in batches, returns the number deleted
+    """
+    expired = Session.objects.filter(expire_date__lt=timezone.now())
+    deleted = 0
+    while True:
+        keys = list(expired.values_list("session_key", flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+
+
+@shared_task(name="user.tasks.prune_expired_tokens")
+def prune_expired_tokens(batch_size=TOKEN_PRUNE_BATCH_SIZE):
+    """
+    Delete expired outstanding tokens, and their blacklist entries, in
+    batches. Returns the number of outstanding tokens deleted.
+    """
+    expired = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+    deleted = 0
+    while True:
+        ids = list(expired.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
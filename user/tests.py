@@ -1,3 +1,292 @@
-from django.test import TestCase
+import io
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.views import TokenRefreshView
+
+from city.models import City, Location, Place
+from roadrunner import auth
+from roadrunner.auth import RefreshToken
+from roadrunner.channel_layers import get_channel_layer
+from user import notifications
+from user.models import Notification, User
+from user.tasks import generate_profile_photo_variants, prune_expired_tokens
+from user.views import UserLogoutView, UserProfileView
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TokenRevocationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+
+    def refresh(self, token):
+        request = APIRequestFactory().post("/", {"refresh": token}, format="json")
+        with CaptureQueriesContext(connection) as context:
+            response = TokenRefreshView.as_view()(request)
+        blacklist_queries = [
+            query["sql"]
+            for query in context
+            if "SELECT" in query["sql"] and "blacklistedtoken" in query["sql"]
+        ]
+        return response, blacklist_queries
+
+    def test_rotated_token_is_rejected_from_the_cache(self):
+        token = str(RefreshToken.for_user(self.user))
+
+        response, queries = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+
+        response, queries = self.refresh(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(queries, [])
+
+    def test_prune_expired_tokens(self):
+        RefreshToken.for_user(self.user).blacklist()
+        RefreshToken.for_user(self.user).blacklist()
+        live = RefreshToken.for_user(self.user)
+        OutstandingToken.objects.exclude(jti=live["jti"]).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(prune_expired_tokens(batch_size=1), 2)
+        self.assertEqual(
+            list(OutstandingToken.objects.values_list("jti", flat=True)),
+            [live["jti"]],
+        )
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    AUTH_USER_CACHE_TIMEOUT=5 * 60,
+)
+class CachedAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        auth.claims_cache.clear()
+        self.user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        self.refresh_token = RefreshToken.for_user(self.user)
+        self.access_token = str(self.refresh_token.access_token)
+
+    def request(self, method, view, data=None, format=None):
+        request = getattr(APIRequestFactory(), method)(
+            "/",
+            data,
+            format=format,
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}",
+        )
+        return view.as_view()(request)
+
+    def snapshot(self):
+        return cache.get(auth.USER_CACHE_KEY.format(self.user.id))
+
+    def test_warm_requests_do_not_query_for_authentication(self):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        authentication = auth.CachedJWTAuthentication()
+        self.assertEqual(authentication.authenticate(request)[0], self.user)
+
+        self.assertIsNotNone(auth.claims_cache.get(self.access_token))
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate(request)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token["user_id"], str(self.user.id))
+
+    def test_profile_update_drops_the_snapshot(self):
+        self.request("get", UserProfileView)
+        self.assertIsNotNone(self.snapshot())
+
+        response = self.request(
+            "post", UserProfileView, {"username": "renamed"}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.snapshot())
+        self.assertEqual(
+            self.request("get", UserProfileView).data["username"], "renamed"
+        )
+
+    def test_logout_drops_the_snapshot_and_revokes_the_token(self):
+        self.request("get", UserProfileView)
+        response = self.request(
+            "post",
+            UserLogoutView,
+            {"refresh_token": str(self.refresh_token)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 205)
+        self.assertIsNone(self.snapshot())
+
+        request = APIRequestFactory().post(
+            "/", {"refresh": str(self.refresh_token)}, format="json"
+        )
+        self.assertEqual(TokenRefreshView.as_view()(request).status_code, 401)
+
+    def test_stored_variants_drop_the_snapshot(self):
+        image = io.BytesIO()
+        Image.new("RGB", (400, 300), "teal").save(image, "PNG")
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ):
+            with mock.patch.object(generate_profile_photo_variants, "delay"):
+                self.user.profile_photo = SimpleUploadedFile(
+                    "face.png", image.getvalue(), content_type="image/png"
+                )
+                self.user.save()
+
+            self.request("get", UserProfileView)
+            self.assertEqual(self.snapshot().profile_photo_variants, {})
+
+            generate_profile_photo_variants(self.user.id)
+            self.assertIsNone(self.snapshot())
+            response = self.request("get", UserProfileView)
+        self.assertEqual(
+            sorted(response.data["profile_photo_variants"]),
+            ["large", "large_webp", "thumbnail", "thumbnail_webp"],
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    NOTIFICATION_COALESCE_WINDOW=15 * 60,
+)
+class NotificationTest(TestCase):
+    def setUp(self):
+        self.sender, self.recipient = (
+            User.objects.create_user(
+                username=name, email=f"{name}@example.com", password="password"
+            )
+            for name in ("sender", "recipient")
+        )
+        self.place = Place.objects.create(
+            name="Narikala",
+            city=City.objects.create(name="Tbilisi"),
+            location=Location.objects.resolve(lat=41.69, lng=44.81),
+            price=0,
+        )
+        self.start = timezone.now()
+
+    def notify(self, minutes):
+        occurred_at = self.start + timedelta(minutes=minutes)
+        with self.captureOnCommitCallbacks(execute=True):
+            return notifications.notify_place_event(
+                [self.recipient.id],
+                sender_id=self.sender.id,
+                place_id=self.place.id,
+                message="New comment",
+                digest_message="{count} new comments",
+                occurred_at=occurred_at,
+            )
+
+    def inbox(self):
+        return list(
+            Notification.objects.order_by("id").values_list(
+                "message", "event_count", "created_at"
+            )
+        )
+
+    def test_events_within_the_window_are_merged(self):
+        self.assertEqual(self.notify(0), (1, 0))
+        Notification.objects.update(created_at=self.start)
+        self.assertEqual(self.notify(10), (0, 1))
+        # The window restarts at the latest merged event
+        self.assertEqual(self.notify(24), (0, 1))
+        self.assertEqual(
+            self.inbox(),
+            [("3 new comments", 3, self.start + timedelta(minutes=24))],
+        )
+
+        self.assertEqual(self.notify(40), (1, 0))
+        self.assertEqual(len(self.inbox()), 2)
+
+    def test_read_notifications_are_not_merged(self):
+        self.notify(0)
+        Notification.objects.update(created_at=self.start)
+        notifications.mark_read(self.recipient.id)
+        self.assertEqual(self.notify(1), (1, 0))
+        self.assertEqual(notifications.unread_count(self.recipient.id), 1)
+
+    def test_unread_counts_change_when_the_write_commits(self):
+        self.notify(0)
+        self.assertEqual(notifications.unread_count(self.recipient.id), 1)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            notifications.mark_read(self.recipient.id)
+        self.assertEqual(
+            cache.get(notifications.UNREAD_COUNT_KEY.format(self.recipient.id)), 1
+        )
+        for callback in callbacks:
+            callback()
+        self.assertEqual(notifications.unread_count(self.recipient.id), 0)
+
+        Notification.objects.update(is_read=False)
+        notifications.invalidate([self.recipient.id])
+        self.assertEqual(notifications.unread_count(self.recipient.id), 1)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            notifications.mark_read(self.recipient.id)
+            raise RuntimeError
+        self.assertEqual(notifications.unread_count(self.recipient.id), 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    NOTIFICATION_CHANNEL_LAYER={
+        "BACKEND": "roadrunner.channel_layers.InMemoryChannelLayer"
+    },
+)
+class NotificationStreamTest(TestCase):
+    def setUp(self):
+        get_channel_layer.cache_clear()
+        self.addCleanup(get_channel_layer.cache_clear)
+        user = User.objects.create_user(
+            username="traveler", email="traveler@example.com", password="password"
+        )
+        session = self.client.session
+        session["access_token"] = str(RefreshToken.for_user(user).access_token)
+        session.save()
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def test_middleware_is_async_capable(self):
+        for path in settings.MIDDLEWARE:
+            with self.subTest(path):
+                self.assertTrue(import_string(path).async_capable)
+
+    async def test_stream_sends_the_unread_count(self):
+        response = await self.async_client.get("/api/notifications/stream/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        events = aiter(response.streaming_content)
+        first = await anext(events)
+        await events.aclose()
+        self.assertEqual(
+            first.decode() if isinstance(first, bytes) else first,
+            'event: unread\ndata: {"unread": 0}\n\n',
+        )
+
+    async def test_stream_refuses_requests_without_a_session(self):
+        del self.async_client.cookies[settings.SESSION_COOKIE_NAME]
+        response = await self.async_client.get("/api/notifications/stream/")
+        self.assertEqual(response.status_code, 401)
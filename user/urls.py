@@ -3,6 +3,10 @@ from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import (
     AddCityToUserView,
+    NotificationListView,
+    NotificationMarkReadView,
+    NotificationStreamView,
+    NotificationUnreadCountView,
     UserLoginView,
     UserLogoutView,
     UserProfileView,
@@ -18,4 +22,20 @@ urlpatterns = [
     path("logout/", UserLogoutView.as_view(), name="logout"),
     path("profile/", UserProfileView.as_view(), name="profile"),
     path("cities/add/", AddCityToUserView.as_view(), name="add-city-to-user"),
+    path("notifications/", NotificationListView.as_view(), name="notifications"),
+    path(
+        "notifications/read/",
+        NotificationMarkReadView.as_view(),
+        name="notifications-read",
+    ),
+    path(
+        "notifications/stream/",
+        NotificationStreamView.as_view(),
+        name="notifications-stream",
+    ),
+    path(
+        "notifications/unread-count/",
+        NotificationUnreadCountView.as_view(),
+        name="notifications-unread-count",
+    ),
 ]
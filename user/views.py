@@ -1,23 +1,36 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
+from rest_framework.generics import ListAPIView
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from city.models import City
+from city.pagination import KeysetPagination
 from city.serializers import CitySerializer
+from roadrunner.auth import CachedJWTAuthentication, RefreshToken
+from roadrunner.channel_layers import get_channel_layer
 
-from .models import User
+from . import notifications
+from .models import Notification, User
 from .serializers import (
+    NotificationMarkReadSerializer,
+    NotificationSerializer,
     UserLoginSerializer,
     UserProfileSerializer,
     UserRegistrationSerializer,
 )
-from .service import UserUpdateService
+from .service import UserLoginService, UserUpdateService
 from .validators import PasswordValidator, UniqueFieldValidator
 
 
@@ -53,46 +66,30 @@ class UserRegistrationView(APIView):
 class UserLoginView(APIView):
     permission_classes = [AllowAny]
     serializer_class = UserLoginSerializer
+    login_service = UserLoginService()
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            identifier = serializer.validated_data["identifier"]
-            password = serializer.validated_data["password"]
-
-            try:
-                if "@" in identifier:
-                    user = User.objects.get(email=identifier)
-                else:
-                    user = User.objects.get(username=identifier)
-
-                # Check password
-                if user.check_password(password):
-                    refresh = RefreshToken.for_user(user)
-                    return Response(
-                        {
-                            "tokens": {
-                                "refresh": str(refresh),
-                                "access": str(refresh.access_token),
-                            },
-                            "user": {
-                                "id": user.id,
-                                "username": user.username,
-                                "email": user.email,
-                            },
-                        }
-                    )
-                else:
-                    return Response(
-                        {"error": "Invalid credentials"},
-                        status=status.HTTP_401_UNAUTHORIZED,
-                    )
-
-            except User.DoesNotExist:
+            user = self.login_service.authenticate(
+                serializer.validated_data["identifier"],
+                serializer.validated_data["password"],
+            )
+            if user is None:
                 return Response(
                     {"error": "Invalid credentials"},
                     status=status.HTTP_401_UNAUTHORIZED,
                 )
+            return Response(
+                {
+                    "tokens": self.login_service.get_tokens(user),
+                    "user": {
+                        "id": user.id,
+                        "username": user.username,
+                        "email": user.email,
+                    },
+                }
+            )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -226,3 +223,130 @@ class AddCityToUserView(APIView):
             return Response(
                 {"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND
             )
+
+
+class NotificationListView(ListAPIView):
+    """
+    Notifications of the current user, newest first. ``?is_read=false``
+    lists the unread ones only.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = NotificationSerializer
+    pagination_class = KeysetPagination
+    ordering_fields = ["created_at"]
+    default_ordering = "-created_at"
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(
+            recipient=self.request.user
+        ).select_related("sender")
+        is_read = self.request.query_params.get("is_read", "").lower()
+        if is_read in ("true", "false"):
+            queryset = queryset.filter(is_read=is_read == "true")
+        return queryset.only(
+            "id",
+            "sender__username",
+            "place",
+            "message",
+            "event_count",
+            "is_read",
+            "created_at",
+        )
+
+
+class NotificationMarkReadView(APIView):
+    """
+    Mark notifications of the current user as read in a single UPDATE
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = NotificationMarkReadSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        marked = notifications.mark_read(
+            request.user.id, serializer.validated_data.get("ids")
+        )
+        return Response(
+            {
+                "marked": marked,
+                "unread": notifications.unread_count(request.user.id),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class NotificationUnreadCountView(APIView):
+    """
+    Unread notification count of the current user, served from the cache
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread": notifications.unread_count(request.user.id)})
+
+
+class NotificationStreamView(View):
+    """
+    Server-Sent Events stream of the current user's notifications.
+
+    Sends the unread count on connect, then every new or updated
+    notification followed by the new unread count, and the count again
+    after notifications are marked read. Clients use an EventSource instead
+    of polling. The stream holds its connection open and must be served by
+    an ASGI server, e.g. ``uvicorn roadrunner.asgi:application``.
+    """
+
+    authentication = CachedJWTAuthentication()
+
+    async def get(self, request):
+        user = await sync_to_async(self.authenticate)(request)
+        if user is None:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        response = StreamingHttpResponse(
+            self.events(user.id), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Keep reverse proxies from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def authenticate(self, request):
+        try:
+            result = self.authentication.authenticate(request)
+        except AuthenticationFailed:
+            return None
+        return result[0] if result else None
+
+    async def events(self, user_id):
+        keepalive = getattr(settings, "NOTIFICATION_STREAM_KEEPALIVE", 15)
+        unread_count = sync_to_async(notifications.unread_count)
+
+        subscription = await get_channel_layer().subscribe(
+            notifications.stream_group(user_id)
+        )
+        try:
+            yield self.event("unread", {"unread": await unread_count(user_id)})
+            while True:
+                message = await subscription.receive(timeout=keepalive)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if message["type"] == "notification":
+                    yield self.event("notification", message["notification"])
+                yield self.event("unread", {"unread": await unread_count(user_id)})
+        finally:
+            await subscription.close()
+
+    @staticmethod
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"